@@ -1,7 +1,8 @@
 import logging
+import time
 from flask import Flask
-from flask.ext.sqlalchemy import SQLAlchemy
 
+from application.database import Database
 from config import ActiveConfig
 
 # initialize and configure the flask server
@@ -13,13 +14,38 @@ if not app.debug:
     logging.getLogger('werkzeug').setLevel(logging.WARNING)
 
 # open and intialize or read the database
-db = SQLAlchemy(app)
+db = Database(app)
 
 
-def main():
+def init():
+    """
+    Initializes the application.
+
+    :return: A startup report with the time taken by each step.
+    """
+
+    start = time.perf_counter()
     from application.utils.initializers import init_db, init_admin, init_login, init_app
-    init_app(app)
-    init_db(db)
-    init_admin(app, db)
-    init_login(app)
-    app.run(use_reloader=False)
+    timings = [('imports', time.perf_counter() - start)]
+
+    steps = [('init_app', lambda: init_app(app)), ('init_db', lambda: init_db(db)),
+             ('init_admin', lambda: init_admin(app, db)), ('init_login', lambda: init_login(app))]
+    for name, step in steps:
+        step_start = time.perf_counter()
+        step()
+        timings.append((name, time.perf_counter() - step_start))
+
+    return 'Started in {0:.0f} ms ({1})'.format((time.perf_counter() - start) * 1000,
+                                                ', '.join('{0} {1:.0f} ms'.format(name, seconds * 1000)
+                                                          for name, seconds in timings))
+
+
+def main():
+    from application.utils.jobs import job_runner
+
+    print(' * ' + init())
+    job_runner.start()
+    try:
+        app.run(use_reloader=False)
+    finally:
+        job_runner.stop(ActiveConfig.SERVER_GRACEFUL_TIMEOUT)
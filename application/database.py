@@ -0,0 +1,197 @@
+import os
+import sqlite3
+import threading
+from functools import wraps
+
+from flask.ext.sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.expression import Select
+
+from config import ActiveConfig
+
+
+def sqlite_pragmas(read_only=False):
+    """
+    Gets the pragmas applied to new sqlite connections, as configured in ActiveConfig.
+
+    :param read_only: True for the connections of the read only pool, which keep the journal mode set by the writers.
+
+    :return: A list of (name, value) pairs.
+    """
+
+    pragmas = [('journal_mode', None if read_only else ActiveConfig.SQLITE_JOURNAL_MODE),
+               ('synchronous', ActiveConfig.SQLITE_SYNCHRONOUS),
+               ('busy_timeout', ActiveConfig.SQLITE_BUSY_TIMEOUT),
+               ('cache_size', ActiveConfig.SQLITE_CACHE_SIZE),
+               ('mmap_size', ActiveConfig.SQLITE_MMAP_SIZE),
+               ('temp_store', ActiveConfig.SQLITE_TEMP_STORE),
+               ('query_only', 1 if read_only else None)]
+    return [(name, value) for name, value in pragmas if value is not None]
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas:
+            cursor.execute('PRAGMA {0} = {1}'.format(name, value))
+    finally:
+        cursor.close()
+
+
+def _on_connect(dbapi_connection, connection_record):
+    apply_pragmas(dbapi_connection, sqlite_pragmas())
+
+
+def _on_read_connect(dbapi_connection, connection_record):
+    apply_pragmas(dbapi_connection, sqlite_pragmas(read_only=True))
+
+
+def _reset_schema_version(metadata, connection, **kwargs):
+    connection.execute('PRAGMA user_version = 0')
+
+
+class RoutingSession(SignallingSession):
+    """
+    Session sending its selects to the read only pool in the requests of the views marked by Database.read_only.
+    Other sessions only use the write pool, a transaction reading rows before it writes them stays isolated. Once a
+    transaction writes, everything goes to the write pool until it ends, so it reads its own changes.
+    """
+
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper, clause=None):
+        if self._flushing or not isinstance(clause, Select):
+            self.info['writing'] = True
+        elif self.info.get('read_only') and not self.info.get('writing'):
+            engine = self.db.get_read_engine(self.app)
+            if engine is not None:
+                return engine
+        return SignallingSession.get_bind(self, mapper, clause)
+
+    def has_writes(self):
+        """
+        :return: True if the transaction wrote or has changes waiting to be flushed, its reads may then see data that
+            is not committed.
+        """
+
+        return bool(self.info.get('writing') or self.new or self.dirty or self.deleted)
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _transaction_end(session, transaction):
+    # the session is back to the enclosing transaction, none once the outermost one ended
+    if session.transaction is None:
+        session.info.pop('writing', None)
+
+
+class Database(SQLAlchemy):
+    """
+    Flask-SQLAlchemy extension applying the sqlite tuning from ActiveConfig: pragmas on every new connection, a
+    pooled write engine and an optional read only pool of SQLITE_READ_POOL_SIZE connections.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._read_engines = {}
+        self._read_lock = threading.Lock()
+        SQLAlchemy.__init__(self, *args, **kwargs)
+        event.listen(self.Model.metadata, 'after_drop', _reset_schema_version)
+
+    def create_session(self, options):
+        return RoutingSession(self, **options)
+
+    def apply_driver_hacks(self, app, info, options):
+        SQLAlchemy.apply_driver_hacks(self, app, info, options)
+
+        # sqlite files get a null pool by default, which reconnects and reapplies the pragmas on every checkout
+        if info.drivername == 'sqlite' and info.database not in (None, '', ':memory:') and options.get('pool_size'):
+            options['poolclass'] = QueuePool
+            options.setdefault('connect_args', {})['check_same_thread'] = False
+
+    def get_engine(self, app, bind=None):
+        engine = SQLAlchemy.get_engine(self, app, bind)
+        if engine.dialect.name == 'sqlite':
+            with self._read_lock:
+                if not event.contains(engine, 'connect', _on_connect):
+                    event.listen(engine, 'connect', _on_connect)
+        return engine
+
+    def read_only(self, view):
+        """
+        Decorator for views that never write, used through their 'decorators' list. Their selects go to the read only
+        pool until the end of the request, when the session is removed.
+        """
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            self.session().info['read_only'] = True
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    def get_read_engine(self, app):
+        """
+        Gets the engine of the read only pool.
+
+        :return: The engine or None if the read pool is disabled or the database is not a sqlite file.
+        """
+
+        size = ActiveConfig.SQLITE_READ_POOL_SIZE
+        info = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+        if not size or info.drivername != 'sqlite' or info.database in (None, '', ':memory:'):
+            return None
+
+        path = os.path.join(app.root_path, info.database)
+        with self._read_lock:
+            engine = self._read_engines.get((app, path))
+            if engine is None:
+                uri = 'file:{0}?mode=ro'.format(path)
+                engine = create_engine('sqlite://', poolclass=QueuePool, pool_size=size,
+                                       creator=lambda: sqlite3.connect(uri, uri=True, check_same_thread=False))
+                event.listen(engine, 'connect', _on_read_connect)
+                self._read_engines[(app, path)] = engine
+        return engine
+
+    def get_schema_version(self):
+        """
+        :return: The version stamped by set_schema_version, 0 for a new or dropped database.
+        """
+
+        return self.session.execute('PRAGMA user_version').scalar()
+
+    def set_schema_version(self, version):
+        self.session.execute('PRAGMA user_version = {0:d}'.format(version))
+
+    def add_column(self, table, column):
+        """
+        Adds a column to an existing table unless it is already there.
+
+        :param column: The column definition, starting with its name.
+        """
+
+        name = column.split()[0]
+        if name not in [row[1] for row in self.session.execute('PRAGMA table_info({0})'.format(table))]:
+            self.session.execute('ALTER TABLE {0} ADD COLUMN {1}'.format(table, column))
+
+    def add_index(self, table, name):
+        """
+        Creates an index declared on a model of an existing table unless it is already there.
+        """
+
+        if name not in [row[1] for row in self.session.execute('PRAGMA index_list({0})'.format(table))]:
+            index = [i for i in self.Model.metadata.tables[table].indexes if i.name == name][0]
+            index.create(self.session.connection())
+
+    def dispose_engines(self):
+        """
+        Closes the pooled connections, e.g. before forking.
+        """
+
+        self.session.remove()
+        self.engine.dispose()
+        with self._read_lock:
+            for engine in self._read_engines.values():
+                engine.dispose()
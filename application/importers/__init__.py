@@ -0,0 +1,230 @@
+import logging
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam, text
+
+from application import db, models
+from application.models.folder import ROOT_PATH, path_segment
+from application.utils.favicons import favicon_store
+from application.utils.search import BookmarkSearch
+from application.utils.urls import url_hash
+from config import ActiveConfig
+from .records import FolderRecord
+from . import chrome, favicons, firefox
+
+logger = logging.getLogger(__name__)
+
+SQLITE_HEADER = b'SQLite format 3\x00'
+
+
+class ImportStats(object):
+    """
+    Counters of an import run.
+    """
+
+    def __init__(self):
+        self.folders = 0
+        self.bookmarks = 0
+        self.icons = 0
+        self.skipped = 0
+        self.seconds = 0.0
+
+    @property
+    def rows(self):
+        return self.folders + self.bookmarks
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __repr__(self):
+        return '{0} folders, {1} bookmarks, {2} icons, {3} skipped in {4:.2f}s ({5:.0f} rows/sec)'.format(
+            self.folders, self.bookmarks, self.icons, self.skipped, self.seconds, self.rows_per_second)
+
+
+def read_file(path):
+    """
+    Detects the format of a bookmarks file, Firefox places.sqlite or Chrome Bookmarks JSON, and walks it.
+
+    :return: A generator of FolderRecord and BookmarkRecord items.
+    """
+
+    with open(path, 'rb') as f:
+        header = f.read(len(SQLITE_HEADER))
+
+    if header == SQLITE_HEADER:
+        return firefox.read_places(path)
+    return chrome.read_bookmarks(path)
+
+
+class BookmarkImporter(object):
+    """
+    Inserts the records of a bookmarks file for an user.
+
+    Folders are inserted one by one, as their ids are needed for the paths of their children. Bookmarks are buffered
+    and inserted with one executemany per batch. Everything is written in a single transaction.
+    """
+
+    def __init__(self, user_id, batch_size=None, parent=None, progress=None):
+        """
+        :param user_id: The id of the owner of the imported bookmarks.
+
+        :param batch_size: Number of bookmarks inserted per statement. Defaults to IMPORT_BATCH_SIZE.
+
+        :param parent: Folder to import into. Top level folders and bookmarks are placed in it if given.
+
+        :param progress: Callable receiving the number of rows inserted so far after each batch. An exception it
+            raises aborts the import.
+        """
+
+        self.user_id = user_id
+        self.batch_size = batch_size or ActiveConfig.IMPORT_BATCH_SIZE
+        self.parent = parent
+        self.progress = progress
+
+    def run(self, records):
+        """
+        Imports the records, which must list every folder before its content.
+
+        :return: An ImportStats instance.
+        """
+
+        stats = ImportStats()
+        start = time.time()
+
+        top_level = (self.parent.id, self.parent.full_path) if self.parent else (None, ROOT_PATH)
+        # source key -> (folder id, full path), only folders are kept in memory
+        folders = {}
+        batch = []
+
+        try:
+            for record in records:
+                parent_id, path = folders.get(record.parent_key, top_level)
+
+                if isinstance(record, FolderRecord):
+                    folder_id = self._insert_folder(record, parent_id, path)
+                    folders[record.key] = (folder_id, path + path_segment(folder_id))
+                    stats.folders += 1
+                elif record.url and not record.url.startswith('place:'):
+                    batch.append(self._bookmark_row(record, parent_id, path))
+                    if len(batch) >= self.batch_size:
+                        stats.bookmarks += self._insert_bookmarks(batch)
+                        batch = []
+                        if self.progress is not None:
+                            self.progress(stats.rows)
+                else:
+                    stats.skipped += 1
+
+            stats.bookmarks += self._insert_bookmarks(batch)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        # merge the index segments written by the triggers during a large import
+        if stats.bookmarks >= ActiveConfig.SEARCH_OPTIMIZE_ROWS:
+            BookmarkSearch.optimize()
+
+        stats.seconds = time.time() - start
+        logger.info('Imported %r', stats)
+        return stats
+
+    def _insert_folder(self, record, parent_id, path):
+        result = db.session.execute(models.Folder.__table__.insert(), {
+            'user_id': self.user_id,
+            'parent_id': parent_id,
+            'title': record.title or '',
+            'position': record.position or 0,
+            'path': path,
+            'date_added': record.date_added or datetime.utcnow()
+        })
+        return result.inserted_primary_key[0]
+
+    def _bookmark_row(self, record, folder_id, path):
+        return {
+            'user_id': self.user_id,
+            'folder_id': folder_id,
+            'title': record.title or '',
+            'url': record.url,
+            'url_hash': url_hash(record.url),
+            'position': record.position or 0,
+            'path': path,
+            'date_added': record.date_added or datetime.utcnow()
+        }
+
+    def _insert_bookmarks(self, batch):
+        if batch:
+            db.session.execute(models.Bookmark.__table__.insert(), batch)
+        return len(batch)
+
+
+# bookmarks getting a new icon are logged as updated, the column has no log trigger
+LOG_ICON_CHANGE = text('''
+INSERT INTO changes(user_id, entity, entity_id, op, changed)
+SELECT user_id, 'bookmark', id, 'update', CURRENT_TIMESTAMP FROM bookmarks
+WHERE user_id = :b_user AND url_hash = :b_hash AND IFNULL(icon, '') != :b_icon
+''')
+
+
+def import_icons(path, user_id, batch_size=None):
+    """
+    Stores the favicons of a Firefox favicons.sqlite or Chrome Favicons file and sets them on the bookmarks of an user
+    with the same canonical url. Icons of pages that are not bookmarked are skipped.
+
+    :return: The number of icons set.
+    """
+
+    batch_size = batch_size or ActiveConfig.IMPORT_BATCH_SIZE
+    table = models.Bookmark.__table__
+    set_icon = table.update().where(db.and_(table.c.user_id == bindparam('b_user'),
+                                            table.c.url_hash == bindparam('b_hash'))) \
+        .values(icon=bindparam('b_icon'))
+    wanted = set(row[0] for row in db.session.query(models.Bookmark.url_hash)
+                 .filter(models.Bookmark.user_id == user_id))
+
+    def store(batch):
+        digests = favicon_store.add_many([data for _, data in batch])
+        rows = [{'b_user': user_id, 'b_hash': hashed, 'b_icon': digest}
+                for (hashed, _), digest in zip(batch, digests) if digest]
+        if rows:
+            db.session.execute(LOG_ICON_CHANGE, rows)
+            db.session.execute(set_icon, rows)
+        return len(rows)
+
+    count = 0
+    batch = []
+    try:
+        for url, data in favicons.read_icons(path):
+            hashed = url_hash(url)
+            if hashed in wanted:
+                batch.append((hashed, data))
+                if len(batch) >= batch_size:
+                    count += store(batch)
+                    batch = []
+
+        count += store(batch)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    logger.info('Imported %d icons', count)
+    return count
+
+
+def import_file(path, user_id, batch_size=None, parent=None, icons_path=None, progress=None):
+    """
+    Imports a Firefox places.sqlite or Chrome Bookmarks file for an user.
+
+    :param icons_path: The favicons.sqlite or Favicons file of the same browser profile, to import the icons too.
+
+    :param progress: Callable receiving the number of rows imported so far, see BookmarkImporter.
+
+    :return: An ImportStats instance.
+    """
+
+    stats = BookmarkImporter(user_id, batch_size, parent, progress).run(read_file(path))
+    if icons_path is not None:
+        stats.icons = import_icons(icons_path, user_id, batch_size)
+    return stats
@@ -0,0 +1,34 @@
+import json
+
+from .records import FolderRecord, BookmarkRecord, from_microseconds, WINDOWS_EPOCH
+
+
+def read_bookmarks(path):
+    """
+    Walks the bookmarks of a Chrome 'Bookmarks' JSON file.
+
+    The file is decoded by the json module in one go, the tree itself is then walked depth first with an explicit
+    stack, yielding every folder before its children.
+
+    :return: A generator of FolderRecord and BookmarkRecord items.
+    """
+
+    with open(path, 'rb') as f:
+        roots = json.loads(f.read().decode('utf-8')).get('roots', {})
+
+    # (node, parent key, position), the roots become top level folders
+    top_level = [node for node in roots.values() if isinstance(node, dict)]
+    stack = [(node, None, position) for position, node in reversed(list(enumerate(top_level)))]
+
+    while stack:
+        node, parent_key, position = stack.pop()
+        date_added = from_microseconds(node.get('date_added'), WINDOWS_EPOCH)
+
+        if node.get('type') == 'folder':
+            key = node.get('id') or id(node)
+            yield FolderRecord(key, parent_key, node.get('name'), position, date_added)
+
+            children = node.get('children') or []
+            stack.extend((child, key, index) for index, child in reversed(list(enumerate(children))))
+        elif node.get('type') == 'url':
+            yield BookmarkRecord(parent_key, node.get('name'), node.get('url'), position, date_added)
@@ -0,0 +1,70 @@
+import os
+import sqlite3
+
+try:
+    from urllib.request import pathname2url
+except ImportError:
+    from urllib import pathname2url
+
+
+# the icon closest to 32 pixels of every page, larger ones first on ties
+FIREFOX_QUERY = '''
+SELECT p.page_url, i.data
+FROM moz_pages_w_icons p
+JOIN moz_icons_to_pages ip ON ip.page_id = p.id
+JOIN moz_icons i ON i.id = ip.icon_id
+WHERE i.data IS NOT NULL
+ORDER BY p.id, ABS(i.width - 32), i.width DESC
+'''
+
+CHROME_QUERY = '''
+SELECT m.page_url, b.image_data
+FROM icon_mapping m
+JOIN favicon_bitmaps b ON b.icon_id = m.icon_id
+WHERE b.image_data IS NOT NULL
+ORDER BY m.page_url, ABS(b.width - 32), b.width DESC
+'''
+
+# the table identifying each format
+QUERIES = (('moz_icons', FIREFOX_QUERY), ('favicon_bitmaps', CHROME_QUERY))
+
+# favicon databases kept by the browsers next to their bookmarks
+SIBLINGS = ('favicons.sqlite', 'Favicons')
+
+
+def find_icons(path):
+    """
+    Finds the favicon database of the browser profile holding a bookmarks file.
+
+    :return: The path of the database or None if the profile has none.
+    """
+
+    directory = os.path.dirname(os.path.abspath(path))
+    for name in SIBLINGS:
+        candidate = os.path.join(directory, name)
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def read_icons(path):
+    """
+    Walks the page icons of a Firefox favicons.sqlite or Chrome Favicons file, opened read-only.
+
+    :return: A generator of (page url, image content) pairs, one per page.
+    """
+
+    connection = sqlite3.connect('file:{0}?mode=ro'.format(pathname2url(path)), uri=True)
+    try:
+        tables = set(row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'"))
+        queries = [query for table, query in QUERIES if table in tables]
+        if not queries:
+            raise ValueError('Not a Firefox or Chrome favicon database.')
+
+        last_url = None
+        for url, data in connection.execute(queries[0]):
+            if url != last_url:
+                last_url = url
+                yield url, bytes(data)
+    finally:
+        connection.close()
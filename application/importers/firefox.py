@@ -0,0 +1,71 @@
+import sqlite3
+
+try:
+    from urllib.request import pathname2url
+except ImportError:
+    from urllib import pathname2url
+
+from .records import FolderRecord, BookmarkRecord, from_microseconds
+
+
+TYPE_BOOKMARK = 1
+TYPE_FOLDER = 2
+
+TAGS_GUID = 'tags________'
+
+# every folder with its depth, listed parents first; the tags tree is skipped as it doesn't hold bookmarks
+FOLDERS_QUERY = '''
+WITH RECURSIVE tree(id, depth) AS (
+    SELECT id, 0 FROM moz_bookmarks WHERE parent = :root AND type = 2 AND IFNULL(guid, '') != :tags
+    UNION ALL
+    SELECT b.id, tree.depth + 1 FROM moz_bookmarks b JOIN tree ON b.parent = tree.id WHERE b.type = 2
+)
+SELECT b.id, b.parent, b.title, b.position, b.dateAdded
+FROM tree JOIN moz_bookmarks b ON b.id = tree.id
+ORDER BY tree.depth, b.parent, b.position
+'''
+
+# every bookmark except the tag entries, which are stored as bookmarks under the tags tree
+BOOKMARKS_QUERY = '''
+SELECT b.parent, b.title, p.url, b.position, b.dateAdded
+FROM moz_bookmarks b JOIN moz_places p ON p.id = b.fk
+WHERE b.type = 1 AND b.parent NOT IN (
+    SELECT t.id FROM moz_bookmarks t WHERE t.guid = :tags
+    UNION ALL
+    SELECT t.id FROM moz_bookmarks t JOIN moz_bookmarks tags ON t.parent = tags.id WHERE tags.guid = :tags
+)
+'''
+
+
+def connect(path):
+    """
+    Opens a Firefox places.sqlite file in read-only mode.
+    """
+
+    return sqlite3.connect('file:{0}?mode=ro'.format(pathname2url(path)), uri=True)
+
+
+def read_places(path):
+    """
+    Walks the bookmarks of a Firefox places.sqlite file.
+
+    Folders are yielded first, parents before their children, followed by the bookmarks. Rows are read from the
+    sqlite cursor as they are consumed, nothing is materialized.
+
+    :return: A generator of FolderRecord and BookmarkRecord items.
+    """
+
+    connection = connect(path)
+    try:
+        root = connection.execute('SELECT id FROM moz_bookmarks WHERE parent = 0').fetchone()[0]
+        params = {'root': root, 'tags': TAGS_GUID}
+
+        for key, parent, title, position, date_added in connection.execute(FOLDERS_QUERY, params):
+            yield FolderRecord(key, None if parent == root else parent, title, position,
+                               from_microseconds(date_added))
+
+        for parent, title, url, position, date_added in connection.execute(BOOKMARKS_QUERY, params):
+            yield BookmarkRecord(None if parent == root else parent, title, url, position,
+                                 from_microseconds(date_added))
+    finally:
+        connection.close()
@@ -0,0 +1,26 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+
+# a folder of the source tree, 'key' identifies it for its children and parent_key is None for top level folders
+FolderRecord = namedtuple('FolderRecord', ['key', 'parent_key', 'title', 'position', 'date_added'])
+
+# a bookmark of the source tree, parent_key is None for bookmarks outside of any folder
+BookmarkRecord = namedtuple('BookmarkRecord', ['parent_key', 'title', 'url', 'position', 'date_added'])
+
+
+UNIX_EPOCH = datetime(1970, 1, 1)
+WINDOWS_EPOCH = datetime(1601, 1, 1)
+
+
+def from_microseconds(value, epoch=UNIX_EPOCH):
+    """
+    Converts a timestamp in microseconds since the epoch to a datetime.
+
+    :return: The datetime or None if the value is missing or invalid.
+    """
+
+    try:
+        return epoch + timedelta(microseconds=int(value)) if value else None
+    except (TypeError, ValueError, OverflowError):
+        return None
@@ -1,5 +1,23 @@
 from wtforms.widgets import TextInput
 
+# stamped in the database by init_db, bump when the tables, triggers or seed data change
+SCHEMA_VERSION = 8
+
+# columns added to existing tables since their creation, as (table, column definition) pairs; create_all only
+# creates missing tables, init_db adds these to databases stamped with an older version
+ADDED_COLUMNS = [
+    ('bookmarks', 'link_status INTEGER'),
+    ('bookmarks', 'link_url TEXT'),
+    ('bookmarks', 'link_checked DATETIME'),
+    ('bookmarks', 'url_hash INTEGER'),
+    ('bookmarks', 'icon TEXT'),
+]
+
+# indexes of existing tables added since their creation, as (table, index name) pairs
+ADDED_INDEXES = [
+    ('bookmarks', 'ix_bookmarks_user_url_hash'),
+]
+
 
 class CustomTextWidget(TextInput):
     def __call__(self, *args, **kwargs):
@@ -9,3 +27,11 @@ class CustomTextWidget(TextInput):
 
 from .access_level import AccessLevel
 from .user import User
+from .folder import Folder
+from .bookmark import Bookmark
+from .change import Change, SyncHorizon
+from .signature import BookmarkSignature, LshBucket
+from .tag import Tag, bookmark_tags
+from .favicon import Favicon
+from .login_bucket import LoginBucket
+from .job import Job
@@ -0,0 +1,133 @@
+from datetime import datetime
+
+from sqlalchemy import bindparam, event, inspect, DDL
+
+from application import db
+from application.utils.urls import url_hash
+from .folder import ROOT_PATH, _container_path
+
+
+class Bookmark(db.Model):
+    """
+    Bookmark Model - a bookmark of an user, optionally placed in a folder.
+
+    'path' is the full path of the containing folder, see Folder. 'url_hash' is the hash of the canonical url, kept
+    up to date when the url is set, so finding the bookmarks of an url is one index lookup.
+    """
+
+    __tablename__ = 'bookmarks'
+    __table_args__ = (db.Index('ix_bookmarks_user_path', 'user_id', 'path'),
+                      db.Index('ix_bookmarks_user_url_hash', 'user_id', 'url_hash'))
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    folder_id = db.Column(db.Integer, db.ForeignKey('folders.id'), index=True)
+    title = db.Column(db.Text)
+    url = db.Column(db.Text, nullable=False)
+    url_hash = db.Column(db.BigInteger)
+    tags = db.Column(db.Text, default='')
+    position = db.Column(db.Integer, default=0)
+    path = db.Column(db.Text, nullable=False, default=ROOT_PATH)
+    date_added = db.Column(db.DateTime, default=datetime.utcnow)
+    last_modified = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # result of the last link check: HTTP status (0 if unreachable), final url if redirected and check time
+    link_status = db.Column(db.Integer)
+    link_url = db.Column(db.Text)
+    link_checked = db.Column(db.DateTime)
+
+    # digest of the favicon, see Favicon
+    icon = db.Column(db.Text)
+
+    def __init__(self, url='', title='', user_id=None, folder=None, position=0, date_added=None, tags=''):
+        # force defaults in case None is sent
+        self.url = url or ''
+        self.title = title or ''
+        self.tags = tags or ''
+        self.user_id = user_id if user_id is not None or folder is None else folder.user_id
+        if folder is not None:
+            self.folder = folder
+        self.position = position or 0
+        self.date_added = date_added or datetime.utcnow()
+
+    @staticmethod
+    def find_url(user_id, url):
+        """
+        :return: A query for the bookmarks of an user with the same canonical url as the given one.
+        """
+
+        return Bookmark.query.filter(Bookmark.user_id == user_id, Bookmark.url_hash == url_hash(url))
+
+    @staticmethod
+    def fill_url_hashes(batch_size=1000):
+        """
+        Computes the missing url hashes, of the bookmarks saved before the column existed.
+
+        :return: The number of updated bookmarks.
+        """
+
+        table = Bookmark.__table__
+        statement = table.update().where(table.c.id == bindparam('b_id')).values(url_hash=bindparam('b_hash'))
+        updated = 0
+        while True:
+            rows = db.session.query(Bookmark.id, Bookmark.url).filter(Bookmark.url_hash == None) \
+                .limit(batch_size).all()  # noqa: E711
+            if not rows:
+                return updated
+            db.session.execute(statement, [{'b_id': row.id, 'b_hash': url_hash(row.url)} for row in rows])
+            updated += len(rows)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'folder_id': self.folder_id,
+            'title': self.title,
+            'url': self.url,
+            'tags': self.tags,
+            'position': self.position,
+            'icon': self.icon
+        }
+
+    def __repr__(self):
+        return self.title or self.url
+
+
+@event.listens_for(Bookmark, 'before_insert')
+@event.listens_for(Bookmark, 'before_update')
+def _set_bookmark_path(mapper, connection, target):
+    state = inspect(target)
+    if state.has_identity and not (state.attrs.folder.history.has_changes()
+                                   or state.attrs.folder_id.history.has_changes()):
+        return
+
+    target.path = _container_path(connection, target.__dict__.get('folder'), target.folder_id)
+
+
+@event.listens_for(Bookmark.url, 'set')
+def _set_url_hash(target, value, oldvalue, initiator):
+    target.url_hash = url_hash(value)
+
+
+# full text index over titles, urls and tags, kept in sync by triggers so bulk inserts are indexed as well
+for statement in (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS bookmarks_fts USING fts5("
+        "title, url, tags, content='bookmarks', content_rowid='id', tokenize='unicode61')",
+
+        "CREATE TRIGGER IF NOT EXISTS bookmarks_fts_insert AFTER INSERT ON bookmarks BEGIN "
+        "INSERT INTO bookmarks_fts(rowid, title, url, tags) VALUES (new.id, new.title, new.url, new.tags); "
+        "END",
+
+        "CREATE TRIGGER IF NOT EXISTS bookmarks_fts_delete AFTER DELETE ON bookmarks BEGIN "
+        "INSERT INTO bookmarks_fts(bookmarks_fts, rowid, title, url, tags) "
+        "VALUES ('delete', old.id, old.title, old.url, old.tags); "
+        "END",
+
+        "CREATE TRIGGER IF NOT EXISTS bookmarks_fts_update AFTER UPDATE OF title, url, tags ON bookmarks BEGIN "
+        "INSERT INTO bookmarks_fts(bookmarks_fts, rowid, title, url, tags) "
+        "VALUES ('delete', old.id, old.title, old.url, old.tags); "
+        "INSERT INTO bookmarks_fts(rowid, title, url, tags) VALUES (new.id, new.title, new.url, new.tags); "
+        "END"):
+    event.listen(Bookmark.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+event.listen(Bookmark.__table__, 'before_drop',
+             DDL('DROP TABLE IF EXISTS bookmarks_fts').execute_if(dialect='sqlite'))
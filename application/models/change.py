@@ -0,0 +1,140 @@
+from datetime import datetime
+
+from sqlalchemy import event, func, DDL
+
+from application import db
+from .bookmark import Bookmark
+from .folder import Folder
+
+
+class Change(db.Model):
+    """
+    Change Model - an entry of the append-only log of bookmark and folder writes, used by the delta sync.
+
+    Entries are written by triggers, in the same transaction as the write itself. 'seq' never goes back, even after
+    entries are compacted away.
+    """
+
+    __tablename__ = 'changes'
+    __table_args__ = (db.Index('ix_changes_user_seq', 'user_id', 'seq'),
+                      db.Index('ix_changes_entity_seq', 'entity', 'entity_id', 'seq'),
+                      {'sqlite_autoincrement': True})
+
+    INSERT = 'insert'
+    UPDATE = 'update'
+    DELETE = 'delete'
+
+    seq = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    entity = db.Column(db.Text, nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.Text, nullable=False)
+    changed = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @staticmethod
+    def since(user_id, seq):
+        """
+        :return: A query for the changes of an user after seq, in order.
+        """
+
+        return Change.query.filter(Change.user_id == user_id, Change.seq > seq).order_by(Change.seq)
+
+    @staticmethod
+    def latest_seq(user_id):
+        """
+        :return: The sequence number of the last change of an user, 0 if none.
+        """
+
+        return db.session.query(func.max(Change.seq)).filter(Change.user_id == user_id).scalar() or 0
+
+    @staticmethod
+    def data_version(user_id):
+        """
+        Gets a number that changes with every write to the bookmarks or folders of an user, including the writes whose
+        log entries were truncated since.
+
+        :return: The version, 0 if the user never wrote.
+        """
+
+        latest = db.session.query(func.max(Change.seq)).filter(Change.user_id == user_id).as_scalar()
+        horizon = db.session.query(SyncHorizon.seq).filter(SyncHorizon.user_id == user_id).as_scalar()
+        return db.session.query(func.max(func.coalesce(latest, 0), func.coalesce(horizon, 0))).scalar()
+
+    @staticmethod
+    def compact(user_id=None):
+        """
+        Deletes the changes superseded by a later change of the same entity. No sync token is invalidated.
+
+        :return: The number of deleted changes.
+        """
+
+        latest = db.session.query(func.max(Change.seq))
+        query = Change.query
+        if user_id is not None:
+            latest = latest.filter(Change.user_id == user_id)
+            query = query.filter(Change.user_id == user_id)
+
+        latest = latest.group_by(Change.entity, Change.entity_id)
+        return query.filter(~Change.seq.in_(latest)).delete(synchronize_session=False)
+
+    @staticmethod
+    def truncate(user_id, before):
+        """
+        Deletes the delete entries of an user older than the given datetime. Tokens older than the last deleted entry
+        are no longer valid and their clients must run a full sync.
+
+        :return: The number of deleted changes.
+        """
+
+        query = Change.query.filter(Change.user_id == user_id, Change.op == Change.DELETE, Change.changed < before)
+        horizon = query.with_entities(func.max(Change.seq)).scalar()
+        if horizon is None:
+            return 0
+
+        state = SyncHorizon.query.get(user_id) or SyncHorizon(user_id)
+        state.seq = max(state.seq or 0, horizon)
+        db.session.add(state)
+        return query.delete(synchronize_session=False)
+
+
+class SyncHorizon(db.Model):
+    """
+    SyncHorizon Model - the last change of an user removed from the log, tokens strictly before it have expired: a
+    token at the horizon has seen every removed change.
+    """
+
+    __tablename__ = 'sync_horizons'
+
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    seq = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__(self, user_id, seq=0):
+        self.user_id = user_id
+        self.seq = seq
+
+    @staticmethod
+    def get_seq(user_id):
+        state = SyncHorizon.query.get(user_id)
+        return state.seq if state else 0
+
+
+def _log_triggers(table, entity, columns):
+    insert = "INSERT INTO changes(user_id, entity, entity_id, op, changed) " \
+             "VALUES ({0}.user_id, '" + entity + "', {0}.id, '{1}', CURRENT_TIMESTAMP); "
+
+    return (
+        "CREATE TRIGGER IF NOT EXISTS {0}_log_insert AFTER INSERT ON {0} BEGIN ".format(table) +
+        insert.format('new', Change.INSERT) + "END",
+
+        "CREATE TRIGGER IF NOT EXISTS {0}_log_update AFTER UPDATE OF {1} ON {0} BEGIN ".format(
+            table, ', '.join(columns)) + insert.format('new', Change.UPDATE) + "END",
+
+        "CREATE TRIGGER IF NOT EXISTS {0}_log_delete AFTER DELETE ON {0} BEGIN ".format(table) +
+        insert.format('old', Change.DELETE) + "END")
+
+
+# path updates are not logged, a move is logged once as the parent change of the moved node
+for model, entity, columns in ((Folder, 'folder', ('title', 'parent_id', 'position')),
+                               (Bookmark, 'bookmark', ('title', 'url', 'tags', 'folder_id', 'position'))):
+    for statement in _log_triggers(model.__tablename__, entity, columns):
+        event.listen(model.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
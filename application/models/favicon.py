@@ -0,0 +1,24 @@
+from datetime import datetime
+
+from application import db
+
+
+class Favicon(db.Model):
+    """
+    Favicon Model - where an icon is stored in the pack files of the favicon store, see utils.favicons.
+
+    Icons are content addressed: 'digest' is the SHA-1 of the image, shared by all the bookmarks using it.
+    """
+
+    __tablename__ = 'favicons'
+    __table_args__ = (db.Index('ix_favicons_pack', 'pack'),)
+
+    digest = db.Column(db.Text, primary_key=True)
+    pack = db.Column(db.Integer, nullable=False)
+    offset = db.Column(db.Integer, nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    mimetype = db.Column(db.Text, nullable=False)
+    date_added = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return self.digest
@@ -0,0 +1,154 @@
+from datetime import datetime
+
+from sqlalchemy import event, func, inspect, select
+
+from application import db
+
+
+ROOT_PATH = '/'
+
+
+def path_segment(node_id):
+    """
+    Gets the path segment of a folder. Segments are fixed width so that sorting by path lists a tree depth first.
+    """
+
+    return '{0:08x}/'.format(node_id)
+
+
+def path_range(path):
+    """
+    Gets the [start, end) bounds matching every path that starts with the given one, for use as an indexed range.
+    """
+
+    # '0' is the character following the '/' separator
+    return path, path[:-1] + '0'
+
+
+class Folder(db.Model):
+    """
+    Folder Model - a node of the bookmark tree of an user.
+
+    The hierarchy is stored as a materialized path: 'path' holds the segments of all the ancestors, so the whole
+    subtree of a folder is a single range on the (user_id, path) index.
+    """
+
+    __tablename__ = 'folders'
+    __table_args__ = (db.Index('ix_folders_user_path', 'user_id', 'path'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    parent_id = db.Column(db.Integer, db.ForeignKey('folders.id'), index=True)
+    title = db.Column(db.Text)
+    position = db.Column(db.Integer, default=0)
+    path = db.Column(db.Text, nullable=False, default=ROOT_PATH)
+    date_added = db.Column(db.DateTime, default=datetime.utcnow)
+    last_modified = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    parent = db.relationship('Folder', remote_side=[id], backref=db.backref('children', lazy='dynamic'))
+    bookmarks = db.relationship('Bookmark', backref='folder', lazy='dynamic')
+
+    def __init__(self, title='', user_id=None, parent=None, position=0, date_added=None):
+        # force defaults in case None is sent
+        self.title = title or ''
+        self.user_id = user_id if user_id is not None or parent is None else parent.user_id
+        if parent is not None:
+            self.parent = parent
+        self.position = position or 0
+        self.date_added = date_added or datetime.utcnow()
+
+    @property
+    def full_path(self):
+        """
+        Gets the path of the folder including itself, which is the path of all its children.
+        """
+
+        return self.path + path_segment(self.id)
+
+    def descendants(self):
+        """
+        :return: A query for all the folders under this one, at any depth.
+        """
+
+        start, end = path_range(self.full_path)
+        return Folder.query.filter(Folder.user_id == self.user_id, Folder.path >= start, Folder.path < end)
+
+    def descendant_bookmarks(self):
+        """
+        :return: A query for all the bookmarks under this folder, at any depth.
+        """
+
+        from .bookmark import Bookmark
+
+        start, end = path_range(self.full_path)
+        return Bookmark.query.filter(Bookmark.user_id == self.user_id, Bookmark.path >= start, Bookmark.path < end)
+
+    def delete_subtree(self):
+        """
+        Deletes the folder with everything under it, using one range delete per table.
+        """
+
+        self.descendant_bookmarks().delete(synchronize_session=False)
+        self.descendants().delete(synchronize_session=False)
+        db.session.delete(self)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'parent_id': self.parent_id,
+            'title': self.title,
+            'position': self.position
+        }
+
+    def __repr__(self):
+        return self.title
+
+
+def _container_path(connection, parent, parent_id):
+    """
+    Gets the full path of the folder with the given id, from the loaded parent object if it matches.
+
+    The foreign key is the reference as it is synchronized from the relationship before the flush events run, while
+    a loaded relationship may be stale if only the foreign key was assigned.
+    """
+
+    if parent_id is None:
+        return ROOT_PATH
+    if parent is not None and parent.id == parent_id:
+        return parent.full_path
+
+    table = Folder.__table__
+    path = connection.scalar(select([table.c.path]).where(table.c.id == parent_id))
+    return path + path_segment(parent_id)
+
+
+@event.listens_for(Folder, 'before_insert')
+def _set_folder_path(mapper, connection, target):
+    target.path = _container_path(connection, target.__dict__.get('parent'), target.parent_id)
+
+
+@event.listens_for(Folder, 'before_update')
+def _move_folder(mapper, connection, target):
+    state = inspect(target)
+    if not (state.attrs.parent.history.has_changes() or state.attrs.parent_id.history.has_changes()):
+        return
+
+    old_path = target.full_path
+    new_parent_path = _container_path(connection, target.__dict__.get('parent'), target.parent_id)
+
+    if new_parent_path.startswith(old_path):
+        raise ValueError('A folder can\'t be moved under itself.')
+
+    target.path = new_parent_path
+    new_path = target.full_path
+
+    # rewrite the path prefix of the whole subtree, one range update per table
+    from .bookmark import Bookmark
+
+    start, end = path_range(old_path)
+    for table in (Folder.__table__, Bookmark.__table__):
+        connection.execute(table.update()
+                           .where(table.c.user_id == target.user_id)
+                           .where(table.c.path >= start)
+                           .where(table.c.path < end)
+                           .values(path=new_path + func.substr(table.c.path, len(old_path) + 1)))
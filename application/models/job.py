@@ -0,0 +1,58 @@
+import json
+from datetime import datetime
+
+from application import db
+
+
+class Job(db.Model):
+    """
+    Job Model - an entry of the background job queue, see utils.jobs.
+
+    'params' and 'result' are JSON documents. A job is claimed by setting it running with the pid of the worker
+    process and a 'claim' token unique to the attempt; 'run_after' delays the retries of failed attempts.
+    """
+
+    __tablename__ = 'jobs'
+    __table_args__ = (db.Index('ix_jobs_status_run_after', 'status', 'run_after'),
+                      db.Index('ix_jobs_user_id', 'user_id', 'id'))
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    FINISHED = (DONE, FAILED, CANCELLED)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    kind = db.Column(db.Text, nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.Text, nullable=False, default=QUEUED)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer)
+    message = db.Column(db.Text)
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=1)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    worker = db.Column(db.Integer)
+    claim = db.Column(db.Text)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started = db.Column(db.DateTime)
+    finished = db.Column(db.DateTime)
+
+    def get_params(self):
+        return json.loads(self.params or '{}')
+
+    def get_result(self):
+        return json.loads(self.result) if self.result else None
+
+    @property
+    def active(self):
+        return self.status in (Job.QUEUED, Job.RUNNING)
+
+    def __repr__(self):
+        return '{0} #{1}'.format(self.kind, self.id)
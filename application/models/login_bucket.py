@@ -0,0 +1,19 @@
+from application import db
+
+
+class LoginBucket(db.Model):
+    """
+    LoginBucket Model - the token bucket of a username or client address, used by the login throttle when it is
+    shared by the worker processes, see utils.throttle.
+
+    'tokens' is the number of tokens at 'updated', a unix time; tokens are added back continuously since then.
+    """
+
+    __tablename__ = 'login_buckets'
+
+    key = db.Column(db.Text, primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    updated = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return self.key
@@ -0,0 +1,56 @@
+from sqlalchemy import event, DDL
+
+from application import db
+
+
+class BookmarkSignature(db.Model):
+    """
+    BookmarkSignature Model - the MinHash signature of the title and url of a bookmark, see utils.minhash.
+
+    'cluster_id' is the smallest bookmark id of the near duplicates group, the bookmark id itself if it has none.
+    Signatures are dropped by triggers when a bookmark of the cluster changes, and computed again by the next
+    clustering run.
+    """
+
+    __tablename__ = 'bookmark_signatures'
+    __table_args__ = (db.Index('ix_bookmark_signatures_user_cluster', 'user_id', 'cluster_id'),)
+
+    bookmark_id = db.Column(db.Integer, db.ForeignKey('bookmarks.id'), primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    signature = db.Column(db.LargeBinary, nullable=False)
+    cluster_id = db.Column(db.Integer, nullable=False)
+
+
+class LshBucket(db.Model):
+    """
+    LshBucket Model - a bookmark filed under the hash of one band of its signature. Bookmarks sharing a bucket are
+    candidate near duplicates.
+    """
+
+    __tablename__ = 'lsh_buckets'
+    __table_args__ = (db.Index('ix_lsh_buckets_bookmark', 'bookmark_id'),)
+
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    band = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    bucket = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    bookmark_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+
+# a changed or deleted bookmark loses its signature and buckets, and so do the other bookmarks of its cluster: the
+# cluster may have been joined through it, its members are clustered again by the next run
+_CLUSTER = ("(SELECT bookmark_id FROM bookmark_signatures WHERE user_id = old.user_id AND "
+            "cluster_id = (SELECT cluster_id FROM bookmark_signatures WHERE bookmark_id = old.id))")
+# the signature of the bookmark itself goes last, the cluster is looked up through it
+_DROP_CLUSTER = (
+    "DELETE FROM lsh_buckets WHERE bookmark_id IN " + _CLUSTER + "; "
+    "DELETE FROM lsh_buckets WHERE bookmark_id = old.id; "
+    "DELETE FROM bookmark_signatures WHERE bookmark_id != old.id AND bookmark_id IN " + _CLUSTER + "; "
+    "DELETE FROM bookmark_signatures WHERE bookmark_id = old.id; ")
+
+for statement in (
+        "CREATE TRIGGER IF NOT EXISTS bookmarks_signature_update AFTER UPDATE OF title, url ON bookmarks BEGIN " +
+        _DROP_CLUSTER + "END",
+
+        "CREATE TRIGGER IF NOT EXISTS bookmarks_signature_delete AFTER DELETE ON bookmarks BEGIN " +
+        _DROP_CLUSTER + "END"):
+    event.listen(BookmarkSignature.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
@@ -0,0 +1,105 @@
+from sqlalchemy import event, inspect, DDL
+
+from application import db
+from .bookmark import Bookmark
+
+# bookmarks and their tags, mirrored from the 'tags' text of the bookmarks
+bookmark_tags = db.Table(
+    'bookmark_tags',
+    db.Column('bookmark_id', db.Integer, db.ForeignKey('bookmarks.id'), primary_key=True, autoincrement=False),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tags.id'), primary_key=True, autoincrement=False),
+    db.Index('ix_bookmark_tags_tag', 'tag_id'))
+
+
+class Tag(db.Model):
+    """
+    Tag Model - a tag of an user.
+
+    The tags of a bookmark are edited as its comma separated 'tags' text, which is parsed into the bookmark_tags table
+    on every write of the bookmark. Names are stored lower cased.
+    """
+
+    __tablename__ = 'tags'
+    __table_args__ = (db.UniqueConstraint('user_id', 'name'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    name = db.Column(db.Text, nullable=False)
+
+    def __init__(self, name, user_id):
+        self.name = name
+        self.user_id = user_id
+
+    @staticmethod
+    def parse(text):
+        """
+        :return: The distinct tag names of a comma separated text, lower cased, in order.
+        """
+
+        names = []
+        for name in (text or '').split(','):
+            name = name.strip().lower()
+            if name and name not in names:
+                names.append(name)
+        return names
+
+    @staticmethod
+    def set_bookmark_tags(connection, user_id, bookmark_id, text):
+        """
+        Replaces the tags of a bookmark by the ones of the text, creating the missing tags.
+        """
+
+        connection.execute(bookmark_tags.delete().where(bookmark_tags.c.bookmark_id == bookmark_id))
+        names = Tag.parse(text)
+        if not names:
+            return
+
+        table = Tag.__table__
+        connection.execute(table.insert().prefix_with('OR IGNORE'),
+                           [{'user_id': user_id, 'name': name} for name in names])
+        connection.execute(bookmark_tags.insert().from_select(
+            ['bookmark_id', 'tag_id'],
+            db.select([db.literal(bookmark_id), table.c.id]).where(db.and_(table.c.user_id == user_id,
+                                                                           table.c.name.in_(names)))))
+
+    @staticmethod
+    def fill(batch_size=1000):
+        """
+        Parses the tags of the bookmarks saved before the bookmark_tags table existed.
+
+        :return: The number of bookmarks with tags.
+        """
+
+        connection = db.session.connection()
+        tagged = db.session.query(bookmark_tags.c.bookmark_id).filter(bookmark_tags.c.bookmark_id == Bookmark.id)
+        last_id = 0
+        filled = 0
+        while True:
+            rows = db.session.query(Bookmark.id, Bookmark.user_id, Bookmark.tags) \
+                .filter(Bookmark.id > last_id, Bookmark.tags != '', ~tagged.exists()) \
+                .order_by(Bookmark.id).limit(batch_size).all()
+            if not rows:
+                return filled
+            for row in rows:
+                Tag.set_bookmark_tags(connection, row.user_id, row.id, row.tags)
+            last_id = rows[-1].id
+            filled += len(rows)
+
+    def __repr__(self):
+        return self.name
+
+
+@event.listens_for(Bookmark, 'after_insert')
+@event.listens_for(Bookmark, 'after_update')
+def _set_bookmark_tags(mapper, connection, target):
+    # new bookmarks without tags have nothing to write
+    history = inspect(target).attrs.tags.history
+    if history.has_changes() and (target.tags or history.deleted):
+        Tag.set_bookmark_tags(connection, target.user_id, target.id, target.tags)
+
+
+# deleted bookmarks lose their tags, range deletes included
+event.listen(bookmark_tags, 'after_create', DDL(
+    "CREATE TRIGGER IF NOT EXISTS bookmarks_tags_delete AFTER DELETE ON bookmarks BEGIN "
+    "DELETE FROM bookmark_tags WHERE bookmark_id = old.id; "
+    "END").execute_if(dialect='sqlite'))
@@ -1,8 +1,8 @@
-from werkzeug.security import generate_password_hash
 from wtforms import validators
 from wtforms.widgets import PasswordInput, Select
 
 from application import db
+from application.utils import hashing
 from . import CustomTextWidget
 
 
@@ -18,13 +18,15 @@ class User(db.Model):
     username = db.Column(db.Text, unique=True, index=True)
     password = db.Column(db.Text)
     access_level_id = db.Column(db.Integer, db.ForeignKey('access_level.id'))
+    folders = db.relationship('Folder', backref='user', lazy='dynamic')
+    bookmarks = db.relationship('Bookmark', backref='user', lazy='dynamic')
 
     def __init__(self, username='', password='', first_name='', last_name='', access_level_id=None):
         # force defaults in case None is sent
         self.first_name = first_name or ''
         self.last_name = last_name or ''
         self.username = username or ''
-        self.password = generate_password_hash(password or '')
+        self.password = hashing.hash_password(password or '')
         self.access_level_id = access_level_id
 
     @staticmethod
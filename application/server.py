@@ -0,0 +1,244 @@
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer
+
+from application import app, db
+from application.utils.jobs import job_runner
+from config import ActiveConfig
+
+logger = logging.getLogger(__name__)
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    WSGI server handling the requests on a fixed size thread pool.
+
+    The accept loop blocks while all threads are busy, so with several worker processes sharing a socket the
+    pending connections are taken by the workers that have free threads.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads, fd=None):
+        """
+        :param fd: File descriptor of a listening socket to serve instead of binding host and port.
+        """
+
+        # werkzeug 0.10 can't adopt a socket, server_bind and server_activate do it
+        self.fd = fd
+        BaseWSGIServer.__init__(self, host, port, app)
+        self.executor = ThreadPoolExecutor(threads)
+        self._slots = threading.BoundedSemaphore(threads)
+
+    def server_bind(self):
+        if self.fd is None:
+            return BaseWSGIServer.server_bind(self)
+
+        self.socket.close()
+        self.socket = socket.fromfd(self.fd, self.address_family, socket.SOCK_STREAM)
+        self.server_address = self.socket.getsockname()
+        self.server_name = socket.getfqdn(self.server_address[0])
+        self.server_port = self.server_address[1]
+
+    def server_activate(self):
+        # an adopted socket is listening already
+        if self.fd is None:
+            BaseWSGIServer.server_activate(self)
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        self.executor.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def server_close(self):
+        # let the requests being processed finish
+        self.executor.shutdown(wait=True)
+        BaseWSGIServer.server_close(self)
+
+    def stop(self, *args):
+        """
+        Stops accepting connections. Usable as a signal handler.
+        """
+
+        # shutdown waits for the serve loop, which runs on the thread receiving the signal
+        threading.Thread(target=self.shutdown).start()
+
+
+class PreforkServer(object):
+    """
+    Pre-forking server: the master process binds the socket and supervises worker processes serving it.
+
+    SIGHUP gracefully restarts the workers, SIGTERM and SIGINT gracefully stop the server.
+    """
+
+    def __init__(self, app, host, port, workers, threads, backlog=128, graceful_timeout=30):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.threads = threads
+        self.backlog = backlog
+        self.graceful_timeout = graceful_timeout
+        self.socket = None
+        self.children = set()
+        # workers replaced by a restart, pid -> time they get killed at if they are still finishing their requests
+        self.retiring = {}
+        self._stopping = False
+        self._restarting = False
+
+    def run(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.host, self.port))
+        self.socket.listen(self.backlog)
+        logger.info('Serving on %s:%d with %d workers of %d threads', self.host, self.port, self.workers, self.threads)
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGHUP, self._restart)
+
+        for _ in range(self.workers):
+            self._spawn()
+
+        while not self._stopping:
+            if self._restarting:
+                self._restarting = False
+                retiring = set(self.children)
+                self.children.clear()
+                for _ in range(self.workers):
+                    self._spawn()
+                self._kill(retiring, signal.SIGTERM)
+                deadline = time.time() + self.graceful_timeout
+                self.retiring.update((pid, deadline) for pid in retiring)
+                logger.info('Restarted workers')
+            self._reap()
+            now = time.time()
+            self._kill(set(pid for pid, deadline in self.retiring.items() if deadline < now), signal.SIGKILL)
+            time.sleep(0.5)
+
+        self._shutdown()
+
+    def _shutdown(self):
+        # workers still retiring from a restart are signalled again and waited for with the others
+        self._kill(self.children | set(self.retiring), signal.SIGTERM)
+        deadline = time.time() + self.graceful_timeout
+        while (self.children or self.retiring) and time.time() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        self._kill(self.children | set(self.retiring), signal.SIGKILL)
+        self._reap()
+        self.socket.close()
+
+    def _stop(self, *args):
+        self._stopping = True
+
+    def _restart(self, *args):
+        self._restarting = True
+
+    def _spawn(self):
+        # connections must not be shared between processes, sqlite ones included
+        db.dispose_engines()
+
+        pid = os.fork()
+        if pid:
+            self.children.add(pid)
+            return
+
+        # worker process
+        for signum in (signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, signal.SIG_IGN)
+        status = 0
+        try:
+            server = PooledWSGIServer(self.host, self.port, self.app, self.threads, fd=self.socket.fileno())
+            stopped = []
+
+            def stop(*args):
+                stopped.append(time.time())
+                server.stop()
+                job_runner.interrupt()
+
+            signal.signal(signal.SIGTERM, stop)
+            job_runner.start()
+            server.serve_forever()
+
+            # the master kills the workers left after the graceful timeout, keep a second to queue the jobs again
+            elapsed = time.time() - stopped[0] if stopped else 0
+            job_runner.stop(max(self.graceful_timeout - elapsed - 1, 0))
+        except Exception:
+            logger.exception('Worker %d failed', os.getpid())
+            status = 1
+        finally:
+            os._exit(status)
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            self.retiring.pop(pid, None)
+            if pid in self.children:
+                self.children.discard(pid)
+                if not self._stopping:
+                    logger.warning('Worker %d exited with status %d, restarting', pid, status)
+                    time.sleep(1)
+                    self._spawn()
+
+    @staticmethod
+    def _kill(pids, signum):
+        for pid in list(pids):
+            try:
+                os.kill(pid, signum)
+            except OSError:
+                pids.discard(pid)
+
+
+def serve():
+    """
+    Production entry point: initializes the application once and serves it with SERVER_WORKERS processes of
+    SERVER_THREADS threads each.
+    """
+
+    from application import init
+
+    logging.basicConfig(level=logging.INFO)
+    logger.info(init())
+
+    host = ActiveConfig.SERVER_HOST.rstrip(':')
+    workers = ActiveConfig.SERVER_WORKERS
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers > 1 and hasattr(os, 'fork'):
+        PreforkServer(app, host, ActiveConfig.SERVER_PORT, workers, ActiveConfig.SERVER_THREADS,
+                      ActiveConfig.SERVER_BACKLOG, ActiveConfig.SERVER_GRACEFUL_TIMEOUT).run()
+    else:
+        server = PooledWSGIServer(host, ActiveConfig.SERVER_PORT, app, ActiveConfig.SERVER_THREADS)
+
+        def stop(*args):
+            server.stop()
+            job_runner.interrupt()
+
+        signal.signal(signal.SIGTERM, stop)
+        logger.info('Serving on %s:%d with %d threads', host, ActiveConfig.SERVER_PORT, ActiveConfig.SERVER_THREADS)
+        job_runner.start()
+        try:
+            server.serve_forever()
+        finally:
+            job_runner.stop(ActiveConfig.SERVER_GRACEFUL_TIMEOUT)
@@ -1 +1,2 @@
 from .authentication import Authentication
+from .default_credentials import DefaultCredentials
@@ -1,10 +1,64 @@
+import hashlib
+import hmac
+import os
 from functools import wraps
 
-from flask import request, make_response, jsonify
+from flask import request, make_response, jsonify, g
 import flask.ext.login as login
-from werkzeug.security import check_password_hash
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
 
 from application import models
+from config import ActiveConfig
+from .lru import LRUCache
+from .throttle import login_throttle, LoginThrottled
+
+
+class CredentialCache(object):
+    """
+    Cache of successfully verified username/password pairs.
+
+    Passwords are never stored: the key holds a digest of the password keyed with a secret generated per process.
+    """
+
+    def __init__(self, max_size=1024, ttl=300):
+        self._secret = os.urandom(32)
+        self._cache = LRUCache(max_size, ttl)
+
+    def _key(self, username, password):
+        message = u'{0}\0{1}'.format(username, password).encode('utf-8')
+        return username, hmac.new(self._secret, message, hashlib.sha256).digest()
+
+    def get(self, username, password):
+        """
+        :return: The id of the user if the pair was verified recently, None otherwise.
+        """
+
+        return self._cache.get(self._key(username, password))
+
+    def add(self, username, password, user_id):
+        self._cache.set(self._key(username, password), user_id)
+
+    def invalidate_user(self, user_id):
+        """
+        Drops all the verified credentials of a user.
+        """
+
+        return self._cache.discard_if(lambda key, value: value == user_id)
+
+    def clear(self):
+        self._cache.clear()
+
+    @property
+    def hits(self):
+        return self._cache.hits
+
+    @property
+    def misses(self):
+        return self._cache.misses
+
+    def stats(self):
+        return self._cache.stats()
 
 
 class Authentication:
@@ -12,6 +66,29 @@ class Authentication:
     Class that contains methods for authentication and user validation.
     """
 
+    credential_cache = CredentialCache(ActiveConfig.AUTH_CACHE_SIZE, ActiveConfig.AUTH_CACHE_TTL)
+
+    @staticmethod
+    def get_authorized_user_id(username, password):
+        """
+        Validates the username/password pair.
+
+        :return: The id of the user if valid, None otherwise.
+
+        :raise LoginThrottled: if the password was not checked because of too many failed attempts.
+        """
+
+        user_id = Authentication.credential_cache.get(username, password)
+        if user_id is not None:
+            return user_id
+
+        user = models.User.query.filter_by(username=username).first()
+        if user is None or not login_throttle.check_password(username, user.password, password):
+            return None
+
+        Authentication.credential_cache.add(username, password, user.id)
+        return user.id
+
     @staticmethod
     def check_authorization(username, password):
         """
@@ -20,10 +97,19 @@ class Authentication:
         :return: True if valid.
         """
 
-        user = models.User.query.filter_by(username=username).first()
-        if user is None or not check_password_hash(user.password, password):
-            return False
-        return True
+        return Authentication.get_authorized_user_id(username, password) is not None
+
+    @staticmethod
+    def get_authorized_user_id_dict(dict_obj):
+        """
+        Validates the 'username' and 'password' fields of the object.
+
+        :return: The id of the user if present and valid, None otherwise.
+        """
+
+        if dict_obj is None or 'username' not in dict_obj or 'password' not in dict_obj:
+            return None
+        return Authentication.get_authorized_user_id(dict_obj['username'], dict_obj['password'])
 
     @staticmethod
     def check_authorization_dict(dict_obj):
@@ -33,14 +119,30 @@ class Authentication:
         :return: True if present and valid.
         """
 
-        if dict_obj is None or 'username' not in dict_obj or 'password' not in dict_obj:
-            return False
-        return Authentication.check_authorization(dict_obj['username'], dict_obj['password'])
+        return Authentication.get_authorized_user_id_dict(dict_obj) is not None
+
+    @staticmethod
+    def get_request_user_id():
+        """
+        Gets the user of the current request, from the session or from the authorization data.
+
+        :return: The id of the user or None if the request is not authorized.
+        """
+
+        if login.current_user.is_authenticated():
+            return int(login.current_user.get_id())
+
+        user_id = Authentication.get_authorized_user_id_dict(request.authorization)
+        if user_id is None:
+            user_id = Authentication.get_authorized_user_id_dict(request.json)
+        return user_id
 
     @staticmethod
     def login_required(f):
         """
         Decorator that checks if a request contains valid authorization data either in the header or the json object.
+
+        The id of the authorized user is stored in flask.g.user_id.
         """
 
         @wraps(f)
@@ -50,10 +152,36 @@ class Authentication:
             # Chrome and Firefox issue a preflight OPTIONS request to check
             # Access-Control-* headers, and will fail if it returns 401.
             if request.method != 'OPTIONS':
-                if not (login.current_user.is_authenticated()
-                        or Authentication.check_authorization_dict(request.authorization)
-                        or Authentication.check_authorization_dict(request.json)):
+                try:
+                    g.user_id = Authentication.get_request_user_id()
+                except LoginThrottled as e:
+                    response = make_response(jsonify({'Status': str(e)}), 429)
+                    response.headers['Retry-After'] = str(e.retry_after)
+                    return response
+
+                if g.user_id is None:
                     # return 403, not 401 to prevent browsers from displaying the default auth dialog
                     return make_response(jsonify({'Status': 'Unauthorized access.'}), 403)
             return f(*args, **kwargs)
-        return decorated
\ No newline at end of file
+        return decorated
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidate_flushed_credentials(session, flush_context):
+    for obj in session.deleted:
+        if isinstance(obj, models.User):
+            Authentication.credential_cache.invalidate_user(obj.id)
+
+    for obj in session.dirty:
+        if isinstance(obj, models.User):
+            state = inspect(obj)
+            if state.attrs.password.history.has_changes() or state.attrs.username.history.has_changes():
+                Authentication.credential_cache.invalidate_user(obj.id)
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def _invalidate_bulk_credentials(context):
+    # bulk queries don't report the affected rows, drop everything
+    if context.mapper is not None and context.mapper.class_ is models.User:
+        Authentication.credential_cache.clear()
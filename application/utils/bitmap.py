@@ -0,0 +1,196 @@
+import sys
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+# values are split in chunks on their high bits, as in roaring bitmaps
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+CHUNK_BYTES = (1 << CHUNK_BITS) // 8
+
+# chunks holding more values are stored as a bitset, smaller than the sorted array from there on
+ARRAY_MAX = 4096
+
+# positions of the set bits of every byte value
+_BYTE_BITS = [tuple(j for j in range(8) if byte >> j & 1) for byte in range(256)]
+
+
+def _bits_to_array(bits):
+    return array('H', [(i << 3) + j for i, byte in enumerate(bits.to_bytes(CHUNK_BYTES, 'little')) if byte
+                       for j in _BYTE_BITS[byte]])
+
+
+def _as_bits(chunk):
+    if not isinstance(chunk, array):
+        return chunk
+    data = bytearray(CHUNK_BYTES)
+    for value in chunk:
+        data[value >> 3] |= 1 << (value & 7)
+    return int.from_bytes(data, 'little')
+
+
+def _normalize(chunk):
+    """
+    :return: The chunk in its smallest form, None if empty.
+    """
+
+    if isinstance(chunk, array):
+        if len(chunk) > ARRAY_MAX:
+            return _as_bits(chunk)
+        return chunk or None
+    if not chunk:
+        return None
+    return _bits_to_array(chunk) if bin(chunk).count('1') <= ARRAY_MAX else chunk
+
+
+def _filter(values, bits, keep):
+    data = bits.to_bytes(CHUNK_BYTES, 'little')
+    return array('H', [value for value in values if bool(data[value >> 3] >> (value & 7) & 1) == keep])
+
+
+def _and(first, second):
+    if isinstance(first, array) and isinstance(second, array):
+        return array('H', sorted(set(first).intersection(second)))
+    if isinstance(first, array):
+        return _filter(first, second, True)
+    if isinstance(second, array):
+        return _filter(second, first, True)
+    return first & second
+
+
+def _or(first, second):
+    if isinstance(first, array) and isinstance(second, array):
+        return array('H', sorted(set(first).union(second)))
+    return _as_bits(first) | _as_bits(second)
+
+
+def _and_not(first, second):
+    if isinstance(first, array):
+        if isinstance(second, array):
+            return array('H', sorted(set(first).difference(second)))
+        return _filter(first, second, False)
+    return first & ~_as_bits(second)
+
+
+def _copy(chunk):
+    return array('H', chunk) if isinstance(chunk, array) else chunk
+
+
+class Bitmap(object):
+    """
+    Compressed set of non negative integers, after roaring bitmaps.
+
+    Values are grouped in chunks of 2^16 by their high bits. A chunk is a sorted array of the 16 bit low parts while it
+    holds up to ARRAY_MAX values, and a 8 KB bitset stored as an int beyond that, so sparse and dense sets both stay
+    small. Intersections, unions and differences work chunk by chunk.
+    """
+
+    __slots__ = ('_chunks',)
+
+    def __init__(self, values=()):
+        self._chunks = {}
+        grouped = defaultdict(set)
+        for value in values:
+            grouped[value >> CHUNK_BITS].add(value & CHUNK_MASK)
+        for high, lows in grouped.items():
+            self._chunks[high] = _normalize(array('H', sorted(lows)))
+
+    def add(self, value):
+        high, low = value >> CHUNK_BITS, value & CHUNK_MASK
+        chunk = self._chunks.get(high)
+        if chunk is None:
+            self._chunks[high] = array('H', [low])
+        elif isinstance(chunk, array):
+            i = bisect_left(chunk, low)
+            if i == len(chunk) or chunk[i] != low:
+                chunk.insert(i, low)
+                if len(chunk) > ARRAY_MAX:
+                    self._chunks[high] = _as_bits(chunk)
+        else:
+            self._chunks[high] = chunk | 1 << low
+
+    def discard(self, value):
+        high, low = value >> CHUNK_BITS, value & CHUNK_MASK
+        chunk = self._chunks.get(high)
+        if chunk is None:
+            return
+
+        if isinstance(chunk, array):
+            i = bisect_left(chunk, low)
+            if i < len(chunk) and chunk[i] == low:
+                del chunk[i]
+        else:
+            chunk &= ~(1 << low)
+
+        chunk = _normalize(chunk)
+        if chunk is None:
+            del self._chunks[high]
+        else:
+            self._chunks[high] = chunk
+
+    def __contains__(self, value):
+        chunk = self._chunks.get(value >> CHUNK_BITS)
+        if chunk is None:
+            return False
+        low = value & CHUNK_MASK
+        if isinstance(chunk, array):
+            i = bisect_left(chunk, low)
+            return i < len(chunk) and chunk[i] == low
+        return bool(chunk >> low & 1)
+
+    def __len__(self):
+        return sum(len(chunk) if isinstance(chunk, array) else bin(chunk).count('1')
+                   for chunk in self._chunks.values())
+
+    def __bool__(self):
+        return bool(self._chunks)
+
+    __nonzero__ = __bool__
+
+    def __iter__(self):
+        for high in sorted(self._chunks):
+            chunk = self._chunks[high]
+            base = high << CHUNK_BITS
+            for low in chunk if isinstance(chunk, array) else _bits_to_array(chunk):
+                yield base | low
+
+    def _combine(self, highs, operation):
+        result = Bitmap()
+        for high in highs:
+            chunk = _normalize(operation(high))
+            if chunk is not None:
+                result._chunks[high] = chunk
+        return result
+
+    def __and__(self, other):
+        return self._combine(self._chunks.keys() & other._chunks.keys(),
+                             lambda high: _and(self._chunks[high], other._chunks[high]))
+
+    def __or__(self, other):
+        def operation(high):
+            if high not in other._chunks:
+                return _copy(self._chunks[high])
+            if high not in self._chunks:
+                return _copy(other._chunks[high])
+            return _or(self._chunks[high], other._chunks[high])
+
+        return self._combine(self._chunks.keys() | other._chunks.keys(), operation)
+
+    def __sub__(self, other):
+        def operation(high):
+            if high not in other._chunks:
+                return _copy(self._chunks[high])
+            return _and_not(self._chunks[high], other._chunks[high])
+
+        return self._combine(list(self._chunks), operation)
+
+    @property
+    def nbytes(self):
+        """
+        :return: The memory used by the bitmap, in bytes.
+        """
+
+        return sys.getsizeof(self._chunks) + sum(sys.getsizeof(chunk) for chunk in self._chunks.values())
+
+    def __repr__(self):
+        return 'Bitmap({0} values, {1} bytes)'.format(len(self), self.nbytes)
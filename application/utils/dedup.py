@@ -0,0 +1,84 @@
+from collections import namedtuple, OrderedDict
+
+from sqlalchemy import func
+
+from application import db, models
+from application.utils.urls import normalize_url
+
+DuplicateGroup = namedtuple('DuplicateGroup', 'url_hash count ids')
+
+# bookmarks are loaded by chunks of groups, below the sqlite variable limit
+IN_CHUNK = 200
+
+
+class Duplicates:
+    """
+    Class that contains methods for the bookmarks saved more than once under the same canonical url.
+
+    Bookmarks are grouped on their url hash, a single pass over the (user_id, url_hash) index, instead of comparing
+    them pairwise.
+    """
+
+    @staticmethod
+    def report(user_id):
+        """
+        :return: A list of DuplicateGroup items, the ids of each group sorted oldest first.
+        """
+
+        Bookmark = models.Bookmark
+        rows = db.session.query(Bookmark.url_hash, func.count(Bookmark.id), func.group_concat(Bookmark.id)) \
+            .filter(Bookmark.user_id == user_id, Bookmark.url_hash.isnot(None)) \
+            .group_by(Bookmark.url_hash).having(func.count(Bookmark.id) > 1)
+
+        return [DuplicateGroup(row[0], row[1], sorted(int(i) for i in row[2].split(','))) for row in rows]
+
+    @staticmethod
+    def merge(user_id):
+        """
+        Keeps the oldest bookmark of each group and deletes the others, with a statement per chunk of groups. The kept
+        bookmark gets the tags of the copies, and the title of the oldest copy with one when it has none.
+
+        The url hash is a prefix of a digest and may collide: the bookmarks of a group are only merged when their
+        canonical urls are equal.
+
+        :return: The number of deleted bookmarks.
+        """
+
+        Bookmark = models.Bookmark
+        groups = Duplicates.report(user_id)
+        deleted = 0
+        for start in range(0, len(groups), IN_CHUNK):
+            chunk = groups[start:start + IN_CHUNK]
+            ids = [bookmark_id for group in chunk for bookmark_id in group.ids]
+            bookmarks = dict((b.id, b) for b in Bookmark.query.filter(Bookmark.id.in_(ids)))
+
+            copies = []
+            for group in chunk:
+                same_urls = OrderedDict()
+                for bookmark_id in group.ids:
+                    bookmark = bookmarks[bookmark_id]
+                    same_urls.setdefault(normalize_url(bookmark.url), []).append(bookmark)
+                for same in same_urls.values():
+                    Duplicates._merge_into(same[0], same[1:])
+                    copies.extend(copy.id for copy in same[1:])
+            db.session.flush()
+
+            if copies:
+                deleted += Bookmark.query.filter(Bookmark.id.in_(copies)).delete(synchronize_session=False)
+        return deleted
+
+    @staticmethod
+    def _merge_into(kept, copies):
+        names = models.Tag.parse(kept.tags)
+        added = []
+        for copy in copies:
+            for name in (copy.tags or '').split(','):
+                name = name.strip()
+                if name and name.lower() not in names:
+                    names.append(name.lower())
+                    added.append(name)
+            if not kept.title and copy.title:
+                kept.title = copy.title
+
+        if added:
+            kept.tags = ', '.join(([kept.tags] if kept.tags else []) + added)
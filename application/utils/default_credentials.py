@@ -0,0 +1,116 @@
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from application import models
+from . import hashing
+
+# marks a flush that did not touch the default user
+_UNCHANGED = object()
+
+
+class DefaultCredentials:
+    """
+    Class that tracks whether the default login info is still usable.
+
+    The status is computed once and then kept up to date from the session events of the User model, so reading it
+    costs neither a query nor a password hash, unless the password of the default user changed since the last read.
+    """
+
+    username = 'admin'
+    password = 'password'
+
+    # None until computed or after a change that could not be tracked
+    _active = None
+
+    # session.info key holding the status produced by a flush until the transaction ends
+    _pending_key = 'default_credentials_pending'
+
+    @classmethod
+    def is_active(cls):
+        """
+        :return: True if the default username/password pair is valid.
+        """
+
+        if cls._active is None:
+            cls.refresh()
+        return cls._active
+
+    @classmethod
+    def invalidate(cls):
+        """
+        Drops the computed status, the next read recomputes it.
+        """
+
+        cls._active = None
+
+    @classmethod
+    def refresh(cls):
+        """
+        Recomputes the status from the database.
+        """
+
+        cls._active = cls._check_user(models.User.query.filter_by(username=cls.username).first())
+
+    @classmethod
+    def _check_user(cls, user):
+        return user is not None and user.username == cls.username and \
+            hashing.check_password(user.password, cls.password)
+
+    @classmethod
+    def _flushed_status(cls, session):
+        """
+        Computes the status resulting from the users flushed by the session. A new password of the default user is
+        checked on the next read: the hashing pool may be busy, which must not fail the flush.
+
+        :return: The new status, None if it must be recomputed or _UNCHANGED if no default user was involved.
+        """
+
+        status = _UNCHANGED
+        for obj in session.deleted:
+            if isinstance(obj, models.User) and obj.username == cls.username:
+                status = False
+
+        for obj in session.new | session.dirty:
+            if not isinstance(obj, models.User):
+                continue
+
+            state = inspect(obj)
+            if obj in session.new or state.attrs.password.history.has_changes() \
+                    or state.attrs.username.history.has_changes():
+                if obj.username == cls.username:
+                    status = None
+                elif cls.username in (state.attrs.username.history.deleted or ()):
+                    # the default user was renamed
+                    status = False
+        return status
+
+    @classmethod
+    def _apply_pending(cls, session):
+        pending = session.info.pop(cls._pending_key, _UNCHANGED)
+        if pending is not _UNCHANGED:
+            cls._active = pending
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_flushed_users(session, flush_context):
+    status = DefaultCredentials._flushed_status(session)
+    if status is not _UNCHANGED:
+        session.info[DefaultCredentials._pending_key] = status
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def _track_bulk_users(context):
+    # bulk queries don't report the affected rows, recompute on the next read
+    if context.mapper is not None and context.mapper.class_ is models.User:
+        context.session.info[DefaultCredentials._pending_key] = None
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_tracked_users(session):
+    DefaultCredentials._apply_pending(session)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_tracked_users(session, previous_transaction):
+    session.info.pop(DefaultCredentials._pending_key, None)
@@ -0,0 +1,175 @@
+import calendar
+import heapq
+import json
+import zlib
+from html import escape
+
+from sqlalchemy import func
+
+from application import db, models
+from application.models.folder import ROOT_PATH, path_range, path_segment
+from config import ActiveConfig
+
+# events produced while walking the tree
+OPEN_FOLDER, CLOSE_FOLDER, BOOKMARK = 'open', 'close', 'bookmark'
+
+
+class BookmarkExport:
+    """
+    Class that contains methods for streaming the bookmarks of an user as a document.
+
+    Folders and bookmarks are read with two server side cursors, each ordered by path, and merged into a depth first
+    walk of the tree, so memory use does not depend on the number of bookmarks.
+    """
+
+    formats = ('html', 'json')
+
+    mimetypes = {
+        'html': 'text/html',
+        'json': 'application/json'
+    }
+
+    @staticmethod
+    def walk(user_id, root=None):
+        """
+        Walks the tree of an user depth first. The bookmarks of a folder come before its subfolders.
+
+        :param root: The folder to export, None for the whole tree.
+
+        :return: A generator of (event, row) pairs; rows are None for CLOSE_FOLDER events.
+        """
+
+        root_path = root.full_path if root is not None else ROOT_PATH
+        start, end = path_range(root_path)
+        batch = ActiveConfig.EXPORT_BATCH_SIZE
+
+        folder_key = models.Folder.path + func.printf('%08x/', models.Folder.id)
+        folders = db.session.query(models.Folder.id, models.Folder.path, models.Folder.title,
+                                   models.Folder.date_added, models.Folder.last_modified) \
+            .filter(models.Folder.user_id == user_id, models.Folder.path >= start, models.Folder.path < end) \
+            .order_by(folder_key).yield_per(batch)
+
+        bookmarks = db.session.query(models.Bookmark.id, models.Bookmark.path, models.Bookmark.position,
+                                     models.Bookmark.title, models.Bookmark.url, models.Bookmark.tags,
+                                     models.Bookmark.date_added, models.Bookmark.last_modified) \
+            .filter(models.Bookmark.user_id == user_id, models.Bookmark.path >= start, models.Bookmark.path < end) \
+            .order_by(models.Bookmark.path, models.Bookmark.position, models.Bookmark.id).yield_per(batch)
+
+        # a folder sorts on its own path, right before the bookmarks it contains
+        merged = heapq.merge(((row.path + path_segment(row.id), 0, 0, row.id, row) for row in folders),
+                             ((row.path, 1, row.position, row.id, row) for row in bookmarks))
+
+        open_paths = [root_path]
+        for key, kind, _, _, row in merged:
+            while open_paths[-1] != row.path:
+                open_paths.pop()
+                yield CLOSE_FOLDER, None
+
+            if kind == 0:
+                open_paths.append(key)
+                yield OPEN_FOLDER, row
+            else:
+                yield BOOKMARK, row
+
+        for _ in range(len(open_paths) - 1):
+            yield CLOSE_FOLDER, None
+
+    @staticmethod
+    def html(events):
+        """
+        Writes the Netscape bookmark file format imported by Firefox and Chrome.
+
+        :return: A generator of text pieces.
+        """
+
+        yield '<!DOCTYPE NETSCAPE-Bookmark-file-1>\n' \
+              '<META HTTP-EQUIV="Content-Type" CONTENT="text/html; charset=UTF-8">\n' \
+              '<TITLE>Bookmarks</TITLE>\n<H1>Bookmarks</H1>\n<DL><p>\n'
+
+        depth = 1
+        for event, row in events:
+            indent = '    ' * depth
+            if event == OPEN_FOLDER:
+                yield '{0}<DT><H3 ADD_DATE="{1}" LAST_MODIFIED="{2}">{3}</H3>\n{0}<DL><p>\n'.format(
+                    indent, _timestamp(row.date_added), _timestamp(row.last_modified), escape(row.title or ''))
+                depth += 1
+            elif event == CLOSE_FOLDER:
+                depth -= 1
+                yield '    ' * depth + '</DL><p>\n'
+            else:
+                tags = ' TAGS="{0}"'.format(escape(row.tags)) if row.tags else ''
+                yield '{0}<DT><A HREF="{1}" ADD_DATE="{2}" LAST_MODIFIED="{3}"{4}>{5}</A>\n'.format(
+                    indent, escape(row.url), _timestamp(row.date_added), _timestamp(row.last_modified), tags,
+                    escape(row.title or ''))
+
+        yield '</DL><p>\n'
+
+    @staticmethod
+    def json(events):
+        """
+        Writes the tree as nested JSON objects: folders have 'children', bookmarks have 'url' and 'tags'.
+
+        :return: A generator of text pieces.
+        """
+
+        yield '{"title": "Bookmarks", "children": ['
+
+        # whether the current folder already has a child, to place the separators
+        has_children = [False]
+        for event, row in events:
+            if event == CLOSE_FOLDER:
+                has_children.pop()
+                yield ']}'
+                continue
+
+            separator = ', ' if has_children[-1] else ''
+            has_children[-1] = True
+
+            if event == OPEN_FOLDER:
+                has_children.append(False)
+                yield separator + json.dumps({'id': row.id, 'title': row.title,
+                                              'date_added': _timestamp(row.date_added)})[:-1] + ', "children": ['
+            else:
+                yield separator + json.dumps({'id': row.id, 'title': row.title, 'url': row.url, 'tags': row.tags,
+                                              'date_added': _timestamp(row.date_added)})
+
+        yield ']}'
+
+    @staticmethod
+    def stream(user_id, fmt, root=None, compress=False):
+        """
+        Streams the export of the bookmarks of an user in chunks of about EXPORT_CHUNK_SIZE bytes.
+
+        :param fmt: One of BookmarkExport.formats.
+
+        :param compress: True to gzip the document on the fly.
+
+        :return: A generator of bytes.
+        """
+
+        pieces = getattr(BookmarkExport, fmt)(BookmarkExport.walk(user_id, root))
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        chunk_size = ActiveConfig.EXPORT_CHUNK_SIZE
+
+        buffer = []
+        size = 0
+        for piece in pieces:
+            buffer.append(piece)
+            size += len(piece)
+            if size >= chunk_size:
+                data = ''.join(buffer).encode('utf-8')
+                buffer = []
+                size = 0
+                data = compressor.compress(data) if compressor else data
+                if data:
+                    yield data
+
+        data = ''.join(buffer).encode('utf-8')
+        if compressor:
+            data = compressor.compress(data) + compressor.flush()
+        if data:
+            yield data
+
+
+def _timestamp(value):
+    return calendar.timegm(value.timetuple()) if value is not None else 0
@@ -0,0 +1,253 @@
+import hashlib
+import logging
+import mmap
+import os
+import re
+import threading
+
+from sqlalchemy import event
+
+from application import db, models
+from config import ActiveConfig
+from .lru import LRUCache
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+PACK_PATTERN = re.compile(r'^pack-(\d+)\.dat$')
+
+# leading bytes of the image formats used for favicons
+SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\x00\x00\x01\x00', 'image/x-icon'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'BM', 'image/bmp'),
+)
+
+
+def sniff_mimetype(data):
+    """
+    :return: The mimetype of an image from its content, None if it is not a known image format.
+    """
+
+    for signature, mimetype in SIGNATURES:
+        if data.startswith(signature):
+            return mimetype
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    head = data[:256].lstrip().lower()
+    if head.startswith(b'<svg') or (head.startswith(b'<?xml') and b'<svg' in head):
+        return 'image/svg+xml'
+    return None
+
+
+class FaviconStore(object):
+    """
+    Content addressed store of favicons, kept out of the database.
+
+    Icons are appended to pack files, a new pack being started when the current one is full, and located by the
+    Favicon rows. Identical icons are stored once. Packs are never modified, so they are read through memory maps and
+    served with immutable cache headers. When the packs outgrow max_bytes the oldest ones are deleted with their
+    icons; the bookmarks keep the digests and get the icon back when it is ingested again.
+    """
+
+    def __init__(self, directory, pack_size=None, max_bytes=None, max_icon_size=None):
+        self.directory = directory
+        self.pack_size = pack_size or ActiveConfig.FAVICON_PACK_SIZE
+        self.max_bytes = max_bytes or ActiveConfig.FAVICON_MAX_BYTES
+        self.max_icon_size = max_icon_size or ActiveConfig.FAVICON_MAX_ICON_SIZE
+        # digest -> (pack, offset, size, mimetype), immutable as icons are content addressed
+        self.locations = LRUCache(ActiveConfig.FAVICON_CACHE_SIZE)
+        # pack -> memory map, replaced when the pack has grown
+        self._maps = {}
+        self._maps_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def _pack_path(self, pack):
+        return os.path.join(self.directory, 'pack-{0:06d}.dat'.format(pack))
+
+    def packs(self):
+        """
+        :return: The sorted list of the pack numbers on disk.
+        """
+
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(int(match.group(1)) for match in map(PACK_PATTERN.match, os.listdir(self.directory)) if match)
+
+    def _lock(self):
+        """
+        Locks the store for writing, across processes where fcntl is available.
+
+        :return: The open lock file, to be passed to _release.
+        """
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self._write_lock.acquire()
+        lock_file = open(os.path.join(self.directory, 'write.lock'), 'a')
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def _release(self, lock_file):
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+        self._write_lock.release()
+
+    def add_many(self, icons):
+        """
+        Stores icons, skipping the ones already stored, too large or not images. The Favicon rows are added to the
+        session, committed by the caller.
+
+        :param icons: An iterable of image contents.
+
+        :return: A list with the digest of each icon, None for the skipped ones.
+        """
+
+        digests = []
+        new = {}
+        for data in icons:
+            mimetype = sniff_mimetype(data) if data and len(data) <= self.max_icon_size else None
+            digest = hashlib.sha1(data).hexdigest() if mimetype else None
+            digests.append(digest)
+            if digest:
+                new[digest] = (data, mimetype)
+
+        for i in range(0, len(new), 500):
+            chunk = list(new)[i:i + 500]
+            for (digest,) in db.session.query(models.Favicon.digest).filter(models.Favicon.digest.in_(chunk)):
+                del new[digest]
+
+        if new:
+            self._append(new)
+        return digests
+
+    def add(self, data):
+        """
+        :return: The digest of the stored icon, None if it was skipped.
+        """
+
+        return self.add_many([data])[0]
+
+    def _append(self, icons):
+        rows = []
+        lock_file = self._lock()
+        try:
+            packs = self.packs()
+            pack = packs[-1] if packs else 1
+            out = open(self._pack_path(pack), 'ab')
+            try:
+                for digest, (data, mimetype) in icons.items():
+                    if out.tell() and out.tell() + len(data) > self.pack_size:
+                        out.close()
+                        pack += 1
+                        out = open(self._pack_path(pack), 'ab')
+                    rows.append({'digest': digest, 'pack': pack, 'offset': out.tell(), 'size': len(data),
+                                 'mimetype': mimetype})
+                    out.write(data)
+                out.flush()
+                os.fsync(out.fileno())
+            finally:
+                out.close()
+
+            # another process may have stored the same icon meanwhile, its copy is kept
+            db.session.execute(models.Favicon.__table__.insert().prefix_with('OR IGNORE'), rows)
+            self._evict()
+        finally:
+            self._release(lock_file)
+
+    def _evict(self):
+        """
+        Deletes the oldest packs until the store fits in max_bytes. The pack being written is always kept.
+        """
+
+        packs = self.packs()
+        total = sum(os.path.getsize(self._pack_path(pack)) for pack in packs)
+        for pack in packs[:-1]:
+            if total <= self.max_bytes:
+                break
+            size = os.path.getsize(self._pack_path(pack))
+            models.Favicon.query.filter_by(pack=pack).delete(synchronize_session=False)
+            with self._maps_lock:
+                mapped = self._maps.pop(pack, None)
+            if mapped is not None:
+                mapped.close()
+            os.remove(self._pack_path(pack))
+            total -= size
+            logger.info('Evicted favicon pack %d (%d bytes)', pack, size)
+
+    def locate(self, digest):
+        """
+        :return: The (pack, offset, size, mimetype) location of an icon, None if it is not stored.
+        """
+
+        location = self.locations.get(digest)
+        if location is None:
+            icon = models.Favicon.query.get(digest)
+            if icon is None:
+                return None
+            location = (icon.pack, icon.offset, icon.size, icon.mimetype)
+            self.locations.set(digest, location)
+        return location
+
+    def get(self, digest):
+        """
+        Reads an icon from the memory map of its pack.
+
+        :return: A (content, mimetype) pair, None if the icon is not stored.
+        """
+
+        location = self.locate(digest)
+        if location is None:
+            return None
+
+        pack, offset, size, mimetype = location
+        with self._maps_lock:
+            mapped = self._maps.get(pack)
+            if mapped is None or len(mapped) < offset + size:
+                # packs grow while they are written, map them again
+                try:
+                    with open(self._pack_path(pack), 'rb') as f:
+                        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (OSError, ValueError):
+                    self.locations.pop(digest)
+                    return None
+                previous = self._maps.get(pack)
+                self._maps[pack] = mapped
+                if previous is not None:
+                    previous.close()
+            content = mapped[offset:offset + size]
+
+        return content, mimetype
+
+    def clear(self):
+        """
+        Forgets the cached locations and maps, the pack files are left on disk.
+        """
+
+        self.locations.clear()
+        with self._maps_lock:
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+
+    def stats(self):
+        packs = self.packs()
+        return {'packs': len(packs), 'bytes': sum(os.path.getsize(self._pack_path(pack)) for pack in packs)}
+
+
+favicon_store = FaviconStore(ActiveConfig.FAVICON_DIR)
+
+
+@event.listens_for(db.Model.metadata, 'after_drop')
+def _clear_favicon_store(metadata, connection, **kwargs):
+    # the locations went with the favicons table
+    favicon_store.clear()
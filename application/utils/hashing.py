@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from config import ActiveConfig
+from .metrics import metrics
+
+
+class HashingQueueFull(ServiceUnavailable):
+    """
+    Raised when too many password operations are waiting for a worker, or when an operation outlived the timeout.
+    Rendered by flask as a 503 response.
+    """
+
+    description = 'The server is busy processing logins, please try again later.'
+
+
+class PasswordHasher(object):
+    """
+    Hashes and checks passwords on the calling thread.
+    """
+
+    def hash(self, password):
+        return generate_password_hash(password)
+
+    def check(self, pwhash, password):
+        return check_password_hash(pwhash, password)
+
+    def shutdown(self):
+        pass
+
+
+class PoolPasswordHasher(PasswordHasher):
+    """
+    Hashes and checks passwords in a pool of worker processes, keeping the CPU bound work off the request threads.
+
+    At most max_queue operations may be submitted at the same time; any operation over that limit is rejected with
+    HashingQueueFull instead of queueing up behind the others.
+    """
+
+    def __init__(self, workers=None, max_queue=32, timeout=None):
+        """
+        :param workers: Number of worker processes. Defaults to the number of cores.
+
+        :param max_queue: Maximum number of operations running or waiting for a worker.
+
+        :param timeout: Seconds to wait for the result of an operation.
+        """
+
+        self.workers = workers or os.cpu_count()
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_queue)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _get_executor(self):
+        # the pool is created lazily and recreated in forked processes, worker processes can't be shared
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(self.workers)
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(False):
+            raise HashingQueueFull()
+
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+
+        future.add_done_callback(lambda f: self._slots.release())
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            # the operation keeps its slot until it is done, so a backlog turns into rejections
+            raise HashingQueueFull()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password)
+
+    def check(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown()
+            self._executor = None
+
+
+_hasher = None
+
+
+def get_hasher():
+    """
+    Gets the active password hasher, creating it from the configuration on first use.
+
+    A HASHING_WORKERS value of 0 selects the synchronous hasher.
+    """
+
+    global _hasher
+    if _hasher is None:
+        if ActiveConfig.HASHING_WORKERS == 0:
+            _hasher = PasswordHasher()
+        else:
+            _hasher = PoolPasswordHasher(ActiveConfig.HASHING_WORKERS, ActiveConfig.HASHING_QUEUE_SIZE,
+                                         ActiveConfig.HASHING_TIMEOUT)
+    return _hasher
+
+
+def set_hasher(hasher):
+    """
+    Replaces the active password hasher.
+
+    :return: The previous hasher.
+    """
+
+    global _hasher
+    previous, _hasher = _hasher, hasher
+    return previous
+
+
+def hash_password(password):
+    start = time.perf_counter()
+    try:
+        return get_hasher().hash(password)
+    finally:
+        metrics.observe('password_hash_duration_seconds', (('op', 'hash'),), time.perf_counter() - start)
+
+
+def check_password(pwhash, password):
+    start = time.perf_counter()
+    try:
+        return get_hasher().check(pwhash, password)
+    finally:
+        metrics.observe('password_hash_duration_seconds', (('op', 'check'),), time.perf_counter() - start)
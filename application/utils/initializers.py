@@ -2,6 +2,10 @@ from flask.ext.admin import Admin
 from flask.ext.login import LoginManager
 
 from application import views, models
+from application.utils import DefaultCredentials
+from application.utils.metrics import init_metrics
+from application.utils.query_stats import init_query_stats
+from application.utils.user_cache import user_cache
 from config import ActiveConfig
 
 
@@ -10,30 +14,51 @@ def init_db(db):
     Initializes data in the database if necessary.
     """
 
+    default_title = 'Administrator'
+
+    # the default login warning is computed on its first use, hashing the default password slows down the startup
+    DefaultCredentials.invalidate()
+
+    # a stamped database has the current tables, only check that the administrators were not removed since
+    if db.get_schema_version() == models.SCHEMA_VERSION:
+        admin = db.session.query(models.User.id).join(models.AccessLevel) \
+            .filter(models.AccessLevel.title == default_title).first()
+        if admin is not None:
+            return
+
     # will create database and tables if not exist
     db.create_all()
+    for table, column in models.ADDED_COLUMNS:
+        db.add_column(table, column)
+    for table, index in models.ADDED_INDEXES:
+        db.add_index(table, index)
+    models.Bookmark.fill_url_hashes()
+    models.Tag.fill()
 
-    default_title = 'Administrator'
     # add the default title if missing
-    if models.AccessLevel.query.filter_by(title=default_title).first() is None:
+    default_level = models.AccessLevel.query.filter_by(title=default_title).first()
+    if default_level is None:
         default_level = models.AccessLevel(default_title)
         db.session.add(default_level)
-        db.session.commit()
+        db.session.flush()
 
-    admin_id = models.AccessLevel.query.filter_by(title=default_title).first().id
+    admin_id = default_level.id
 
     # will create a default user if no administrator user exists
     if models.User.query.filter_by(access_level_id=admin_id).first() is None:
-        default_user = models.User.query.filter_by(username='admin').first()
+        default_user = models.User.query.filter_by(username=DefaultCredentials.username).first()
 
         if default_user is None:
             # create user 'admin' if it doesn't exist
-            default_user = models.User('admin', 'password', 'John', 'Smith', admin_id)
+            default_user = models.User(DefaultCredentials.username, DefaultCredentials.password, 'John', 'Smith',
+                                       admin_id)
             db.session.add(default_user)
         else:
             # change access level to default administrator level
             default_user.access_level_id = admin_id
-        db.session.commit()
+
+    db.set_schema_version(models.SCHEMA_VERSION)
+    db.session.commit()
 
 
 # initialize flask login
@@ -49,7 +74,8 @@ def init_login(app):
 
     @login_manager.user_loader
     def load_user(user_id):
-        return models.User.query.get(user_id)
+        # served from a detached snapshot, the database is only hit on a miss
+        return user_cache.get(user_id)
 
 
 def init_admin(app, db):
@@ -66,8 +92,19 @@ def init_admin(app, db):
     # register admin views
     admin.add_view(views.admin_views.AdminUserModelView(models.User, db.session, name='Users'))
     admin.add_view(views.admin_views.AdminModelView(models.AccessLevel, db.session, name='Access Levels'))
+    admin.add_view(views.admin_views.AdminImportView(name='Import'))
+    admin.add_view(views.admin_views.AdminLinksView(name='Links'))
+    admin.add_view(views.admin_views.AdminJobsView(name='Jobs', endpoint='jobs'))
 
 
 def init_app(app):
+    init_query_stats(app)
+    init_metrics(app)
+
     # register views
-    app.add_url_rule('/', view_func=views.main_views.IndexView.as_view('index'))
\ No newline at end of file
+    app.add_url_rule('/', view_func=views.main_views.IndexView.as_view('index'))
+    app.add_url_rule('/favicons/<digest>', view_func=views.main_views.FaviconView.as_view('favicon'))
+    app.add_url_rule('/api/search', view_func=views.api_views.SearchView.as_view('api_search'))
+    app.add_url_rule('/api/sync', view_func=views.api_views.SyncView.as_view('api_sync'))
+    app.add_url_rule('/api/export/<fmt>', view_func=views.api_views.ExportView.as_view('api_export'))
+    app.add_url_rule('/api/rpc', view_func=views.rpc_views.RpcView.as_view('api_rpc'))
\ No newline at end of file
@@ -0,0 +1,634 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, select
+
+from application import app, db, importers, models
+from config import ActiveConfig
+from .dedup import Duplicates
+from .export import BookmarkExport
+from .linkcheck import LinkChecker
+from .metrics import metrics
+from .minhash import NearDuplicates
+
+logger = logging.getLogger(__name__)
+
+metrics.describe('jobs_finished_total', 'counter', 'Background jobs finished, by kind and status.')
+metrics.describe('jobs_queued', 'gauge', 'Background jobs waiting in the queue.')
+metrics.describe('jobs_running', 'gauge', 'Background jobs being run by a worker.')
+
+# seconds between the checks for jobs left running by dead workers and for expired jobs
+MAINTENANCE_INTERVAL = 60
+
+# job id -> JobContext of the jobs running in this process
+_running = {}
+_running_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    """
+    Raised by JobContext.progress once the job was cancelled. Handlers let it propagate, their open transaction is
+    rolled back.
+    """
+
+
+class JobInterrupted(Exception):
+    """
+    Raised by JobContext.progress once the worker process is stopping. The job is queued again without counting the
+    attempt.
+    """
+
+
+class JobContext(object):
+    """
+    Passed to a job handler: the owner of the job, its progress and its cancellation.
+    """
+
+    def __init__(self, job_id, user_id, claim):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.claim = claim
+        self.done = 0
+        self.total = None
+        self.message = None
+        self.cancelled = False
+        self.interrupted = False
+        self._written = time.time()
+
+    def progress(self, done=None, total=None, message=None):
+        """
+        Records the progress of the job and checks whether it was cancelled. The progress is written to the jobs table
+        at most every JOB_PROGRESS_INTERVAL seconds.
+
+        :raise JobCancelled: if the job was cancelled.
+
+        :raise JobInterrupted: if the worker process is stopping.
+        """
+
+        if self.interrupted:
+            raise JobInterrupted()
+        if done is not None:
+            self.done = done
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message
+
+        now = time.time()
+        if not self.cancelled and now - self._written >= ActiveConfig.JOB_PROGRESS_INTERVAL:
+            self._written = now
+            self.flush()
+        if self.cancelled:
+            raise JobCancelled()
+
+    def flush(self):
+        """
+        Writes the progress and reads the cancel flag through a connection of its own, outside of the transactions of
+        the handler.
+        """
+
+        table = models.Job.__table__
+        cancel_requested = select([table.c.cancel_requested]).where(table.c.id == self.job_id)
+
+        # a handler in the middle of a write transaction holds the database lock, the progress waits for the commit
+        if db.session.info.get('writing'):
+            connection = db.engine.connect()
+            try:
+                cancelled = connection.execute(cancel_requested).scalar()
+            finally:
+                connection.close()
+        else:
+            with db.engine.begin() as connection:
+                connection.execute(table.update().where(and_(table.c.id == self.job_id, table.c.claim == self.claim))
+                                   .values(progress=self.done, total=self.total, message=self.message))
+                cancelled = connection.execute(cancel_requested).scalar()
+
+        self.cancelled = self.cancelled or bool(cancelled)
+
+
+class Jobs:
+    """
+    Class that contains methods for the background job queue.
+
+    Jobs are rows of the jobs table, so they survive restarts. Workers claim the oldest job due with a single
+    conditional UPDATE, which makes the claim atomic across threads and processes. A failed attempt is retried after
+    JOB_RETRY_DELAY seconds, doubled for each next attempt, until the job runs out of attempts. Jobs left running by a
+    worker process that exited are queued again by the other workers.
+    """
+
+    # kind -> handler(context, **params), returning a JSON serializable result
+    handlers = {}
+
+    @staticmethod
+    def handler(kind):
+        """
+        Decorator registering the handler of a kind of jobs.
+        """
+
+        def register(fn):
+            Jobs.handlers[kind] = fn
+            return fn
+        return register
+
+    @staticmethod
+    def enqueue(user_id, kind, params=None, files=(), max_attempts=None):
+        """
+        Queues a job and commits the session, the job is durable once this returns.
+
+        :param params: The keyword arguments of the handler, JSON serializable.
+
+        :param files: Paths removed once the job is done, cancelled or expired, e.g. an uploaded file.
+
+        :return: The Job.
+        """
+
+        if kind not in Jobs.handlers:
+            raise ValueError('Unknown job kind: {0}'.format(kind))
+
+        params = dict(params or {})
+        if files:
+            params['files'] = list(files)
+
+        job = models.Job(user_id=user_id, kind=kind, params=json.dumps(params), status=models.Job.QUEUED,
+                         max_attempts=max_attempts or ActiveConfig.JOB_MAX_ATTEMPTS, run_after=datetime.utcnow())
+        db.session.add(job)
+        db.session.commit()
+
+        job_runner.notify()
+        return job
+
+    @staticmethod
+    def claim():
+        """
+        Claims the oldest queued job that is due for this process.
+
+        :return: The claimed Job, None if no job is due.
+        """
+
+        Job = models.Job
+        table = Job.__table__
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+
+        # an alias, a subquery of the updated table would be correlated with the updated row
+        queued = table.alias()
+        due = select([queued.c.id]).where(and_(queued.c.status == Job.QUEUED, queued.c.run_after <= now)) \
+            .order_by(queued.c.id).limit(1).as_scalar()
+        claimed = db.session.execute(table.update().where(and_(table.c.id == due, table.c.status == Job.QUEUED))
+                                     .values(status=Job.RUNNING, worker=os.getpid(), claim=token, started=now,
+                                             attempts=table.c.attempts + 1)).rowcount
+        db.session.commit()
+
+        return Job.query.filter_by(claim=token).first() if claimed else None
+
+    @staticmethod
+    def run_next():
+        """
+        Claims the oldest job due and runs it on the calling thread.
+
+        :return: The finished Job, None if no job was due.
+        """
+
+        job = Jobs.claim()
+        if job is not None:
+            Jobs.run(job)
+        return job
+
+    @staticmethod
+    def run(job):
+        """
+        Runs a claimed job and records its outcome.
+        """
+
+        Job = models.Job
+        params = job.get_params()
+        files = params.pop('files', [])
+        job_id, kind, attempts, max_attempts = job.id, job.kind, job.attempts, job.max_attempts
+        context = JobContext(job_id, job.user_id, job.claim)
+        handler = Jobs.handlers.get(kind)
+
+        with _running_lock:
+            _running[job_id] = context
+        try:
+            if handler is None:
+                raise LookupError('Unknown job kind: {0}'.format(kind))
+            result = handler(context, **params)
+        except JobCancelled:
+            db.session.rollback()
+            status = Jobs._finish(job_id, context, Job.CANCELLED, message='Cancelled.')
+        except JobInterrupted:
+            db.session.rollback()
+            status = Jobs._finish(job_id, context, Job.QUEUED, **Jobs._requeued_values())
+        except Exception as e:
+            db.session.rollback()
+            logger.exception('Job %s #%d failed', kind, job_id)
+            error = '{0}: {1}'.format(type(e).__name__, e)
+            if context.cancelled:
+                status = Jobs._finish(job_id, context, Job.CANCELLED, error=error)
+            elif handler is not None and attempts < max_attempts:
+                delay = ActiveConfig.JOB_RETRY_DELAY * 2 ** (attempts - 1)
+                status = Jobs._finish(job_id, context, Job.QUEUED, error=error,
+                                      run_after=datetime.utcnow() + timedelta(seconds=delay))
+            else:
+                status = Jobs._finish(job_id, context, Job.FAILED, error=error)
+        else:
+            status = Jobs._finish(job_id, context, Job.DONE, result=json.dumps(result))
+        finally:
+            with _running_lock:
+                _running.pop(job_id, None)
+
+        if status is None:
+            # recovered or queued again meanwhile, the job and its files belong to its next attempt
+            return
+        if status in (Job.DONE, Job.CANCELLED):
+            _remove_files(files)
+        metrics.inc('jobs_finished_total', (('kind', kind), ('status', status)))
+
+    @staticmethod
+    def _finish(job_id, context, status, **values):
+        # the claim guards against writing over a job recovered from this worker meanwhile
+        table = models.Job.__table__
+        if status != models.Job.QUEUED:
+            values['finished'] = datetime.utcnow()
+        if context.message is not None:
+            values.setdefault('message', context.message)
+        updated = db.session.execute(table.update().where(and_(table.c.id == job_id, table.c.claim == context.claim))
+                                     .values(status=status, progress=context.done, total=context.total, **values))
+        db.session.commit()
+        return status if updated.rowcount else None
+
+    @staticmethod
+    def _requeued_values():
+        # an interrupted attempt is not counted, the job is claimed again right away
+        return {'attempts': models.Job.__table__.c.attempts - 1, 'worker': None, 'claim': None,
+                'run_after': datetime.utcnow(), 'message': 'Interrupted by a restart, queued again.'}
+
+    @staticmethod
+    def requeue(contexts):
+        """
+        Queues again the jobs still running in this process when it stops, without counting their attempt. The jobs
+        are unclaimed, their workers can't record an outcome anymore.
+
+        :return: The number of queued jobs.
+        """
+
+        table = models.Job.__table__
+        queued = 0
+        with db.engine.begin() as connection:
+            for context in contexts:
+                queued += connection.execute(table.update()
+                                             .where(and_(table.c.id == context.job_id, table.c.claim == context.claim))
+                                             .values(status=models.Job.QUEUED, progress=context.done,
+                                                     total=context.total, **Jobs._requeued_values())).rowcount
+        return queued
+
+    @staticmethod
+    def cancel(job_id):
+        """
+        Cancels a queued job right away, or asks a running one to stop at its next progress report.
+
+        :return: True if the job was queued or running.
+        """
+
+        Job = models.Job
+        table = Job.__table__
+        cancelled = db.session.execute(table.update().where(and_(table.c.id == job_id, table.c.status == Job.QUEUED))
+                                       .values(status=Job.CANCELLED, finished=datetime.utcnow(),
+                                               message='Cancelled.')).rowcount
+        requested = 0
+        if not cancelled:
+            requested = db.session.execute(table.update().where(and_(table.c.id == job_id,
+                                                                     table.c.status == Job.RUNNING))
+                                           .values(cancel_requested=True)).rowcount
+        db.session.commit()
+
+        if cancelled:
+            _remove_files(Job.query.get(job_id).get_params().get('files', []))
+        with _running_lock:
+            context = _running.get(job_id)
+        if context is not None:
+            context.cancelled = True
+        return bool(cancelled or requested)
+
+    @staticmethod
+    def retry(job_id):
+        """
+        Queues a failed job again, with all its attempts.
+
+        :return: True if the job had failed.
+        """
+
+        Job = models.Job
+        table = Job.__table__
+        retried = db.session.execute(table.update().where(and_(table.c.id == job_id, table.c.status == Job.FAILED))
+                                     .values(status=Job.QUEUED, attempts=0, progress=0, total=None, message=None,
+                                             error=None, cancel_requested=False, run_after=datetime.utcnow(),
+                                             finished=None)).rowcount
+        db.session.commit()
+
+        if retried:
+            job_runner.notify()
+        return bool(retried)
+
+    @staticmethod
+    def progress_of(job):
+        """
+        :return: The (done, total, message) progress of a job, live if it runs in this process.
+        """
+
+        with _running_lock:
+            context = _running.get(job.id)
+        if context is not None:
+            return context.done, context.total, context.message
+        return job.progress, job.total, job.message
+
+    @staticmethod
+    def recover():
+        """
+        Queues again the jobs left running by worker processes that exited, or fails those without attempts left.
+
+        :return: The number of recovered jobs.
+        """
+
+        Job = models.Job
+        table = Job.__table__
+        running = db.session.query(Job.id, Job.worker, Job.claim, Job.attempts, Job.max_attempts) \
+            .filter(Job.status == Job.RUNNING).all()
+        db.session.commit()
+
+        recovered = 0
+        for row in running:
+            if row.worker == os.getpid() or _process_alive(row.worker):
+                continue
+            if row.attempts < row.max_attempts:
+                values = {'status': Job.QUEUED, 'run_after': datetime.utcnow()}
+            else:
+                values = {'status': Job.FAILED, 'finished': datetime.utcnow(),
+                          'error': 'The worker process exited while running the job.'}
+            recovered += db.session.execute(table.update().where(and_(table.c.id == row.id,
+                                                                      table.c.claim == row.claim))
+                                            .values(cancel_requested=False, **values)).rowcount
+        db.session.commit()
+
+        if recovered:
+            logger.warning('Recovered %d jobs of exited workers', recovered)
+        return recovered
+
+    @staticmethod
+    def purge(before):
+        """
+        Deletes the jobs finished before a datetime, with their files.
+
+        :return: The number of deleted jobs.
+        """
+
+        Job = models.Job
+        expired = Job.query.filter(Job.status.in_(Job.FINISHED), Job.finished < before).all()
+        for job in expired:
+            files = job.get_params().get('files', [])
+            result = job.get_result()
+            if isinstance(result, dict) and result.get('file'):
+                files.append(result['file'])
+            _remove_files(files)
+            db.session.delete(job)
+        db.session.commit()
+        return len(expired)
+
+    @staticmethod
+    def counts():
+        """
+        :return: A dict of the number of jobs by status.
+        """
+
+        Job = models.Job
+        return dict(db.session.query(Job.status, db.func.count(Job.id)).group_by(Job.status).all())
+
+
+class JobRunner(object):
+    """
+    Pool of worker threads running the queued jobs, each thread with its own session.
+
+    Idle workers poll the queue every JOB_POLL_INTERVAL seconds and are woken up right away by the jobs queued in
+    their process. Forked processes start a pool of their own, threads do not survive a fork.
+    """
+
+    def __init__(self, workers=None, poll_interval=None):
+        """
+        :param workers: Number of worker threads. Defaults to JOB_WORKERS.
+
+        :param poll_interval: Seconds an idle worker waits before polling the queue again. Defaults to
+            JOB_POLL_INTERVAL.
+        """
+
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._threads = []
+        self._pid = None
+        self._stopping = False
+        self._next_maintenance = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+
+    def start(self):
+        """
+        Starts the worker threads of this process, if not started yet.
+        """
+
+        workers = self.workers if self.workers is not None else ActiveConfig.JOB_WORKERS
+        with self._lock:
+            if self._pid == os.getpid() and any(thread.is_alive() for thread in self._threads):
+                return
+            self._pid = os.getpid()
+            self._stopping = False
+            self._threads = [threading.Thread(target=self._work, name='job-worker-{0}'.format(n))
+                             for n in range(workers)]
+            for thread in self._threads:
+                thread.daemon = True
+                thread.start()
+
+    def interrupt(self):
+        """
+        Stops taking jobs and asks the running ones to stop at their next progress report. Usable from a signal
+        handler, it doesn't wait.
+        """
+
+        self._stopping = True
+        with _running_lock:
+            for context in _running.values():
+                context.interrupted = True
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def stop(self, timeout=None):
+        """
+        Stops the worker threads. The running jobs are interrupted at their next progress report and queued again;
+        those still running after the timeout are queued again as well, so a restart costs none of their attempts.
+
+        :param timeout: Seconds to wait for the workers, None to wait for them to finish.
+        """
+
+        self.interrupt()
+        deadline = None if timeout is None else time.time() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(deadline - time.time(), 0))
+
+        with _running_lock:
+            contexts = list(_running.values())
+        if contexts:
+            with app.app_context():
+                logger.warning('Queued again %d jobs still running', Jobs.requeue(contexts))
+
+    def notify(self):
+        """
+        Wakes up an idle worker of this process.
+        """
+
+        with self._wakeup:
+            self._wakeup.notify()
+
+    def _work(self):
+        with app.app_context():
+            while not self._stopping:
+                try:
+                    self._maintain()
+                    job = Jobs.run_next()
+                except Exception:
+                    logger.exception('Job worker failed')
+                    job = None
+                finally:
+                    db.session.remove()
+
+                if job is None:
+                    with self._wakeup:
+                        if not self._stopping:
+                            self._wakeup.wait(self.poll_interval or ActiveConfig.JOB_POLL_INTERVAL)
+
+    def _maintain(self):
+        with self._lock:
+            now = time.time()
+            if now < self._next_maintenance:
+                return
+            self._next_maintenance = now + MAINTENANCE_INTERVAL
+
+        Jobs.recover()
+        Jobs.purge(datetime.utcnow() - timedelta(days=ActiveConfig.JOB_KEEP_DAYS))
+
+
+job_runner = JobRunner()
+
+
+def _process_alive(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # exists, but owned by another user
+        return True
+    return True
+
+
+def _remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+@Jobs.handler('import')
+def import_job(context, path, icons_path=None):
+    """
+    Imports a bookmarks file, see importers.import_file.
+    """
+
+    def progress(rows):
+        context.progress(rows, message='{0} rows imported.'.format(rows))
+
+    stats = importers.import_file(path, context.user_id, icons_path=icons_path, progress=progress)
+    context.done = context.total = stats.rows
+    context.message = 'Imported {0!r}.'.format(stats)
+    return {'folders': stats.folders, 'bookmarks': stats.bookmarks, 'icons': stats.icons, 'skipped': stats.skipped,
+            'seconds': stats.seconds}
+
+
+@Jobs.handler('export')
+def export_job(context, fmt, compress=False):
+    """
+    Writes the export of the bookmarks to a file of JOB_DIR, see BookmarkExport.stream.
+    """
+
+    if fmt not in BookmarkExport.formats:
+        raise ValueError('Unknown export format: {0}'.format(fmt))
+
+    if not os.path.isdir(ActiveConfig.JOB_DIR):
+        os.makedirs(ActiveConfig.JOB_DIR)
+    path = os.path.join(ActiveConfig.JOB_DIR, 'export-{0}.{1}{2}'.format(context.job_id, fmt,
+                                                                         '.gz' if compress else ''))
+    size = 0
+    try:
+        with open(path, 'wb') as f:
+            for chunk in BookmarkExport.stream(context.user_id, fmt, compress=compress):
+                f.write(chunk)
+                size += len(chunk)
+                context.progress(size, message='{0} KB written.'.format(size // 1024))
+    except BaseException:
+        _remove_files([path])
+        raise
+
+    context.message = 'Exported {0} KB.'.format(size // 1024)
+    return {'file': path, 'fmt': fmt, 'compress': compress, 'bytes': size}
+
+
+@Jobs.handler('check-links')
+def check_links_job(context, stale_days=None):
+    """
+    Checks the links of the bookmarks, see LinkChecker.
+    """
+
+    total = models.Bookmark.query.filter_by(user_id=context.user_id).count()
+    db.session.commit()
+    context.progress(0, total)
+
+    def progress(written):
+        context.progress(written, message='{0} of {1} links checked.'.format(written, total))
+
+    checked_before = datetime.utcnow() - timedelta(days=stale_days) if stale_days is not None else None
+    stats = LinkChecker(context.user_id, checked_before=checked_before, progress=progress).run()
+    context.done = stats.checked
+    context.message = 'Checked {0!r}.'.format(stats)
+    return {'checked': stats.checked, 'dead': stats.dead, 'redirected': stats.redirected, 'errors': stats.errors,
+            'seconds': stats.seconds}
+
+
+@Jobs.handler('dedup')
+def dedup_job(context):
+    """
+    Merges the bookmarks saved more than once under the same canonical url, see Duplicates.merge.
+    """
+
+    deleted = Duplicates.merge(context.user_id)
+    db.session.commit()
+    context.message = 'Deleted {0} duplicate bookmarks.'.format(deleted)
+    return {'deleted': deleted}
+
+
+@Jobs.handler('near-dups')
+def near_dups_job(context, rebuild=False):
+    """
+    Clusters the near duplicate bookmarks, see NearDuplicates.
+    """
+
+    stats = NearDuplicates.rebuild(context.user_id) if rebuild else NearDuplicates.update(context.user_id)
+    db.session.commit()
+    clusters = len(NearDuplicates.clusters(context.user_id))
+    context.done = stats.signed
+    context.message = '{0!r}, {1} clusters.'.format(stats, clusters)
+    return {'signed': stats.signed, 'clustered': stats.clustered, 'clusters': clusters, 'seconds': stats.seconds}
@@ -0,0 +1,335 @@
+import asyncio
+import logging
+import ssl
+import time
+from collections import namedtuple, OrderedDict
+from datetime import datetime
+from urllib.parse import urlsplit, urljoin, quote
+
+from sqlalchemy import bindparam, text
+
+from application import db, models
+from config import ActiveConfig
+
+logger = logging.getLogger(__name__)
+
+# status stored for links that could not be reached
+NETWORK_ERROR = 0
+
+# response bodies up to this size are read to keep the connection, larger ones close it
+MAX_DRAINED_BODY = 64 * 1024
+
+_URL_SAFE = '/%:@!$&\'()*+,;=?~'
+
+LinkResult = namedtuple('LinkResult', 'bookmark_id status final_url')
+
+# bookmarks getting another status or final url are logged as updated, the columns have no log trigger, so the
+# responses cached by data version are built again
+LOG_LINK_CHANGE = text('''
+INSERT INTO changes(user_id, entity, entity_id, op, changed)
+SELECT user_id, 'bookmark', id, 'update', CURRENT_TIMESTAMP FROM bookmarks
+WHERE id = :b_id AND (link_status IS NOT :b_status OR link_url IS NOT :b_url)
+''')
+
+
+class LinkCheckStats(object):
+    """
+    Counters of a link check run.
+    """
+
+    def __init__(self):
+        self.checked = 0
+        self.dead = 0
+        self.redirected = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    @property
+    def checks_per_second(self):
+        return self.checked / self.seconds if self.seconds else 0.0
+
+    def __repr__(self):
+        return '{0} links, {1} dead, {2} redirected, {3} unreachable in {4:.2f}s ({5:.0f} checks/sec)'.format(
+            self.checked, self.dead, self.redirected, self.errors, self.seconds, self.checks_per_second)
+
+
+class HttpConnections(object):
+    """
+    Minimal HTTP/1.1 client keeping the connections alive between requests to the same host.
+    """
+
+    def __init__(self, user_agent, max_idle=100):
+        """
+        :param max_idle: The maximum number of idle connections kept, the least recently used are closed first.
+        """
+
+        self.user_agent = user_agent
+        self.max_idle = max_idle
+        self.opened = 0
+        self._idle = OrderedDict()
+        self._ssl = ssl.create_default_context()
+
+    def _acquire(self, key):
+        connections = self._idle.get(key)
+        if connections:
+            connection = connections.pop()
+            if not connections:
+                del self._idle[key]
+            return connection
+        return None
+
+    def _release(self, key, connection):
+        self._idle.setdefault(key, []).append(connection)
+        self._idle.move_to_end(key)
+        while sum(len(c) for c in self._idle.values()) > self.max_idle:
+            _, connections = self._idle.popitem(last=False)
+            for _, writer in connections:
+                writer.close()
+
+    async def request(self, method, url):
+        """
+        Sends a request, without reading more of the response than needed.
+
+        :return: A (status, location header) pair.
+        """
+
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError('Unsupported URL: {0}'.format(url))
+
+        hostname = parts.hostname.encode('idna').decode('ascii')
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        key = (parts.scheme, hostname, port)
+        host = '[{0}]'.format(hostname) if ':' in hostname else hostname
+        if parts.port:
+            host += ':{0}'.format(parts.port)
+
+        # keeps the escaped and reserved characters, escapes the rest
+        target = quote(parts.path or '/', safe=_URL_SAFE)
+        if parts.query:
+            target += '?' + quote(parts.query, safe=_URL_SAFE)
+
+        while True:
+            connection = self._acquire(key)
+            reused = connection is not None
+            if connection is None:
+                connection = await asyncio.open_connection(hostname, port,
+                                                           ssl=self._ssl if parts.scheme == 'https' else None)
+                self.opened += 1
+
+            try:
+                return await self._exchange(key, connection, method, target, host)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                connection[1].close()
+                # the server may have closed an idle connection, retry on a new one
+                if not reused:
+                    raise
+            except BaseException:
+                connection[1].close()
+                raise
+
+    async def _exchange(self, key, connection, method, target, host):
+        reader, writer = connection
+        writer.write('{0} {1} HTTP/1.1\r\nHost: {2}\r\nUser-Agent: {3}\r\nAccept: */*\r\n\r\n'.format(
+            method, target, host, self.user_agent).encode('latin-1'))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed by the server.')
+        version, status = status_line.split(None, 2)[:2]
+        status = int(status)
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = version == b'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        if method != 'HEAD' and status not in (204, 304) and status >= 200:
+            length = headers.get('content-length', '')
+            if length.isdigit() and int(length) <= MAX_DRAINED_BODY:
+                await reader.readexactly(int(length))
+            else:
+                keep_alive = False
+
+        if keep_alive:
+            self._release(key, connection)
+        else:
+            writer.close()
+        return status, headers.get('location')
+
+    def close(self):
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+
+class LinkChecker(object):
+    """
+    Checks the urls of the bookmarks and stores the results in their link_* columns.
+
+    An asyncio pipeline: the bookmarks are read in batches into a bounded queue, 'concurrency' workers check them with
+    at most 'per_host' requests to the same host at a time, and the results are written back in batches. Each link is
+    requested with HEAD, then with GET if the server refuses HEAD, following up to LINKCHECK_MAX_REDIRECTS redirects.
+    """
+
+    def __init__(self, user_id=None, concurrency=None, per_host=None, timeout=None, batch_size=None,
+                 checked_before=None, progress=None):
+        """
+        :param user_id: The owner of the checked bookmarks, None for all users.
+
+        :param checked_before: Only check the links not checked since this datetime, None to check all of them.
+
+        :param progress: Callable receiving the number of results written so far after each batch. An exception it
+            raises stops the run.
+        """
+
+        self.user_id = user_id
+        self.concurrency = concurrency or ActiveConfig.LINKCHECK_CONCURRENCY
+        self.per_host = per_host or ActiveConfig.LINKCHECK_PER_HOST
+        self.timeout = timeout or ActiveConfig.LINKCHECK_TIMEOUT
+        self.batch_size = batch_size or ActiveConfig.LINKCHECK_BATCH_SIZE
+        self.checked_before = checked_before
+        self.progress = progress
+        self.written = 0
+        self.connections = None
+        self._hosts = {}
+
+    def run(self):
+        """
+        :return: The LinkCheckStats of the run.
+        """
+
+        stats = LinkCheckStats()
+        start = time.time()
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self._run(stats))
+        finally:
+            loop.close()
+
+        stats.seconds = time.time() - start
+        logger.info('Checked links: %r', stats)
+        return stats
+
+    def _query(self):
+        query = db.session.query(models.Bookmark.id, models.Bookmark.url)
+        if self.user_id is not None:
+            query = query.filter(models.Bookmark.user_id == self.user_id)
+        if self.checked_before is not None:
+            query = query.filter((models.Bookmark.link_checked == None) |  # noqa: E711
+                                 (models.Bookmark.link_checked < self.checked_before))
+        return query.order_by(models.Bookmark.id)
+
+    async def _run(self, stats):
+        self.connections = HttpConnections(ActiveConfig.LINKCHECK_USER_AGENT, ActiveConfig.LINKCHECK_MAX_IDLE)
+        queue = asyncio.Queue(self.concurrency * 2)
+        results = []
+        workers = [asyncio.ensure_future(self._worker(queue, results, stats)) for _ in range(self.concurrency)]
+
+        try:
+            # batches by id, so no read cursor stays open across the writes
+            last_id = 0
+            query = self._query()
+            while True:
+                rows = query.filter(models.Bookmark.id > last_id).limit(self.batch_size).all()
+                db.session.commit()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+
+                for row in rows:
+                    await queue.put(row)
+                    if len(results) >= self.batch_size:
+                        self._write(results)
+
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+            self._write(results)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            self.connections.close()
+
+    async def _worker(self, queue, results, stats):
+        while True:
+            row = await queue.get()
+            if row is None:
+                return
+
+            host = (urlsplit(row.url).hostname or '').lower()
+            limit = self._hosts.get(host)
+            if limit is None:
+                limit = self._hosts[host] = [asyncio.Semaphore(self.per_host), 0]
+            limit[1] += 1
+
+            try:
+                async with limit[0]:
+                    status, final_url = await asyncio.wait_for(self.check(row.url), self.timeout)
+            except (asyncio.TimeoutError, OSError, ValueError, asyncio.IncompleteReadError) as e:
+                logger.debug('%s: %r', row.url, e)
+                status, final_url = NETWORK_ERROR, None
+                stats.errors += 1
+            finally:
+                limit[1] -= 1
+                if not limit[1]:
+                    del self._hosts[host]
+
+            stats.checked += 1
+            if status == NETWORK_ERROR or status >= 400:
+                stats.dead += 1
+            if final_url is not None and final_url != row.url:
+                stats.redirected += 1
+            else:
+                final_url = None
+            results.append(LinkResult(row.id, status, final_url))
+
+    async def check(self, url):
+        """
+        Checks an url, following the redirects.
+
+        :return: A (status, final url) pair.
+        """
+
+        method = 'HEAD'
+        redirects = 0
+        while True:
+            status, location = await self.connections.request(method, url)
+
+            # some servers refuse or mishandle HEAD
+            if method == 'HEAD' and status >= 400:
+                method = 'GET'
+                continue
+
+            if 300 <= status < 400 and location and redirects < ActiveConfig.LINKCHECK_MAX_REDIRECTS:
+                url = urljoin(url, location)
+                redirects += 1
+                method = 'HEAD'
+                continue
+
+            return status, url
+
+    def _write(self, results):
+        if not results:
+            return
+
+        table = models.Bookmark.__table__
+        checked = datetime.utcnow()
+        rows = [{'b_id': r.bookmark_id, 'b_status': r.status, 'b_url': r.final_url, 'b_checked': checked}
+                for r in results]
+        db.session.execute(LOG_LINK_CHANGE, rows)
+        db.session.execute(table.update().where(table.c.id == bindparam('b_id')).values(
+            link_status=bindparam('b_status'), link_url=bindparam('b_url'), link_checked=bindparam('b_checked')), rows)
+        db.session.commit()
+        self.written += len(results)
+        del results[:]
+
+        if self.progress is not None:
+            self.progress(self.written)
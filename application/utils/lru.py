@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Thread safe, size bounded LRU cache with an optional time to live for the entries.
+    """
+
+    def __init__(self, max_size=1024, ttl=None, clock=time.time, max_weight=None, weigher=None):
+        """
+        :param max_size: The maximum number of entries kept before the least recently used one is evicted.
+
+        :param ttl: Seconds after which an entry is considered expired. None disables expiry.
+
+        :param clock: Callable returning the current time in seconds.
+
+        :param max_weight: The maximum total weight of the entries, e.g. their size in bytes. None disables the limit.
+
+        :param weigher: Callable returning the weight of a value.
+        """
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.max_weight = max_weight
+        self.weigher = weigher
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Gets the value stored for the key and marks it as recently used.
+
+        :return: The stored value or default if missing or expired.
+        """
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires, weight = entry
+                if expires is None or expires > self.clock():
+                    # move to the most recently used position
+                    del self._data[key]
+                    self._data[key] = entry
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self.weight -= weight
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """
+        Stores the value for the key, evicting the least recently used entries if the cache is full.
+        """
+
+        expires = self.clock() + self.ttl if self.ttl is not None else None
+        weight = self.weigher(value) if self.weigher is not None else 0
+        if self.max_weight is not None and weight > self.max_weight:
+            self.pop(key)
+            return
+
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.weight -= previous[2]
+            self._data[key] = (value, expires, weight)
+            self.weight += weight
+            while len(self._data) > self.max_size or (self.max_weight is not None and self.weight > self.max_weight):
+                self.weight -= self._data.popitem(last=False)[1][2]
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is not None:
+                self.weight -= entry[2]
+        return default if entry is None else entry[0]
+
+    def discard_if(self, predicate):
+        """
+        Removes all entries for which predicate(key, value) is true.
+
+        :return: The number of removed entries.
+        """
+
+        with self._lock:
+            keys = [k for k, (v, _, _) in self._data.items() if predicate(k, v)]
+            for key in keys:
+                self.weight -= self._data.pop(key)[2]
+        return len(keys)
+
+    def items(self):
+        """
+        :return: A list of the (key, value) pairs, least recently used first, without marking them as used.
+        """
+
+        with self._lock:
+            return [(key, entry[0]) for key, entry in self._data.items()]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def stats(self):
+        return {'size': len(self._data), 'max_size': self.max_size, 'weight': self.weight, 'hits': self.hits,
+                'misses': self.misses}
+
+    def __len__(self):
+        return len(self._data)
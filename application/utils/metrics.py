@@ -0,0 +1,277 @@
+import threading
+import time
+import weakref
+from bisect import bisect_left
+
+from flask import g, request, Response
+
+from config import ActiveConfig
+
+# latency buckets in seconds, an overflow bucket is added for +Inf
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Shard(object):
+    """
+    Metric values written by a single thread.
+    """
+
+    __slots__ = ('counters', 'histograms')
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+
+class _ShardOwner(object):
+    """
+    Thread local reference to the shard of a thread, collected when the thread exits.
+    """
+
+    __slots__ = ('shard', '__weakref__')
+
+    def __init__(self, shard):
+        self.shard = shard
+
+
+class Metrics(object):
+    """
+    Registry of counters, gauges and histograms.
+
+    Every thread writes to its own shard, so recording a value takes no lock; the shards are only merged when the
+    metrics are collected. The shard of an exited thread is folded into a base shard, so short lived threads do not
+    pile up shards.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.descriptions = {}
+        self.collectors = []
+        self._local = threading.local()
+        self._base = _Shard()
+        self._shards = [self._base]
+        # shards of exited threads, appended by the finalizers, which may run in any thread and can't take the lock
+        self._retired = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, metric_type, help_text):
+        self.descriptions[name] = (metric_type, help_text)
+
+    def _shard(self):
+        owner = getattr(self._local, 'owner', None)
+        if owner is None:
+            shard = _Shard()
+            owner = self._local.owner = _ShardOwner(shard)
+            # the thread locals of a thread are released when it exits
+            weakref.finalize(owner, self._retired.append, shard)
+            with self._lock:
+                self._fold_retired()
+                self._shards.append(shard)
+        return owner.shard
+
+    def _fold_retired(self):
+        """
+        Merges the shards of the exited threads into the base shard. Must be called with the lock held.
+        """
+
+        while self._retired:
+            shard = self._retired.pop()
+            self._shards.remove(shard)
+            self._merge(self._base.counters, self._base.histograms, shard)
+
+    @staticmethod
+    def _merge(counters, histograms, shard):
+        for key, value in list(shard.counters.items()):
+            counters[key] = counters.get(key, 0) + value
+        for key, values in list(shard.histograms.items()):
+            merged = histograms.get(key)
+            histograms[key] = list(values) if merged is None else [a + b for a, b in zip(merged, values)]
+
+    def inc(self, name, labels=(), value=1):
+        """
+        Adds to a counter, or to a gauge when value is negative.
+        """
+
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        """
+        Records a value in a histogram.
+        """
+
+        histograms = self._shard().histograms
+        key = (name, labels)
+        values = histograms.get(key)
+        if values is None:
+            # bucket counts, then the overflow bucket, the sum and the count
+            values = histograms[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        values[bisect_left(self.buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    def register_collector(self, collector):
+        """
+        Registers a callable returning (name, labels, value) samples computed when the metrics are collected.
+        """
+
+        self.collectors.append(collector)
+
+    def collect(self):
+        """
+        Merges the values of all threads.
+
+        :return: A (counters, histograms) pair of dicts keyed on (name, labels).
+        """
+
+        counters = {}
+        histograms = {}
+
+        # a shard folded in the middle of the merge would be counted twice
+        with self._lock:
+            self._fold_retired()
+            for shard in self._shards:
+                self._merge(counters, histograms, shard)
+
+        for collector in self.collectors:
+            for name, labels, value in collector():
+                counters[(name, labels)] = value
+
+        return counters, histograms
+
+    def render(self):
+        """
+        :return: The metrics in the Prometheus text exposition format.
+        """
+
+        counters, histograms = self.collect()
+        lines = []
+        described = set()
+
+        def header(name):
+            if name not in described and name in self.descriptions:
+                metric_type, help_text = self.descriptions[name]
+                lines.append('# HELP {0} {1}'.format(name, help_text))
+                lines.append('# TYPE {0} {1}'.format(name, metric_type))
+            described.add(name)
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name)
+            lines.append('{0}{1} {2}'.format(name, _format_labels(labels), _format_value(value)))
+
+        for (name, labels), values in sorted(histograms.items()):
+            header(name)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('{0}_bucket{1} {2}'.format(name, _format_labels(labels + (('le', le),)), cumulative))
+            lines.append('{0}_sum{1} {2}'.format(name, _format_labels(labels), _format_value(values[-2])))
+            lines.append('{0}_count{1} {2}'.format(name, _format_labels(labels), values[-1]))
+
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                          for k, v in labels) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+metrics = Metrics()
+metrics.describe('http_requests_total', 'counter', 'Requests by endpoint, method and status.')
+metrics.describe('http_requests_in_flight', 'gauge', 'Requests being processed.')
+metrics.describe('http_request_duration_seconds', 'histogram', 'Request latency by endpoint.')
+metrics.describe('db_queries_total', 'counter', 'SQL queries by endpoint.')
+metrics.describe('db_request_duration_seconds', 'histogram', 'SQL time per request by endpoint.')
+metrics.describe('password_hash_duration_seconds', 'histogram', 'Password hash and check latency.')
+metrics.describe('auth_cache_hits_total', 'counter', 'Verified credential cache hits.')
+metrics.describe('auth_cache_misses_total', 'counter', 'Verified credential cache misses.')
+metrics.describe('user_cache_hits_total', 'counter', 'User snapshot cache hits.')
+metrics.describe('user_cache_misses_total', 'counter', 'User snapshot cache misses.')
+metrics.describe('tag_index_bytes', 'gauge', 'Memory used by the tag bitmaps of an user.')
+metrics.describe('tag_index_tags', 'gauge', 'Tags of an user in the tag index.')
+metrics.describe('tree_snapshot_bytes', 'gauge', 'Memory used by the tree snapshot of an user.')
+metrics.describe('login_password_checks_total', 'counter', 'Password checks run by the login throttle.')
+metrics.describe('login_hash_seconds_saved_total', 'counter', 'Estimated hashing time saved by refused checks.')
+
+
+def init_metrics(app):
+    """
+    Records the latency, status and database time of every request and serves the metrics at /metrics.
+
+    :param app: The Flask instance.
+    """
+
+    from .authentication import Authentication
+    from .jobs import Jobs
+    from .tags import tag_index
+    from .throttle import login_throttle
+    from .tree import tree_cache
+    from .user_cache import user_cache
+
+    def cache_stats():
+        auth, users = Authentication.credential_cache.stats(), user_cache.stats()
+        return [('auth_cache_hits_total', (), auth['hits']), ('auth_cache_misses_total', (), auth['misses']),
+                ('user_cache_hits_total', (), users['hits']), ('user_cache_misses_total', (), users['misses'])]
+
+    def index_stats():
+        for user_id, tags, nbytes in tag_index.stats():
+            yield 'tag_index_bytes', (('user', user_id),), nbytes
+            yield 'tag_index_tags', (('user', user_id),), tags
+        for user_id, nbytes in tree_cache.stats():
+            yield 'tree_snapshot_bytes', (('user', user_id),), nbytes
+
+    def throttle_stats():
+        logins = login_throttle.stats()
+        return [('login_password_checks_total', (), logins['checks']),
+                ('login_hash_seconds_saved_total', (), logins['seconds_saved'])]
+
+    def job_stats():
+        counts = Jobs.counts()
+        return [('jobs_queued', (), counts.get('queued', 0)), ('jobs_running', (), counts.get('running', 0))]
+
+    metrics.register_collector(cache_stats)
+    metrics.register_collector(throttle_stats)
+    metrics.register_collector(index_stats)
+    metrics.register_collector(job_stats)
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_start = time.perf_counter()
+        metrics.inc('http_requests_in_flight')
+
+    @app.after_request
+    def record_request_metrics(response):
+        start = g.get('metrics_start')
+        if start is None:
+            return response
+        g.metrics_start = None
+
+        endpoint = (('endpoint', request.endpoint or 'unknown'),)
+        metrics.inc('http_requests_in_flight', value=-1)
+        metrics.observe('http_request_duration_seconds', endpoint, time.perf_counter() - start)
+        metrics.inc('http_requests_total', endpoint + (('method', request.method), ('status', response.status_code)))
+
+        stats = g.get('query_stats')
+        if stats is not None:
+            metrics.inc('db_queries_total', endpoint, stats.count)
+            metrics.observe('db_request_duration_seconds', endpoint, stats.seconds)
+        return response
+
+    @app.teardown_request
+    def discard_request_metrics(exc):
+        # requests failing before after_request still leave the in flight gauge
+        if g.get('metrics_start') is not None:
+            g.metrics_start = None
+            metrics.inc('http_requests_in_flight', value=-1)
+
+    if ActiveConfig.METRICS_ENABLED:
+        app.add_url_rule('/metrics', 'metrics',
+                         lambda: Response(metrics.render(), mimetype='text/plain; version=0.0.4'))
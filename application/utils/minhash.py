@@ -0,0 +1,272 @@
+import hashlib
+import random
+import re
+import time
+from array import array
+from collections import defaultdict
+from urllib.parse import urlsplit
+import zlib
+
+from application import db, models
+from config import ActiveConfig
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# prime above 2^32: (a * x + b) stays under 2^64 for 32 bit a, b and x, so numpy computes it without overflow
+PRIME = 4294967311
+MAX_HASH = 0xffffffff
+
+# lookups of bucket and bookmark ids are chunked below the sqlite variable limit
+IN_CHUNK = 500
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+_URL_NOISE = frozenset(('www', 'http', 'https', 'com', 'org', 'net', 'html', 'htm', 'php', 'index'))
+
+
+def shingles(title, url):
+    """
+    Gets the features compared between bookmarks: the words of the title and the tokens of the url, alone and in
+    pairs of neighbours, kept apart so a title word does not match an url token. The host tokens are not paired, so
+    a mirror only differs from the original page by its host words.
+
+    :return: A set of 32 bit integers.
+    """
+
+    try:
+        parts = urlsplit(url or '')
+        host, url_text = parts.hostname or '', ' '.join((parts.path, parts.query))
+    except ValueError:
+        host, url_text = '', url or ''
+
+    features = set()
+    for prefix, text, paired in (('t', title or '', True), ('h', host, False), ('u', url_text, True)):
+        tokens = [t for t in _WORD.findall(text.lower()) if prefix == 't' or t not in _URL_NOISE]
+        features.update(prefix + ' ' + t for t in tokens)
+        if paired:
+            features.update(prefix + ' ' + a + ' ' + b for a, b in zip(tokens, tokens[1:]))
+    return {zlib.crc32(f.encode('utf-8')) for f in features}
+
+
+class MinHasher(object):
+    """
+    Computes MinHash signatures: the minimum of each of num_perm hash functions (a * x + b) mod PRIME over the
+    features, stored as compact arrays of 32 bit integers. The share of equal positions of two signatures estimates
+    the Jaccard similarity of their feature sets.
+    """
+
+    def __init__(self, num_perm=None, seed=1, vectorized=None):
+        """
+        :param vectorized: True to compute with numpy, defaults to whether numpy is installed. Both ways give the same
+        signatures.
+        """
+
+        self.num_perm = num_perm or ActiveConfig.MINHASH_PERMUTATIONS
+        self.vectorized = numpy is not None if vectorized is None else vectorized
+
+        rnd = random.Random(seed)
+        self.a = [rnd.randint(1, MAX_HASH) for _ in range(self.num_perm)]
+        self.b = [rnd.randint(0, MAX_HASH) for _ in range(self.num_perm)]
+        if self.vectorized:
+            self._a = numpy.array(self.a, dtype=numpy.uint64)
+            self._b = numpy.array(self.b, dtype=numpy.uint64)
+
+    def signature(self, features):
+        """
+        :return: An array('I') of num_perm values.
+        """
+
+        if not features:
+            return array('I', [MAX_HASH] * self.num_perm)
+
+        if self.vectorized:
+            x = numpy.fromiter(features, dtype=numpy.uint64, count=len(features))
+            values = (x[:, None] * self._a + self._b) % numpy.uint64(PRIME) & numpy.uint64(MAX_HASH)
+            return array('I', values.min(axis=0).astype(numpy.uint32).tobytes())
+
+        return array('I', [min(((a * x + b) % PRIME) & MAX_HASH for x in features) for a, b in zip(self.a, self.b)])
+
+    def similarity(self, first, second):
+        if self.vectorized:
+            return numpy.count_nonzero(numpy.frombuffer(first, dtype=numpy.uint32) ==
+                                       numpy.frombuffer(second, dtype=numpy.uint32)) / float(self.num_perm)
+        return sum(1 for x, y in zip(first, second) if x == y) / float(self.num_perm)
+
+
+def band_keys(signature, bands):
+    """
+    Splits a signature in bands and hashes each of them. Signatures with a similarity s share at least one band key
+    with a probability of 1 - (1 - s^rows)^bands.
+
+    :return: A list of signed 64 bit integers, one per band.
+    """
+
+    rows = len(signature) // bands
+    data = signature.tobytes()
+    size = rows * signature.itemsize
+    return [int.from_bytes(hashlib.sha1(data[i * size:(i + 1) * size]).digest()[:8], 'big', signed=True)
+            for i in range(bands)]
+
+
+def _chunks(items, size=IN_CHUNK):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class ClusterStats(object):
+    """
+    Counters of a clustering run.
+    """
+
+    def __init__(self):
+        self.signed = 0
+        self.clustered = 0
+        self.seconds = 0.0
+
+    @property
+    def bookmarks_per_second(self):
+        return self.signed / self.seconds if self.seconds else 0.0
+
+    def __repr__(self):
+        return '{0} bookmarks signed, {1} joined a cluster in {2:.2f}s ({3:.0f} bookmarks/sec)'.format(
+            self.signed, self.clustered, self.seconds, self.bookmarks_per_second)
+
+
+class NearDuplicates:
+    """
+    Class that contains methods for clustering the near duplicate bookmarks of an user.
+
+    Each bookmark is filed under the keys of the bands of its signature (locality sensitive hashing). A new bookmark
+    is only compared with the bookmarks sharing one of its buckets, so a run costs about the same per new bookmark
+    whatever the size of the collection, and only the bookmarks without a signature are processed.
+    """
+
+    @staticmethod
+    def update(user_id, hasher=None, batch_size=None):
+        """
+        Signs the bookmarks of an user without a signature and files them into the clusters.
+
+        :return: A ClusterStats instance.
+        """
+
+        hasher = hasher or MinHasher()
+        batch_size = batch_size or ActiveConfig.MINHASH_BATCH_SIZE
+        Bookmark, Signature = models.Bookmark, models.BookmarkSignature
+
+        stats = ClusterStats()
+        start = time.time()
+        while True:
+            rows = db.session.query(Bookmark.id, Bookmark.title, Bookmark.url) \
+                .outerjoin(Signature, Signature.bookmark_id == Bookmark.id) \
+                .filter(Bookmark.user_id == user_id, Signature.bookmark_id == None) \
+                .order_by(Bookmark.id).limit(batch_size).all()  # noqa: E711
+            if not rows:
+                break
+
+            stats.clustered += NearDuplicates._add_batch(user_id, rows, hasher)
+            stats.signed += len(rows)
+
+        stats.seconds = time.time() - start
+        return stats
+
+    @staticmethod
+    def _add_batch(user_id, rows, hasher):
+        bands = ActiveConfig.MINHASH_BANDS
+        Bucket, Signature = models.LshBucket, models.BookmarkSignature
+
+        signatures = dict((row.id, hasher.signature(shingles(row.title, row.url))) for row in rows)
+        keys = dict((bookmark_id, band_keys(signature, bands)) for bookmark_id, signature in signatures.items())
+
+        # candidates sharing a bucket, among the filed bookmarks and within the batch
+        candidates = defaultdict(set)
+        for band in range(bands):
+            by_bucket = defaultdict(list)
+            for bookmark_id, bookmark_keys in keys.items():
+                by_bucket[bookmark_keys[band]].append(bookmark_id)
+
+            for chunk in _chunks(by_bucket):
+                for bucket, other_id in db.session.query(Bucket.bucket, Bucket.bookmark_id) \
+                        .filter(Bucket.user_id == user_id, Bucket.band == band, Bucket.bucket.in_(chunk)):
+                    for bookmark_id in by_bucket[bucket]:
+                        candidates[bookmark_id].add(other_id)
+
+            for ids in by_bucket.values():
+                for bookmark_id in ids:
+                    candidates[bookmark_id].update(ids)
+
+        filed = set()
+        for bookmark_id, others in candidates.items():
+            others.discard(bookmark_id)
+            filed.update(other_id for other_id in others if other_id not in signatures)
+
+        # clusters are labelled with their smallest bookmark id, merged with a union find over the labels
+        labels = dict((bookmark_id, bookmark_id) for bookmark_id in signatures)
+        for chunk in _chunks(filed):
+            for bookmark_id, signature, cluster_id in db.session.query(
+                    Signature.bookmark_id, Signature.signature, Signature.cluster_id) \
+                    .filter(Signature.bookmark_id.in_(chunk)):
+                signatures[bookmark_id] = array('I', signature)
+                labels[bookmark_id] = cluster_id
+
+        parents = {}
+
+        def find(label):
+            root = label
+            while parents.get(root, root) != root:
+                root = parents[root]
+            while label != root:
+                parents[label], label = root, parents.get(label, label)
+            return root
+
+        threshold = ActiveConfig.MINHASH_THRESHOLD
+        matched = set()
+        for bookmark_id, others in candidates.items():
+            for other_id in others:
+                if hasher.similarity(signatures[bookmark_id], signatures[other_id]) >= threshold:
+                    matched.add(bookmark_id)
+                    first, second = find(labels[bookmark_id]), find(labels[other_id])
+                    if first != second:
+                        parents[max(first, second)] = min(first, second)
+
+        # existing clusters merged into another one
+        for label in set(labels[bookmark_id] for bookmark_id in filed):
+            if find(label) != label:
+                Signature.query.filter(Signature.user_id == user_id, Signature.cluster_id == label) \
+                    .update({'cluster_id': find(label)}, synchronize_session=False)
+
+        new_ids = [row.id for row in rows]
+        db.session.execute(Signature.__table__.insert(), [
+            {'bookmark_id': bookmark_id, 'user_id': user_id, 'signature': signatures[bookmark_id].tobytes(),
+             'cluster_id': find(labels[bookmark_id])} for bookmark_id in new_ids])
+        db.session.execute(Bucket.__table__.insert(), [
+            {'user_id': user_id, 'band': band, 'bucket': key, 'bookmark_id': bookmark_id}
+            for bookmark_id in new_ids for band, key in enumerate(keys[bookmark_id])])
+
+        return len(matched)
+
+    @staticmethod
+    def clusters(user_id):
+        """
+        :return: A list of the clusters of an user with more than one bookmark, each a sorted list of bookmark ids.
+        """
+
+        Signature = models.BookmarkSignature
+        rows = db.session.query(db.func.group_concat(Signature.bookmark_id)) \
+            .filter(Signature.user_id == user_id).group_by(Signature.cluster_id) \
+            .having(db.func.count(Signature.bookmark_id) > 1)
+        return [sorted(int(i) for i in row[0].split(',')) for row in rows]
+
+    @staticmethod
+    def rebuild(user_id, hasher=None):
+        """
+        Drops the signatures and buckets of an user and clusters all the bookmarks again.
+
+        :return: A ClusterStats instance.
+        """
+
+        models.LshBucket.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+        models.BookmarkSignature.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+        return NearDuplicates.update(user_id, hasher)
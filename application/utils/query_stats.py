@@ -0,0 +1,171 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import ActiveConfig
+
+logger = logging.getLogger(__name__)
+
+# collapses the placeholder lists of IN clauses so they share one fingerprint
+IN_LIST_PATTERN = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def fingerprint(statement):
+    """
+    Gets the fingerprint of a SQL statement. Statements are already parameterized, so only IN lists and whitespace
+    need to be normalized.
+    """
+
+    return IN_LIST_PATTERN.sub('(?+)', WHITESPACE_PATTERN.sub(' ', statement).strip())
+
+
+class QueryStats(object):
+    """
+    Queries executed while the collector is active: count, total time and number of executions per fingerprint.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def add(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[fingerprint(statement)] += 1
+
+    def repeated(self, threshold=None):
+        """
+        :return: The (fingerprint, count) pairs executed at least threshold times, the usual sign of N+1 queries.
+        """
+
+        threshold = threshold or ActiveConfig.QUERY_REPEAT_THRESHOLD
+        return [(s, c) for s, c in self.statements.most_common() if c >= threshold]
+
+    def report(self):
+        lines = ['{0} queries in {1:.2f}ms'.format(self.count, self.seconds * 1000)]
+        lines.extend('{0:5d}x {1}'.format(c, s) for s, c in self.statements.most_common())
+        return '\n'.join(lines)
+
+
+_local = threading.local()
+
+
+def _collectors():
+    if not hasattr(_local, 'collectors'):
+        _local.collectors = []
+    return _local.collectors
+
+
+def start():
+    """
+    Starts collecting the queries of the current thread.
+
+    :return: The QueryStats receiving them.
+    """
+
+    stats = QueryStats()
+    _collectors().append(stats)
+    return stats
+
+
+def stop(stats):
+    collectors = _collectors()
+    if stats in collectors:
+        collectors.remove(stats)
+    return stats
+
+
+def current():
+    """
+    :return: The innermost active QueryStats of the current thread or None.
+    """
+
+    collectors = _collectors()
+    return collectors[-1] if collectors else None
+
+
+@contextmanager
+def collect():
+    stats = start()
+    try:
+        yield stats
+    finally:
+        stop(stats)
+
+
+@contextmanager
+def query_budget(max_queries):
+    """
+    Test helper failing with AssertionError if the block runs more than max_queries queries, e.g.:
+
+        with query_budget(3):
+            client.get('/admin/')
+    """
+
+    with collect() as stats:
+        yield stats
+
+    if stats.count > max_queries:
+        raise AssertionError('Query budget of {0} exceeded: {1}'.format(max_queries, stats.report()))
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _collectors():
+        conn.info.setdefault('query_start_time', []).append(time.time())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start_time')
+    if not starts:
+        return
+
+    seconds = time.time() - starts.pop()
+    for stats in _collectors():
+        stats.add(statement, seconds)
+
+
+def init_query_stats(app):
+    """
+    Collects the queries of every request, reporting them in the X-Query-Count and X-Query-Time response headers
+    and in the debug log, and warning about repeated statements.
+
+    :param app: The Flask instance.
+    """
+
+    @app.before_request
+    def start_request_stats():
+        g.query_stats = start()
+
+    @app.after_request
+    def report_request_stats(response):
+        stats = g.get('query_stats')
+        if stats is None:
+            return response
+        stop(stats)
+
+        if ActiveConfig.QUERY_STATS_HEADERS:
+            response.headers['X-Query-Count'] = str(stats.count)
+            response.headers['X-Query-Time'] = '{0:.3f}ms'.format(stats.seconds * 1000)
+
+        logger.debug('%s %s: %s', request.method, request.path, stats.report())
+        for statement, count in stats.repeated():
+            logger.warning('%s %s: statement executed %d times, possible N+1 query: %s',
+                           request.method, request.path, count, statement)
+        return response
+
+    @app.teardown_request
+    def discard_request_stats(exc):
+        stats = g.get('query_stats')
+        if stats is not None:
+            stop(stats)
@@ -0,0 +1,87 @@
+import re
+
+from sqlalchemy import text
+
+from application import db, models
+from config import ActiveConfig
+
+
+SEARCH_QUERY = text('''
+SELECT bookmarks_fts.rowid
+FROM bookmarks_fts JOIN bookmarks ON bookmarks.id = bookmarks_fts.rowid
+WHERE bookmarks_fts MATCH :query AND bookmarks.user_id = :user_id
+ORDER BY bm25(bookmarks_fts, 10.0, 1.0, 5.0)
+LIMIT :limit
+''')
+
+# splits the user input in words, everything else is dropped so no FTS syntax gets through
+WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+class BookmarkSearch:
+    """
+    Class that contains methods for the full text search over the bookmarks.
+    """
+
+    @staticmethod
+    def build_query(terms):
+        """
+        Converts the user input to a FTS5 query matching bookmarks containing all the words, the last word as a prefix.
+
+        :return: The query or None if there are no words to search for.
+        """
+
+        words = WORD_PATTERN.findall(terms or '')
+        if not words:
+            return None
+
+        phrases = ['"{0}"'.format(word) for word in words]
+        phrases[-1] += '*'
+        return ' '.join(phrases)
+
+    @staticmethod
+    def search_ids(user_id, terms, limit=None):
+        """
+        Searches the bookmarks of an user, ranked by BM25 with the title weighted over the tags and the url.
+
+        :return: The list of matching bookmark ids, best match first.
+        """
+
+        query = BookmarkSearch.build_query(terms)
+        if query is None:
+            return []
+
+        limit = min(limit or ActiveConfig.SEARCH_DEFAULT_LIMIT, ActiveConfig.SEARCH_MAX_LIMIT)
+        rows = db.session.execute(SEARCH_QUERY, {'query': query, 'user_id': user_id, 'limit': limit})
+        return [row[0] for row in rows]
+
+    @staticmethod
+    def search(user_id, terms, limit=None):
+        """
+        :return: The list of matching bookmarks, best match first.
+        """
+
+        ids = BookmarkSearch.search_ids(user_id, terms, limit)
+        if not ids:
+            return []
+
+        bookmarks = dict((b.id, b) for b in models.Bookmark.query.filter(models.Bookmark.id.in_(ids)))
+        return [bookmarks[i] for i in ids if i in bookmarks]
+
+    @staticmethod
+    def rebuild():
+        """
+        Rebuilds the whole index from the bookmarks table.
+        """
+
+        db.session.execute("INSERT INTO bookmarks_fts(bookmarks_fts) VALUES ('rebuild')")
+        db.session.commit()
+
+    @staticmethod
+    def optimize():
+        """
+        Merges the index segments left by many small writes, e.g. after a large import.
+        """
+
+        db.session.execute("INSERT INTO bookmarks_fts(bookmarks_fts) VALUES ('optimize')")
+        db.session.commit()
@@ -0,0 +1,154 @@
+import json
+
+from itsdangerous import URLSafeSerializer, BadSignature
+
+from application import models
+from config import ActiveConfig
+from .tree import tree_cache
+
+
+class InvalidSyncToken(ValueError):
+    pass
+
+
+class ExpiredSyncToken(ValueError):
+    pass
+
+
+class ChangeFeed:
+    """
+    Class that contains methods for the delta sync of the bookmarks of an user.
+
+    A sync token is an opaque, signed (user id, sequence number) pair. A client starts with no token, applies the
+    changes it receives and keeps the returned token for the next sync. Folders and bookmarks may reference parents
+    that come later in the feed, clients should apply a whole page before resolving references.
+    """
+
+    serializer = URLSafeSerializer(ActiveConfig.SECRET_KEY, salt='sync-token')
+
+    entities = {
+        'folder': models.Folder,
+        'bookmark': models.Bookmark
+    }
+
+    @staticmethod
+    def make_token(user_id, seq):
+        return ChangeFeed.serializer.dumps([user_id, seq])
+
+    @staticmethod
+    def read_token(user_id, token):
+        """
+        Decodes a sync token of an user.
+
+        :return: The sequence number of the token, 0 for an empty token.
+        """
+
+        if not token:
+            return 0
+
+        try:
+            token_user_id, seq = ChangeFeed.serializer.loads(token)
+        except (BadSignature, TypeError, ValueError):
+            raise InvalidSyncToken('Invalid sync token.')
+
+        if token_user_id != user_id:
+            raise InvalidSyncToken('Invalid sync token.')
+        if seq < models.SyncHorizon.get_seq(user_id):
+            raise ExpiredSyncToken('Sync token expired, a full sync is required.')
+        return seq
+
+    @staticmethod
+    def stream(user_id, seq, limit=None):
+        """
+        Streams the changes of an user after seq as a JSON document:
+        {"changes": [{"seq", "entity", "id", "op", "data"}, ...], "token": next token, "more": true if truncated}.
+
+        'data' holds the current state of the entity, null for deleted entities.
+
+        :return: A generator of JSON text chunks.
+        """
+
+        limit = min(limit or ActiveConfig.SYNC_PAGE_SIZE, ActiveConfig.SYNC_MAX_PAGE_SIZE)
+        chunk_size = ActiveConfig.SYNC_CHUNK_SIZE
+
+        query = models.Change.since(user_id, seq).limit(limit + 1).yield_per(chunk_size)
+        last_seq = seq
+        count = 0
+        more = False
+        chunk = []
+
+        yield '{"changes": ['
+        for change in query:
+            if count == limit:
+                more = True
+                break
+
+            chunk.append(change)
+            count += 1
+            last_seq = change.seq
+            if len(chunk) == chunk_size:
+                yield ChangeFeed._encode_chunk(chunk, count == len(chunk))
+                chunk = []
+
+        if chunk:
+            yield ChangeFeed._encode_chunk(chunk, count == len(chunk))
+
+        yield '], "token": {0}, "more": {1}}}'.format(json.dumps(ChangeFeed.make_token(user_id, last_seq)),
+                                                      json.dumps(more))
+
+    @staticmethod
+    def stream_snapshot(user_id):
+        """
+        Streams the whole tree of an user for a first sync, in the same document as stream: every folder and bookmark
+        as an insert, parents first, in one page. The tree is read from the snapshot shared by the requests of the
+        worker, no ORM object is loaded.
+
+        :return: A generator of JSON text chunks.
+        """
+
+        snapshot = tree_cache.get(user_id)
+        chunk_size = ActiveConfig.SYNC_CHUNK_SIZE
+
+        def items():
+            for i in range(1, len(snapshot.folder_ids)):
+                yield 'folder', snapshot.folder_dict(i)
+            for k in range(len(snapshot.bookmark_ids)):
+                yield 'bookmark', snapshot.bookmark_dict(k)
+
+        yield '{"changes": ['
+        chunk = []
+        is_first = True
+        for entity, data in items():
+            chunk.append(json.dumps({'seq': snapshot.version, 'entity': entity, 'id': data['id'],
+                                     'op': models.Change.INSERT, 'data': data}))
+            if len(chunk) == chunk_size:
+                yield ('' if is_first else ', ') + ', '.join(chunk)
+                chunk = []
+                is_first = False
+
+        if chunk:
+            yield ('' if is_first else ', ') + ', '.join(chunk)
+
+        yield '], "token": {0}, "more": false}}'.format(json.dumps(ChangeFeed.make_token(user_id, snapshot.version)))
+
+    @staticmethod
+    def _encode_chunk(changes, is_first):
+        # load the current state of the changed entities with one query per entity type
+        states = {}
+        for entity, model in ChangeFeed.entities.items():
+            ids = [c.entity_id for c in changes if c.entity == entity and c.op != models.Change.DELETE]
+            if ids:
+                states[entity] = dict((obj.id, obj) for obj in model.query.filter(model.id.in_(ids)))
+
+        items = []
+        for change in changes:
+            obj = states.get(change.entity, {}).get(change.entity_id)
+            items.append(json.dumps({
+                'seq': change.seq,
+                'entity': change.entity,
+                'id': change.entity_id,
+                'op': change.op,
+                'data': obj.to_dict() if obj is not None else None
+            }))
+
+        return ('' if is_first else ', ') + ', '.join(items)
@@ -0,0 +1,229 @@
+import re
+import sys
+import threading
+from itertools import groupby
+
+from sqlalchemy import event
+
+from application import db, models
+from config import ActiveConfig
+from .bitmap import Bitmap
+from .lru import LRUCache
+
+# tag names, quoted when they hold spaces, operators and parentheses
+TOKEN_PATTERN = re.compile(r'\(|\)|"[^"]*"|[^\s()]+')
+
+OPERATORS = ('AND', 'OR', 'NOT')
+
+
+class InvalidTagQuery(ValueError):
+    pass
+
+
+def parse_query(text):
+    """
+    Parses a tag query like 'python AND (perf OR profiling) AND NOT archived'. Operators are case insensitive, AND
+    binds tighter than OR and adjacent terms are joined with AND.
+
+    :return: A tree of ('tag', name), ('not', node), ('and', left, right) and ('or', left, right) tuples.
+    """
+
+    tokens = TOKEN_PATTERN.findall(text or '')
+    position = [0]
+
+    def peek():
+        if position[0] >= len(tokens):
+            return None
+        token = tokens[position[0]]
+        return token.upper() if token.upper() in OPERATORS else token
+
+    def take():
+        token = peek()
+        position[0] += 1
+        return token
+
+    def expression():
+        node = term()
+        while peek() == 'OR':
+            take()
+            node = ('or', node, term())
+        return node
+
+    def term():
+        node = factor()
+        while peek() not in (None, 'OR', ')'):
+            if peek() == 'AND':
+                take()
+            node = ('and', node, factor())
+        return node
+
+    def factor():
+        token = take()
+        if token == 'NOT':
+            return 'not', factor()
+        if token == '(':
+            node = expression()
+            if take() != ')':
+                raise InvalidTagQuery('Missing closing parenthesis.')
+            return node
+        if token in (None, ')', 'AND', 'OR'):
+            raise InvalidTagQuery('Expected a tag at position {0}.'.format(position[0]))
+        name = token[1:-1] if token.startswith('"') else token
+        return 'tag', name.strip().lower()
+
+    tree = expression()
+    if peek() is not None:
+        raise InvalidTagQuery('Unexpected {0}.'.format(tokens[position[0]]))
+    return tree
+
+
+class UserTags(object):
+    """
+    The tag bitmaps of an user, as of a data version.
+    """
+
+    __slots__ = ('version', 'bookmarks', 'tags')
+
+    def __init__(self, version):
+        self.version = version
+        # every bookmark of the user, the universe of NOT
+        self.bookmarks = Bitmap()
+        # tag name -> bookmark ids
+        self.tags = {}
+
+    def evaluate(self, node):
+        """
+        :return: A Bitmap of the bookmarks matching a parsed query.
+        """
+
+        kind = node[0]
+        if kind == 'tag':
+            return self.tags.get(node[1]) or Bitmap()
+        if kind == 'not':
+            return self.bookmarks - self.evaluate(node[1])
+        if kind == 'and':
+            return self.evaluate(node[1]) & self.evaluate(node[2])
+        return self.evaluate(node[1]) | self.evaluate(node[2])
+
+    @property
+    def nbytes(self):
+        return sys.getsizeof(self.tags) + self.bookmarks.nbytes + sum(
+            sys.getsizeof(name) + bitmap.nbytes for name, bitmap in self.tags.items())
+
+
+class TagIndex(object):
+    """
+    Process local inverted index of the tags, mapping each tag of an user to a compressed bitmap of its bookmark ids.
+
+    The index of an user is built on its first query. Later queries check the data version of the user: the bookmarks
+    written since, by any process, are read from the change log and patched in, and the index is only built again
+    when the log was truncated or holds too many changes.
+    """
+
+    def __init__(self, max_users=256, max_bytes=None, max_catch_up=1000):
+        self.max_catch_up = max_catch_up
+        self._cache = LRUCache(max_users, max_weight=max_bytes, weigher=lambda entry: entry.nbytes)
+        # entries are patched in place, queries and updates take turns
+        self._lock = threading.Lock()
+
+    def _get(self, user_id):
+        if db.session().has_writes():
+            # the transaction may still roll back, its writes are not shared
+            return self._build(user_id, None)
+
+        version = models.Change.data_version(user_id)
+        entry = self._cache.get(user_id)
+        if entry is not None and entry.version == version:
+            return entry
+
+        if entry is None or not self._catch_up(entry, user_id, version):
+            entry = self._build(user_id, version)
+        self._cache.set(user_id, entry)
+        return entry
+
+    @staticmethod
+    def _tag_rows(user_id, bookmark_ids=None):
+        query = db.session.query(models.Tag.name, models.bookmark_tags.c.bookmark_id) \
+            .join(models.bookmark_tags, models.bookmark_tags.c.tag_id == models.Tag.id) \
+            .filter(models.Tag.user_id == user_id)
+        if bookmark_ids is not None:
+            query = query.filter(models.bookmark_tags.c.bookmark_id.in_(bookmark_ids))
+        return query.order_by(models.Tag.name)
+
+    def _build(self, user_id, version):
+        entry = UserTags(version)
+        entry.bookmarks = Bitmap(row[0] for row in db.session.query(models.Bookmark.id)
+                                 .filter(models.Bookmark.user_id == user_id))
+        for name, rows in groupby(self._tag_rows(user_id), lambda row: row[0]):
+            entry.tags[name] = Bitmap(row[1] for row in rows)
+        return entry
+
+    def _catch_up(self, entry, user_id, version):
+        """
+        Reloads the tags of the bookmarks changed after the version of the entry.
+
+        :return: False if the changes are not all in the log or too many to patch.
+        """
+
+        if models.SyncHorizon.get_seq(user_id) > entry.version:
+            return False
+
+        Change = models.Change
+        changed = [row[0] for row in db.session.query(Change.entity_id).filter(
+            Change.user_id == user_id, Change.entity == 'bookmark', Change.seq > entry.version,
+            Change.seq <= version).distinct().limit(self.max_catch_up + 1)]
+        if len(changed) > self.max_catch_up:
+            return False
+
+        for i in range(0, len(changed), 500):
+            chunk = changed[i:i + 500]
+            existing = [row[0] for row in db.session.query(models.Bookmark.id).filter(
+                models.Bookmark.id.in_(chunk), models.Bookmark.user_id == user_id)]
+
+            removed = Bitmap(chunk)
+            entry.bookmarks = (entry.bookmarks - removed) | Bitmap(existing)
+            entry.tags = dict((name, bitmap - removed) for name, bitmap in entry.tags.items())
+            for name, bookmark_id in self._tag_rows(user_id, chunk):
+                entry.tags.setdefault(name, Bitmap()).add(bookmark_id)
+
+        entry.tags = dict((name, bitmap) for name, bitmap in entry.tags.items() if bitmap)
+        entry.version = version
+        return True
+
+    def select(self, user_id, query):
+        """
+        Finds the bookmarks of an user matching a tag query, see parse_query.
+
+        :return: The sorted list of matching bookmark ids.
+        """
+
+        tree = parse_query(query)
+        with self._lock:
+            return list(self._get(user_id).evaluate(tree))
+
+    def counts(self, user_id):
+        """
+        :return: A dict of the tag names of an user and their number of bookmarks.
+        """
+
+        with self._lock:
+            return dict((name, len(bitmap)) for name, bitmap in self._get(user_id).tags.items())
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        """
+        :return: A list of (user id, number of tags, bytes used) tuples, one per indexed user.
+        """
+
+        return [(user_id, len(entry.tags), entry.nbytes) for user_id, entry in self._cache.items()]
+
+
+tag_index = TagIndex(ActiveConfig.TAG_INDEX_USERS, ActiveConfig.TAG_INDEX_BYTES, ActiveConfig.TAG_INDEX_CATCH_UP)
+
+
+@event.listens_for(db.Model.metadata, 'after_drop')
+def _clear_tag_index(metadata, connection, **kwargs):
+    # the data versions start over with the recreated tables
+    tag_index.clear()
@@ -0,0 +1,184 @@
+import threading
+import time
+
+from flask import request, has_request_context
+from sqlalchemy import text
+
+from application import db
+from config import ActiveConfig
+from . import hashing
+from .lru import LRUCache
+from .metrics import metrics
+
+metrics.describe('login_throttled_total', 'counter', 'Password checks refused by the login throttle, by bucket.')
+
+# takes a token if the refilled bucket has one
+TAKE_SHARED = text('''
+UPDATE login_buckets SET tokens = MIN(:burst, tokens + (:now - updated) * :rate) - 1, updated = :now
+WHERE key = :key AND MIN(:burst, tokens + (:now - updated) * :rate) >= 1
+''')
+
+READ_SHARED = text('SELECT tokens, updated FROM login_buckets WHERE key = :key')
+
+CREATE_SHARED = text('INSERT OR IGNORE INTO login_buckets(key, tokens, updated) VALUES (:key, :burst - 1, :now)')
+
+REFUND_SHARED = text('UPDATE login_buckets SET tokens = MIN(:burst, tokens + 1) WHERE key = :key')
+
+PRUNE_SHARED = text('DELETE FROM login_buckets WHERE updated < :before')
+
+
+class LoginThrottled(Exception):
+    """
+    Raised instead of checking a password when there were too many attempts.
+    """
+
+    def __init__(self, retry_after):
+        super(LoginThrottled, self).__init__('Too many login attempts, retry in {0} seconds.'.format(retry_after))
+        self.retry_after = retry_after
+
+
+class LoginThrottle(object):
+    """
+    Token buckets limiting the password checks per username and per client address.
+
+    Every check takes a token from both buckets and a successful one gives them back, so only failed attempts are
+    limited. Tokens are added back at 'rate' per second up to 'burst'. A check over the limit is refused before the
+    password is hashed.
+
+    Buckets are kept in a process local LRU cache, expiring once full again, or in the login_buckets table when they
+    are shared by the worker processes.
+    """
+
+    def __init__(self, user_burst, user_rate, client_burst, client_rate, max_keys=65536, shared=False):
+        self.limits = {'user': (user_burst, user_rate), 'client': (client_burst, client_rate)}
+        self.shared = shared
+        # a bucket is full again after burst / rate seconds, when it is as good as a missing one
+        self.refill_time = max(float(burst) / rate for burst, rate in self.limits.values())
+        self._buckets = LRUCache(max_keys, ttl=self.refill_time)
+        self._lock = threading.Lock()
+        self._takes = 0
+
+        self.checks = 0
+        self.rejected = 0
+        self.check_seconds = 0.0
+
+    def _keys(self, username, client):
+        keys = [('user:' + (username or '').lower(), self.limits['user'])]
+        if client:
+            keys.append(('client:' + client, self.limits['client']))
+        return keys
+
+    def _take(self, keys, now):
+        """
+        Takes a token from every bucket, or from none of them.
+
+        :return: None if taken, else the key of the empty bucket and the seconds until it has a token again.
+        """
+
+        if self.shared:
+            return self._take_shared(keys, now)
+
+        with self._lock:
+            levels = []
+            for key, (burst, rate) in keys:
+                tokens, updated = self._buckets.get(key) or (burst, now)
+                tokens = min(burst, tokens + (now - updated) * rate)
+                if tokens < 1:
+                    return key, (1 - tokens) / rate
+                levels.append((key, tokens))
+
+            for key, tokens in levels:
+                self._buckets.set(key, (tokens - 1, now))
+        return None
+
+    def _take_shared(self, keys, now):
+        connection = db.engine.connect()
+        transaction = connection.begin()
+        try:
+            for key, (burst, rate) in keys:
+                params = {'key': key, 'burst': burst, 'rate': rate, 'now': now}
+                if connection.execute(TAKE_SHARED, params).rowcount or \
+                        connection.execute(CREATE_SHARED, params).rowcount:
+                    continue
+
+                tokens, updated = connection.execute(READ_SHARED, params).first()
+                transaction.rollback()
+                return key, (1 - min(burst, tokens + (now - updated) * rate)) / rate
+
+            self._takes += 1
+            if self._takes % 256 == 0:
+                connection.execute(PRUNE_SHARED, {'before': now - self.refill_time})
+            transaction.commit()
+            return None
+        except Exception:
+            transaction.rollback()
+            raise
+        finally:
+            connection.close()
+
+    def _refund(self, keys):
+        if self.shared:
+            with db.engine.begin() as connection:
+                for key, (burst, _) in keys:
+                    connection.execute(REFUND_SHARED, {'key': key, 'burst': burst})
+            return
+
+        with self._lock:
+            for key, (burst, _) in keys:
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    self._buckets.set(key, (min(burst, bucket[0] + 1), bucket[1]))
+
+    def check_password(self, username, pwhash, password, client=None):
+        """
+        Checks a password within the limits of the username and the client address.
+
+        :param client: The address of the client, the one of the current request if None.
+
+        :return: True if the password matches the hash.
+
+        :raise LoginThrottled: if a bucket is empty, no hash is computed then.
+        """
+
+        if client is None and has_request_context():
+            client = request.remote_addr
+        keys = self._keys(username, client)
+
+        refused = self._take(keys, time.time())
+        if refused is not None:
+            key, retry_after = refused
+            self.rejected += 1
+            metrics.inc('login_throttled_total', (('bucket', key.split(':', 1)[0]),))
+            raise LoginThrottled(int(retry_after) + 1)
+
+        start = time.perf_counter()
+        valid = hashing.check_password(pwhash, password)
+        self.check_seconds += time.perf_counter() - start
+        self.checks += 1
+
+        if valid:
+            self._refund(keys)
+        return valid
+
+    def reset(self):
+        """
+        Empties the process local buckets and counters.
+        """
+
+        self._buckets.clear()
+        self.checks = self.rejected = 0
+        self.check_seconds = 0.0
+
+    def stats(self):
+        """
+        :return: The number of checks run and refused, and an estimate of the hashing seconds the refusals saved.
+        """
+
+        average = self.check_seconds / self.checks if self.checks else 0.0
+        return {'checks': self.checks, 'rejected': self.rejected, 'seconds_saved': self.rejected * average,
+                'buckets': len(self._buckets)}
+
+
+login_throttle = LoginThrottle(ActiveConfig.LOGIN_USER_BURST, ActiveConfig.LOGIN_USER_RATE,
+                               ActiveConfig.LOGIN_CLIENT_BURST, ActiveConfig.LOGIN_CLIENT_RATE,
+                               ActiveConfig.LOGIN_THROTTLE_KEYS, ActiveConfig.LOGIN_THROTTLE_SHARED)
@@ -0,0 +1,246 @@
+import sys
+import threading
+from array import array
+
+from sqlalchemy import event, func
+
+from application import db, models
+from config import ActiveConfig
+from .lru import LRUCache
+
+
+class TreeSnapshot(object):
+    """
+    Read-only copy of the bookmark tree of an user, stored as parallel arrays instead of an object per row.
+
+    Folders are listed depth first, index 0 standing for the root, so the subtree of the folder at index i is the
+    range i..folder_end[i]. Bookmarks are ordered by the index of their folder then their position: the bookmarks of
+    the folder at index i are bookmark_start[i]..bookmark_start[i + 1] and those of its whole subtree end at
+    bookmark_start[folder_end[i]]. Repeated titles, tags and icons are stored once.
+    """
+
+    __slots__ = ('version', 'folder_ids', 'folder_parents', 'folder_positions', 'folder_titles', 'folder_end',
+                 'bookmark_start', 'bookmark_ids', 'bookmark_folders', 'bookmark_positions', 'bookmark_titles',
+                 'bookmark_urls', 'bookmark_tags', 'bookmark_icons', '_folder_index', 'nbytes')
+
+    def __init__(self, user_id, attempts=3):
+        for _ in range(attempts):
+            self.version = models.Change.data_version(user_id)
+            complete = self._read(user_id)
+            # the folders and bookmarks are separate reads, a write committed in between may leave them apart
+            if complete and models.Change.data_version(user_id) == self.version:
+                break
+        # otherwise the snapshot keeps the version read before it, it is built again on the next use
+        self.nbytes = self._measure()
+
+    def _read(self, user_id):
+        """
+        Reads the folders and bookmarks of an user into the arrays.
+
+        :return: False if a bookmark is in a folder missing from the folders read, such bookmarks are left out.
+        """
+
+        complete = True
+        strings = {}
+        batch = ActiveConfig.EXPORT_BATCH_SIZE
+
+        self.folder_ids = array('l', [0])
+        self.folder_parents = array('l', [-1])
+        self.folder_positions = array('l', [0])
+        titles = ['']
+        self._folder_index = {None: 0}
+
+        Folder, Bookmark = models.Folder, models.Bookmark
+        folders = db.session.query(Folder.id, Folder.parent_id, Folder.position, Folder.title) \
+            .filter(Folder.user_id == user_id).order_by(Folder.path + func.printf('%08x/', Folder.id)) \
+            .yield_per(batch)
+        for row in folders:
+            # parents are listed before their children
+            self._folder_index[row.id] = len(self.folder_ids)
+            self.folder_ids.append(row.id)
+            self.folder_parents.append(self._folder_index[row.parent_id])
+            self.folder_positions.append(row.position or 0)
+            titles.append(strings.setdefault(row.title or '', row.title or ''))
+        self.folder_titles = tuple(titles)
+
+        # a folder ends where the last of its descendants does
+        count = len(self.folder_ids)
+        self.folder_end = array('l', range(1, count + 1))
+        for i in range(count - 1, 0, -1):
+            parent = self.folder_parents[i]
+            self.folder_end[parent] = max(self.folder_end[parent], self.folder_end[i])
+
+        self.bookmark_ids = array('l')
+        self.bookmark_folders = array('l')
+        self.bookmark_positions = array('l')
+        titles, urls, tags, icons = [], [], [], []
+        counts = array('l', [0] * (count + 1))
+
+        # the path of a bookmark is the full path of its folder, so path order follows the folder order
+        bookmarks = db.session.query(Bookmark.id, Bookmark.folder_id, Bookmark.position, Bookmark.title,
+                                     Bookmark.url, Bookmark.tags, Bookmark.icon) \
+            .filter(Bookmark.user_id == user_id).order_by(Bookmark.path, Bookmark.position, Bookmark.id) \
+            .yield_per(batch)
+        for row in bookmarks:
+            folder = self._folder_index.get(row.folder_id)
+            if folder is None:
+                complete = False
+                continue
+            counts[folder + 1] += 1
+            self.bookmark_ids.append(row.id)
+            self.bookmark_folders.append(folder)
+            self.bookmark_positions.append(row.position or 0)
+            titles.append(strings.setdefault(row.title or '', row.title or ''))
+            urls.append(row.url)
+            tags.append(strings.setdefault(row.tags or '', row.tags or ''))
+            icons.append(strings.setdefault(row.icon, row.icon))
+        self.bookmark_titles, self.bookmark_urls = tuple(titles), tuple(urls)
+        self.bookmark_tags, self.bookmark_icons = tuple(tags), tuple(icons)
+
+        for i in range(1, count + 1):
+            counts[i] += counts[i - 1]
+        self.bookmark_start = counts
+        return complete
+
+    def folder_index(self, folder_id):
+        """
+        :return: The index of a folder, 0 for None, the root.
+
+        :raise KeyError: if the user has no such folder.
+        """
+
+        return self._folder_index[folder_id]
+
+    def folder_dict(self, i):
+        return {
+            'id': self.folder_ids[i],
+            'parent_id': self.folder_ids[self.folder_parents[i]] or None,
+            'title': self.folder_titles[i],
+            'position': self.folder_positions[i]
+        }
+
+    def bookmark_dict(self, k):
+        return {
+            'id': self.bookmark_ids[k],
+            'folder_id': self.folder_ids[self.bookmark_folders[k]] or None,
+            'title': self.bookmark_titles[k],
+            'url': self.bookmark_urls[k],
+            'tags': self.bookmark_tags[k],
+            'position': self.bookmark_positions[k],
+            'icon': self.bookmark_icons[k]
+        }
+
+    def children(self, folder_id=None):
+        """
+        :return: A (folder dicts, bookmark dicts) pair of the direct content of a folder, by position.
+        """
+
+        i = self.folder_index(folder_id)
+        folders = []
+        child = i + 1
+        while child < self.folder_end[i]:
+            folders.append(self.folder_dict(child))
+            child = self.folder_end[child]
+
+        folders.sort(key=lambda folder: (folder['position'], folder['id']))
+        return folders, [self.bookmark_dict(k) for k in range(self.bookmark_start[i], self.bookmark_start[i + 1])]
+
+    def subtree(self, folder_id=None):
+        """
+        :return: A (folder dicts, bookmark dicts) pair of everything under a folder, parents before children.
+        """
+
+        i = self.folder_index(folder_id)
+        end = self.folder_end[i]
+        return ([self.folder_dict(j) for j in range(i + 1, end)],
+                [self.bookmark_dict(k) for k in range(self.bookmark_start[i], self.bookmark_start[end])])
+
+    def path(self, folder_id):
+        """
+        :return: The titles of the folders from the top level down to the given one.
+        """
+
+        titles = []
+        i = self.folder_index(folder_id)
+        while i > 0:
+            titles.append(self.folder_titles[i])
+            i = self.folder_parents[i]
+        return titles[::-1]
+
+    @property
+    def folder_count(self):
+        return len(self.folder_ids) - 1
+
+    @property
+    def bookmark_count(self):
+        return len(self.bookmark_ids)
+
+    def _measure(self):
+        """
+        :return: The memory used by the snapshot, in bytes, shared strings counted once.
+        """
+
+        strings = {}
+        for values in (self.folder_titles, self.bookmark_titles, self.bookmark_urls, self.bookmark_tags,
+                       self.bookmark_icons):
+            for value in values:
+                if value is not None:
+                    strings[id(value)] = value
+        containers = [getattr(self, name) for name in self.__slots__ if name != 'nbytes']
+        return (sys.getsizeof(self) + sum(sys.getsizeof(container) for container in containers) +
+                sum(sys.getsizeof(value) for value in strings.values()))
+
+    def __repr__(self):
+        return 'TreeSnapshot({0} folders, {1} bookmarks, {2} bytes)'.format(
+            self.folder_count, self.bookmark_count, self.nbytes)
+
+
+class TreeCache(object):
+    """
+    Process local cache of the tree snapshots, one per user, built again when the data version of the user changes.
+    """
+
+    def __init__(self, max_users=64, max_bytes=None):
+        self._cache = LRUCache(max_users, max_weight=max_bytes, weigher=lambda snapshot: snapshot.nbytes)
+        # concurrent requests for a stale tree wait for a single build
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """
+        :return: The up to date snapshot of the tree of an user.
+        """
+
+        if db.session().has_writes():
+            # the transaction may still roll back, its writes are not shared
+            return TreeSnapshot(user_id)
+
+        version = models.Change.data_version(user_id)
+        snapshot = self._cache.get(user_id)
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+
+        with self._lock:
+            snapshot = self._cache.get(user_id)
+            if snapshot is None or snapshot.version != version:
+                snapshot = TreeSnapshot(user_id)
+                self._cache.set(user_id, snapshot)
+            return snapshot
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        """
+        :return: A list of (user id, bytes used) tuples, one per cached tree.
+        """
+
+        return [(user_id, snapshot.nbytes) for user_id, snapshot in self._cache.items()]
+
+
+tree_cache = TreeCache(ActiveConfig.TREE_CACHE_USERS, ActiveConfig.TREE_CACHE_BYTES)
+
+
+@event.listens_for(db.Model.metadata, 'after_drop')
+def _clear_tree_cache(metadata, connection, **kwargs):
+    # the data versions start over with the recreated tables
+    tree_cache.clear()
@@ -0,0 +1,78 @@
+import hashlib
+import re
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# query parameters only used for tracking, dropped from canonical urls
+TRACKING_PARAMETERS = {'fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'igshid', 'mc_cid', 'mc_eid', '_ga', '_hsenc',
+                       '_hsmi', 'mkt_tok', 'ref_src', 'spm'}
+TRACKING_PREFIXES = ('utm_',)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443, 'ftp': 21}
+
+# percent escapes of the unreserved characters are decoded, the others are uppercased
+_ESCAPE = re.compile('%([0-9a-fA-F]{2})')
+_UNRESERVED = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~')
+
+
+def _normalize_escapes(value):
+    def replace(match):
+        char = chr(int(match.group(1), 16))
+        return char if char in _UNRESERVED else '%' + match.group(1).upper()
+    return _ESCAPE.sub(replace, value)
+
+
+def _is_tracking(name):
+    name = name.lower()
+    return name in TRACKING_PARAMETERS or name.startswith(TRACKING_PREFIXES)
+
+
+def normalize_url(url):
+    """
+    Gets the canonical form of an url, shared by the urls that differ only by the case of the scheme and host, a
+    'www.' prefix, the default port, a trailing slash, the fragment, percent escapes, tracking parameters or the order
+    of the query parameters.
+
+    Urls without a host, e.g. 'javascript:' or 'place:' ones, are only stripped.
+    """
+
+    url = (url or '').strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    if not parts.netloc:
+        return url
+
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').rstrip('.')
+    if host.startswith('www.'):
+        host = host[4:]
+    if ':' in host:
+        host = '[{0}]'.format(host)
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        host += ':{0}'.format(port)
+    if parts.username is not None:
+        userinfo = parts.username + (':' + parts.password if parts.password is not None else '')
+        host = userinfo + '@' + host
+
+    path = _normalize_escapes(parts.path).rstrip('/') or '/'
+
+    query = ''
+    if parts.query:
+        params = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                  if not _is_tracking(name)]
+        query = urlencode(sorted(params))
+
+    return urlunsplit((scheme, host, path, query, ''))
+
+
+def url_hash(url):
+    """
+    Gets the 64 bit hash of the canonical form of an url, stored in the indexed Bookmark.url_hash column.
+
+    :return: A signed integer, the range of a sqlite INTEGER.
+    """
+
+    digest = hashlib.sha1(normalize_url(url).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big', signed=True)
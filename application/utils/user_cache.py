@@ -0,0 +1,115 @@
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload, Session
+
+from application import models
+from config import ActiveConfig
+from .lru import LRUCache
+
+
+class UserSnapshot(object):
+    """
+    Detached, read-only copy of an user and its access level title, used as the flask-login current user.
+    """
+
+    __slots__ = ('id', 'username', 'first_name', 'last_name', 'access_level_id', 'access_level_title')
+
+    def __init__(self, user):
+        for name, value in (('id', user.id),
+                            ('username', user.username),
+                            ('first_name', user.first_name),
+                            ('last_name', user.last_name),
+                            ('access_level_id', user.access_level_id),
+                            ('access_level_title', user.access_level.title if user.access_level else None)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('UserSnapshot is read-only.')
+
+    @staticmethod
+    def is_authenticated():
+        return True
+
+    @staticmethod
+    def is_active():
+        return True
+
+    @staticmethod
+    def is_anonymous():
+        return False
+
+    def get_id(self):
+        return self.id
+
+    @property
+    def access_level(self):
+        return self.access_level_title
+
+    get_full_name = models.User.get_full_name
+
+    def __repr__(self):
+        return self.get_full_name
+
+
+class UserCache(object):
+    """
+    Process local cache of user snapshots, keyed on the user id.
+    """
+
+    def __init__(self, max_size=1024, ttl=30):
+        self._cache = LRUCache(max_size, ttl)
+
+    def get(self, user_id):
+        """
+        Gets the snapshot of an user, loading it together with its access level on a miss.
+
+        :return: The snapshot or None if the user doesn't exist.
+        """
+
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+
+        snapshot = self._cache.get(user_id)
+        if snapshot is None:
+            user = models.User.query.options(joinedload(models.User.access_level)).get(user_id)
+            if user is None:
+                return None
+            snapshot = UserSnapshot(user)
+            self._cache.set(user_id, snapshot)
+        return snapshot
+
+    def invalidate_user(self, user_id):
+        self._cache.pop(user_id)
+
+    def invalidate_access_level(self, access_level_id):
+        self._cache.discard_if(lambda key, snapshot: snapshot.access_level_id == access_level_id)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
+
+
+user_cache = UserCache(ActiveConfig.USER_CACHE_SIZE, ActiveConfig.USER_CACHE_TTL)
+
+
+@event.listens_for(models.User, 'after_update')
+@event.listens_for(models.User, 'after_delete')
+def _invalidate_user(mapper, connection, target):
+    user_cache.invalidate_user(target.id)
+
+
+@event.listens_for(models.AccessLevel, 'after_update')
+@event.listens_for(models.AccessLevel, 'after_delete')
+def _invalidate_access_level(mapper, connection, target):
+    user_cache.invalidate_access_level(target.id)
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def _invalidate_bulk(context):
+    # bulk queries don't report the affected rows, drop everything
+    if context.mapper is not None and context.mapper.class_ in (models.User, models.AccessLevel):
+        user_cache.clear()
@@ -1,6 +1,6 @@
 from flask import flash
 
-from application.utils import Authentication
+from application.utils import DefaultCredentials
 
 
 def check_errors():
@@ -10,8 +10,8 @@ def check_errors():
     :return: True if there are errors.
     """
 
-    # true when ('admin','password') is present
-    if Authentication.check_authorization('admin', 'password'):
+    # true when ('admin','password') is present, tracked without touching the database
+    if DefaultCredentials.is_active():
         flash('Warning: Change default login info to something unique to prevent a potential security risk.')
 
-from . import admin_views, main_views, forms
+from . import admin_views, main_views, api_views, rpc_views, forms
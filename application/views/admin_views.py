@@ -1,10 +1,23 @@
-from flask import request, redirect, url_for
-from flask.ext.admin import expose, AdminIndexView, helpers
+import os
+import tempfile
+import threading
+
+from flask import request, redirect, url_for, flash, g, abort, send_file
+from flask.ext.admin import expose, AdminIndexView, BaseView, helpers
 from flask.ext.admin.contrib.sqla import ModelView
 import flask.ext.login as login
-from werkzeug.security import generate_password_hash
+from sqlalchemy import func
+
+from application import models
+from application.utils import Authentication, hashing
+from application.utils.export import BookmarkExport
+from application.utils.jobs import Jobs
+from application.utils.linkcheck import NETWORK_ERROR
+from config import ActiveConfig
+from . import forms, check_errors, pagination
 
-from . import forms, check_errors
+# guards the deferred scaffolding of the model views
+_cache_lock = threading.Lock()
 
 
 class AdminMainView(AdminIndexView):
@@ -42,6 +55,18 @@ class AdminMainView(AdminIndexView):
 
 class AdminModelView(ModelView):
 
+    list_template = 'admin/model/fast_list.html'
+
+    # columns of an unique, indexed sort key ending with the primary key; enables keyset pagination when the list is
+    # sorted by the first of them (or not sorted), so any page costs the same as the first one
+    keyset_columns = None
+
+    # list count: 'exact' runs COUNT(*), 'estimate' reads the highest primary key, 'none' skips it
+    count_mode = 'exact'
+
+    # set once the scaffolding deferred by _refresh_cache was built
+    _cache_ready = False
+
     def is_accessible(self):
         return login.current_user.is_authenticated()
 
@@ -49,10 +74,116 @@ class AdminModelView(ModelView):
         check_errors()
         if not self.is_accessible():
             return redirect(url_for('admin.login_view', next=request.url))
+        self._ensure_cache()
+
+    def _refresh_cache(self):
+        # the scaffolding reflects the model and builds its forms, defer it to the first request of the view; the
+        # constructor still needs the list columns to find the relations it joins
+        self._list_columns = self.get_list_columns()
+        self._cache_ready = False
+
+    def _ensure_cache(self):
+        if not self._cache_ready:
+            with _cache_lock:
+                if not self._cache_ready:
+                    super(AdminModelView, self)._refresh_cache()
+                    self._cache_ready = True
+
+    def _count_mode(self):
+        return g.get('list_count_mode') or self.count_mode
+
+    def get_count_query(self):
+        count_mode = self._count_mode()
+        if count_mode == 'exact':
+            return super(AdminModelView, self).get_count_query()
+        if count_mode == 'estimate':
+            return pagination.NoCountQuery(self.session.query(func.max(self._primary_key_column())).scalar() or 0)
+        return pagination.NoCountQuery(0)
+
+    def _primary_key_column(self):
+        return getattr(self.model, self._primary_key)
+
+    def _list_url(self, **kwargs):
+        args = request.args.to_dict()
+        for name in ('page', 'after', 'before'):
+            args.pop(name, None)
+        args.update((k, v) for k, v in kwargs.items() if v is not None)
+        return url_for('.index_view', **args)
+
+    def get_list(self, page, sort_column, sort_desc, search, filters, execute=True):
+        keyset = self.keyset_columns
+        # the estimate counts the whole table, a searched or filtered list is counted
+        g.list_count_mode = 'exact' if self.count_mode == 'estimate' and (search or filters) else self.count_mode
+        if not execute or (g.list_count_mode == 'exact' and not keyset):
+            return super(AdminModelView, self).get_list(page, sort_column, sort_desc, search, filters, execute)
+
+        if not keyset or sort_column not in (None, keyset[0]):
+            # count free offset paging, only previous/next links can be shown
+            count, data = super(AdminModelView, self).get_list(page, sort_column, sort_desc, search, filters)
+            g.list_pager = {
+                'prev': self._list_url(page=page - 1 or None) if page else None,
+                'next': self._list_url(page=page + 1) if len(data) == self.page_size else None
+            }
+            return count, data
+
+        columns = [getattr(self.model, name) for name in keyset]
+        count, query = super(AdminModelView, self).get_list(None, None, False, search, filters, execute=False)
+        query = query.limit(None).order_by(None)
+
+        after = pagination.decode_cursor(request.args.get('after'), len(columns))
+        before = pagination.decode_cursor(request.args.get('before'), len(columns))
+
+        # a backward page is read in reverse order, starting from the first row of the following page
+        backward = before is not None and after is None
+        descending = sort_desc != backward
+        if backward:
+            query = query.filter(pagination.seek_criterion(columns, before, descending))
+        elif after is not None:
+            query = query.filter(pagination.seek_criterion(columns, after, descending))
+
+        order = [c.desc() if descending else c.asc() for c in columns]
+        data = query.order_by(*order).limit(self.page_size + 1).all()
+
+        has_more = len(data) > self.page_size
+        data = data[:self.page_size]
+        if backward:
+            data.reverse()
+
+        def cursor(row):
+            return pagination.encode_cursor([getattr(row, name) for name in keyset])
+
+        g.list_pager = {
+            'first': self._list_url() if after is not None or before is not None else None,
+            'prev': cursor(data[0]) if data and (after is not None or (backward and has_more)) else None,
+            'next': cursor(data[-1]) if data and (backward or has_more) else None
+        }
+        for name in ('prev', 'next'):
+            if g.list_pager[name]:
+                key = 'before' if name == 'prev' else 'after'
+                g.list_pager[name] = self._list_url(**{key: g.list_pager[name]})
+        return count, data
+
+    def render(self, template, **kwargs):
+        pager = g.get('list_pager') if template == self.list_template else None
+        if pager is not None:
+            g.list_pager = None
+            # the page based pager needs an exact count, replace it with previous/next links
+            kwargs['num_pages'] = 0
+            kwargs['list_pager'] = pager
+            count_mode = self._count_mode()
+            if count_mode == 'estimate':
+                kwargs['count'] = '~{0}'.format(kwargs.get('count'))
+            elif count_mode == 'none':
+                kwargs['count'] = '...'
+        return super(AdminModelView, self).render(template, **kwargs)
 
 
 class AdminUserModelView(AdminModelView):
 
+    keyset_columns = ('username', 'id')
+    count_mode = 'estimate'
+    column_searchable_list = ('username', 'first_name', 'last_name')
+
     # set the passwords to be masked
     column_formatters = dict(password=lambda v, c, m, p: '* * * * *')
 
@@ -63,9 +194,131 @@ class AdminUserModelView(AdminModelView):
         return forms.UserEditForm(obj=obj)
 
     def create_model(self, form):
-        form.password.data = generate_password_hash(form.password.data)
-        return super(AdminUserModelView, self).create_model(form)
+        form.password.data = hashing.hash_password(form.password.data)
+        model = super(AdminUserModelView, self).create_model(form)
+        if model:
+            Authentication.credential_cache.invalidate_user(model.id)
+        return model
 
     def update_model(self, form, model):
-        form.password.data = generate_password_hash(form.password.data)
-        return super(AdminUserModelView, self).update_model(form, model)
+        form.password.data = hashing.hash_password(form.password.data)
+        updated = super(AdminUserModelView, self).update_model(form, model)
+
+        # drop verified credentials right away, the password or the username may have changed
+        Authentication.credential_cache.invalidate_user(model.id)
+        return updated
+
+
+class AdminBaseView(BaseView):
+
+    def is_accessible(self):
+        return login.current_user.is_authenticated()
+
+    def _handle_view(self, name, **kwargs):
+        check_errors()
+        if not self.is_accessible():
+            return redirect(url_for('admin.login_view', next=request.url))
+
+
+class AdminImportView(AdminBaseView):
+
+    @expose('/', methods=('GET', 'POST'))
+    def index(self):
+        upload = request.files.get('bookmarks')
+
+        if request.method == 'POST' and upload and upload.filename:
+            # the sqlite module needs a real file to open places.sqlite, kept until the job is done
+            if not os.path.isdir(ActiveConfig.JOB_DIR):
+                os.makedirs(ActiveConfig.JOB_DIR)
+            handle, path = tempfile.mkstemp(suffix='.bookmarks', dir=ActiveConfig.JOB_DIR)
+            os.close(handle)
+            upload.save(path)
+            job = Jobs.enqueue(login.current_user.id, 'import', {'path': path}, files=[path])
+            flash('Import queued as job #{0}.'.format(job.id))
+            return redirect(url_for('jobs.index'))
+
+        return self.render('admin/import.html')
+
+
+class AdminLinksView(AdminBaseView):
+
+    @expose('/', methods=('GET', 'POST'))
+    def index(self):
+        user_id = login.current_user.id
+        last = models.Job.query.filter_by(user_id=user_id, kind='check-links') \
+            .order_by(models.Job.id.desc()).first()
+
+        if request.method == 'POST':
+            if last is None or not last.active:
+                Jobs.enqueue(user_id, 'check-links')
+            return redirect(url_for('.index'))
+
+        dead = models.Bookmark.query.filter(models.Bookmark.user_id == user_id,
+                                            (models.Bookmark.link_status == NETWORK_ERROR) |
+                                            (models.Bookmark.link_status >= 400)) \
+            .order_by(models.Bookmark.id).limit(100).all()
+
+        running = last is not None and last.active
+        return self.render('admin/links.html', dead=dead, running=running, last=last)
+
+
+class AdminJobsView(AdminBaseView):
+
+    # jobs started from this page as (action, label, kind, params), imports are queued by AdminImportView
+    actions = [
+        ('check-links', 'Check links', 'check-links', {}),
+        ('dedup', 'Merge duplicates', 'dedup', {}),
+        ('near-dups', 'Cluster near duplicates', 'near-dups', {}),
+        ('export-html', 'Export HTML', 'export', {'fmt': 'html'}),
+        ('export-json', 'Export JSON', 'export', {'fmt': 'json', 'compress': True}),
+    ]
+
+    # actions that can't be undone, the button asks before queueing them
+    confirmations = {
+        'dedup': 'Delete the copies of the bookmarks saved more than once? The oldest copy of each is kept with the '
+                 'tags of the others.'
+    }
+
+    @expose('/', methods=('GET', 'POST'))
+    def index(self):
+        user_id = login.current_user.id
+
+        if request.method == 'POST':
+            for action, label, kind, params in self.actions:
+                if action == request.form.get('action'):
+                    job = Jobs.enqueue(user_id, kind, params)
+                    flash('{0} queued as job #{1}.'.format(label, job.id))
+            return redirect(url_for('.index'))
+
+        jobs = models.Job.query.filter_by(user_id=user_id).order_by(models.Job.id.desc()).limit(50).all()
+        rows = [(job, Jobs.progress_of(job)) for job in jobs]
+        return self.render('admin/jobs.html', rows=rows, actions=self.actions, confirmations=self.confirmations,
+                           active=any(job.active for job in jobs))
+
+    @expose('/<int:job_id>/cancel', methods=('POST',))
+    def cancel(self, job_id):
+        if not Jobs.cancel(self._get_job(job_id).id):
+            flash('Job #{0} already finished.'.format(job_id))
+        return redirect(url_for('.index'))
+
+    @expose('/<int:job_id>/retry', methods=('POST',))
+    def retry(self, job_id):
+        if not Jobs.retry(self._get_job(job_id).id):
+            flash('Only failed jobs can be retried.')
+        return redirect(url_for('.index'))
+
+    @expose('/<int:job_id>/download')
+    def download(self, job_id):
+        job = self._get_job(job_id)
+        result = job.get_result() if job.status == models.Job.DONE else None
+        if job.kind != 'export' or not result or not os.path.isfile(result['file']):
+            abort(404)
+
+        name = 'bookmarks.{0}'.format(result['fmt'])
+        if result['compress']:
+            return send_file(result['file'], 'application/gzip', True, name + '.gz')
+        return send_file(result['file'], BookmarkExport.mimetypes[result['fmt']], True, name)
+
+    @staticmethod
+    def _get_job(job_id):
+        return models.Job.query.filter_by(id=job_id, user_id=login.current_user.id).first_or_404()
@@ -0,0 +1,84 @@
+from flask import request, jsonify, g, make_response, Response, stream_with_context
+from flask.views import MethodView
+
+from application import db, models
+from application.utils import Authentication
+from application.utils.export import BookmarkExport
+from application.utils.search import BookmarkSearch
+from application.utils.sync import ChangeFeed, InvalidSyncToken, ExpiredSyncToken
+from .caching import cached_response, user_data_version
+
+
+class SearchView(MethodView):
+    """
+    Full text search over the bookmarks of the authorized user.
+
+    Query arguments: 'q' - the words to search for, the last one matched as a prefix; 'limit' - maximum results.
+    """
+
+    decorators = [cached_response(user_data_version, private=True), Authentication.login_required, db.read_only]
+
+    def get(self):
+        limit = request.args.get('limit', type=int)
+        bookmarks = BookmarkSearch.search(g.user_id, request.args.get('q', ''), limit)
+        return jsonify({'results': [b.to_dict() for b in bookmarks]})
+
+
+class SyncView(MethodView):
+    """
+    Delta sync of the bookmarks of the authorized user.
+
+    Query arguments: 'token' - the token returned by the previous sync, empty for a full sync; 'limit' - maximum
+    number of changes in the page. Expired tokens are answered with 410, the client must then sync without a token.
+    A full sync without a limit is served in one page from the tree snapshot of the user.
+    """
+
+    decorators = [Authentication.login_required, db.read_only]
+
+    def get(self):
+        try:
+            seq = ChangeFeed.read_token(g.user_id, request.args.get('token'))
+        except InvalidSyncToken as e:
+            return make_response(jsonify({'Status': str(e)}), 400)
+        except ExpiredSyncToken as e:
+            return make_response(jsonify({'Status': str(e)}), 410)
+
+        limit = request.args.get('limit', type=int)
+        if seq == 0 and limit is None:
+            stream = ChangeFeed.stream_snapshot(g.user_id)
+        else:
+            stream = ChangeFeed.stream(g.user_id, seq, limit)
+        return Response(stream_with_context(stream), mimetype='application/json')
+
+
+class ExportView(MethodView):
+    """
+    Export of the bookmarks of the authorized user, streamed while it is read.
+
+    URL argument: the format, 'html' for the Netscape bookmark file imported by browsers or 'json' for a JSON tree.
+    Query arguments: 'folder' - id of the folder to export, the whole tree if missing. Clients accepting gzip get the
+    document compressed.
+    """
+
+    decorators = [Authentication.login_required, db.read_only]
+
+    def get(self, fmt):
+        if fmt not in BookmarkExport.formats:
+            return make_response(jsonify({'Status': 'Unknown export format.'}), 404)
+
+        root = None
+        folder_id = request.args.get('folder', type=int)
+        if folder_id is not None:
+            root = models.Folder.query.filter_by(id=folder_id, user_id=g.user_id).first()
+            if root is None:
+                return make_response(jsonify({'Status': 'Folder not found.'}), 404)
+
+        compress = 'gzip' in request.accept_encodings
+        stream = BookmarkExport.stream(g.user_id, fmt, root, compress)
+
+        response = Response(stream_with_context(stream), mimetype=BookmarkExport.mimetypes[fmt])
+        response.headers['Content-Disposition'] = 'attachment; filename=bookmarks.{0}'.format(fmt)
+        response.headers['Vary'] = 'Accept-Encoding'
+        if compress:
+            response.headers['Content-Encoding'] = 'gzip'
+        return response
@@ -0,0 +1,73 @@
+import hashlib
+from functools import wraps
+
+from flask import request, g, make_response, Response
+from sqlalchemy import event
+
+from application import db, models
+from application.utils.lru import LRUCache
+from config import ActiveConfig
+
+# rendered bodies as (etag, body, mimetype) tuples, bounded by the total size of the bodies
+response_cache = LRUCache(max_size=ActiveConfig.RESPONSE_CACHE_SIZE, max_weight=ActiveConfig.RESPONSE_CACHE_BYTES,
+                          weigher=lambda entry: len(entry[1]))
+
+
+@event.listens_for(db.Model.metadata, 'after_drop')
+def _clear_response_cache(metadata, connection, **kwargs):
+    # the data versions start over with the recreated tables
+    response_cache.clear()
+
+
+def user_data_version():
+    """
+    Cache key for responses built from the bookmarks of the authorized user. Any write to them changes the key.
+
+    :return: The user id and data version.
+    """
+
+    return g.user_id, models.Change.data_version(g.user_id)
+
+
+def cached_response(key=None, private=False):
+    """
+    Decorator for the views of flask.views.View subclasses, used through their 'decorators' list. Successful GET
+    responses are kept rendered in response_cache and sent with a strong ETag; requests with a matching
+    If-None-Match header are answered with 304.
+
+    :param key: Callable returning a tuple of what the response depends on besides the endpoint, view arguments and
+    query string, or None to bypass the cache.
+
+    :param private: True if the response depends on the user, it is then not stored by shared caches.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            extra = key() if key is not None else ()
+            if request.method not in ('GET', 'HEAD') or extra is None:
+                return view(*args, **kwargs)
+
+            cache_key = (request.endpoint, args, tuple(sorted(kwargs.items())), request.query_string) + tuple(extra)
+            entry = response_cache.get(cache_key)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+
+                body = response.get_data()
+                entry = (hashlib.sha1(body).hexdigest(), body, response.mimetype)
+                response_cache.set(cache_key, entry)
+
+            etag, body, mimetype = entry
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = Response(body, mimetype=mimetype)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache' if private else 'no-cache'
+            return response
+
+        return wrapper
+
+    return decorator
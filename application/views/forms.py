@@ -1,9 +1,11 @@
+import threading
+
 from flask.ext.wtf import Form
-from werkzeug.security import check_password_hash
 from wtforms import validators, PasswordField
 from wtforms.ext.sqlalchemy.orm import model_form
 
 from application import db, models
+from application.utils.throttle import login_throttle, LoginThrottled
 
 
 class BaseForm(Form):
@@ -29,75 +31,127 @@ class BaseForm(Form):
         super(BaseForm, self).__init__(*args, **kwargs)
 
 
-class LoginForm(model_form(models.User,
-                           base_class=BaseForm,
-                           db_session=db.session,
-                           exclude=['first_name', 'last_name', 'access_level'],
-                           field_args=models.User.get_field_args_login())):
+class LazyForm(object):
     """
-    Class representing the form handling authentication in the admin area.
+    Form class built on its first use. model_form reflects the model columns, which slows down the startup when done
+    at import time.
     """
 
-    def validate_username(self, field):
-        del field
+    # reentrant, building a form class can build its base form class
+    _lock = threading.RLock()
 
-        user = self.get_user()
+    def __init__(self, factory):
+        """
+        :param factory: Callable returning the form class.
+        """
 
-        if user is None:
-            raise validators.ValidationError('Username does not exist.')
+        self.factory = factory
+        self._form_class = None
 
-    def validate_password(self, field):
-        del field
+    @property
+    def form_class(self):
+        if self._form_class is None:
+            with self._lock:
+                if self._form_class is None:
+                    self._form_class = self.factory()
+        return self._form_class
 
-        user = self.get_user()
-        if user is None:
-            return
+    def __call__(self, *args, **kwargs):
+        return self.form_class(*args, **kwargs)
 
-        if not check_password_hash(user.password, self.password.data):
-            raise validators.ValidationError('Password is invalid.')
 
-    def get_user(self):
-        return models.User.query.filter_by(username=self.username.data).first()
+def _login_form():
+    class LoginForm(model_form(models.User,
+                               base_class=BaseForm,
+                               db_session=db.session,
+                               exclude=['first_name', 'last_name', 'access_level'],
+                               field_args=models.User.get_field_args_login())):
+        """
+        Class representing the form handling authentication in the admin area.
+        """
 
+        def validate_username(self, field):
+            del field
 
-class UserEditForm(model_form(models.User,
-                              base_class=BaseForm,
-                              db_session=db.session,
-                              field_args=models.User.get_field_args(True))):
-    """
-    Class representing the form handling the user editing from the admin area.
-    """
+            user = self.get_user()
 
-    confirm = PasswordField('Repeat Password')
-    field_order = ('first_name', 'last_name', 'access_level', 'username', 'password', 'confirm', '*')
+            if user is None:
+                raise validators.ValidationError('Username does not exist.')
 
-    def __init__(self, obj=None, *args, **kwargs):
+        def validate_password(self, field):
+            del field
 
-        # store the object id
-        self.id = obj.id if obj else None
+            user = self.get_user()
+            if user is None:
+                return
 
-        super(UserEditForm, self).__init__(obj=obj, *args, **kwargs)
+            try:
+                valid = login_throttle.check_password(user.username, user.password, self.password.data)
+            except LoginThrottled as e:
+                raise validators.ValidationError(str(e))
 
-    def get_user(self):
-        return models.User.query.filter_by(username=self.username.data).first()
+            if not valid:
+                raise validators.ValidationError('Password is invalid.')
 
-    def validate_username(self, field):
-        del field
+        def get_user(self):
+            # both validators and the login view need the user, load it once per username
+            if getattr(self, '_user_username', None) != self.username.data:
+                self._user = models.User.query.filter_by(username=self.username.data).first()
+                self._user_username = self.username.data
+            return self._user
 
-        user = self.get_user()
-        if user is None:
-            return
+    return LoginForm
 
-        # if not true, username was changed
-        if not (self.id and user.username == models.User.query.get(self.id).username):
-            raise validators.ValidationError('Username already exists.')
 
+def _user_edit_form():
+    class UserEditForm(model_form(models.User,
+                                  base_class=BaseForm,
+                                  db_session=db.session,
+                                  field_args=models.User.get_field_args(True))):
+        """
+        Class representing the form handling the user editing from the admin area.
+        """
 
-class UserCreateForm(model_form(models.User,
-                                base_class=UserEditForm,
-                                db_session=db.session,
-                                field_args=models.User.get_field_args())):
-    """
-    Class representing the form handling the user creating from the admin area.
-    """
-    pass
+        confirm = PasswordField('Repeat Password')
+        field_order = ('first_name', 'last_name', 'access_level', 'username', 'password', 'confirm', '*')
+
+        def __init__(self, obj=None, *args, **kwargs):
+
+            # store the object id
+            self.id = obj.id if obj else None
+
+            super(UserEditForm, self).__init__(obj=obj, *args, **kwargs)
+
+        def get_user(self):
+            return models.User.query.filter_by(username=self.username.data).first()
+
+        def validate_username(self, field):
+            del field
+
+            user = self.get_user()
+            if user is None:
+                return
+
+            # if not true, the username belongs to another user
+            if user.id != self.id:
+                raise validators.ValidationError('Username already exists.')
+
+    return UserEditForm
+
+
+def _user_create_form():
+    class UserCreateForm(model_form(models.User,
+                                    base_class=UserEditForm.form_class,
+                                    db_session=db.session,
+                                    field_args=models.User.get_field_args())):
+        """
+        Class representing the form handling the user creating from the admin area.
+        """
+        pass
+
+    return UserCreateForm
+
+
+LoginForm = LazyForm(_login_form)
+UserEditForm = LazyForm(_user_edit_form)
+UserCreateForm = LazyForm(_user_create_form)
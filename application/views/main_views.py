@@ -1,10 +1,21 @@
-from flask import render_template
-from flask.views import View
+import re
+
+from flask import render_template, request, abort, Response
+from flask.views import MethodView, View
+
+from application.utils.favicons import favicon_store
+from config import ActiveConfig
+from .caching import cached_response
+
+DIGEST_PATTERN = re.compile(r'^[0-9a-f]{40}$')
 
 
 class IndexView(View):
     methods = ['GET']
 
+    # the page only depends on the view arguments, fixed for the endpoint
+    decorators = [cached_response()]
+
     def __init__(self, template_name='index.html', view_title='Index'):
         self.params = {
             'template_name': template_name,
@@ -17,4 +28,33 @@ class IndexView(View):
         return render_template(self.params['template_name'], **context)
 
     def dispatch_request(self):
-        return self.render_template(self.params)
\ No newline at end of file
+        return self.render_template(self.params)
+
+
+class FaviconView(MethodView):
+    """
+    Serves the icons of the favicon store. The URL holds the digest of the content, so responses never change and are
+    cached by browsers for FAVICON_MAX_AGE without revalidation.
+
+    Icons come from other sites and SVG icons may hold scripts: they are served sandboxed, without any script or
+    request allowed, and browsers must not guess another type than the sniffed one.
+    """
+
+    SECURITY_HEADERS = {
+        'Content-Security-Policy': "default-src 'none'; style-src 'unsafe-inline'; sandbox",
+        'X-Content-Type-Options': 'nosniff'
+    }
+
+    def get(self, digest):
+        icon = favicon_store.get(digest) if DIGEST_PATTERN.match(digest) else None
+        if icon is None:
+            abort(404)
+
+        if request.if_none_match.contains(digest):
+            response = Response(status=304)
+        else:
+            response = Response(icon[0], mimetype=icon[1])
+        response.set_etag(digest)
+        response.headers['Cache-Control'] = 'public, max-age={0}, immutable'.format(ActiveConfig.FAVICON_MAX_AGE)
+        response.headers.extend(self.SECURITY_HEADERS)
+        return response
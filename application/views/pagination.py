@@ -0,0 +1,63 @@
+import base64
+import json
+
+from sqlalchemy import and_, or_
+
+
+class NoCountQuery(object):
+    """
+    Stands in for the Flask-Admin count query when the row count is skipped, absorbing the criteria applied to it.
+    """
+
+    def __init__(self, value=None):
+        self.value = value
+
+    def filter(self, *args, **kwargs):
+        return self
+
+    join = outerjoin = filter
+
+    def scalar(self):
+        return self.value
+
+
+def encode_cursor(values):
+    """
+    Encodes the sort key of a row as an opaque, url safe cursor.
+    """
+
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, size):
+    """
+    :return: The sort key values of the cursor or None if it is missing or invalid.
+    """
+
+    if not cursor:
+        return None
+
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (TypeError, ValueError, UnicodeError):
+        return None
+    return values if isinstance(values, list) and len(values) == size else None
+
+
+def seek_criterion(columns, values, descending=False):
+    """
+    Builds the criterion selecting the rows after the given sort key, in (columns) order.
+
+    The criterion is written so that the leading column bounds an index range:
+    c1 >= v1 AND (c1 > v1 OR (c1 = v1 AND (c2 > v2 OR ...)))
+    """
+
+    def after(column, value):
+        return column < value if descending else column > value
+
+    criterion = after(columns[-1], values[-1])
+    for column, value in reversed(list(zip(columns[:-1], values[:-1]))):
+        criterion = or_(after(column, value), and_(column == value, criterion))
+
+    bound = columns[0] <= values[0] if descending else columns[0] >= values[0]
+    return and_(bound, criterion)
@@ -0,0 +1,259 @@
+import functools
+import json
+import logging
+
+from flask import request, jsonify, g, make_response
+from flask.views import MethodView
+from jsonrpc2 import JsonRpc, JsonRpcException, PARSE_ERROR, INVALID_REQUEST, INTERNAL_ERROR, errors
+from sqlalchemy.exc import SQLAlchemyError
+
+from application import db, models
+from application.utils import Authentication
+from application.utils.search import BookmarkSearch
+from application.utils.tags import tag_index, InvalidTagQuery
+from application.utils.tree import tree_cache, TreeSnapshot
+
+
+logger = logging.getLogger(__name__)
+
+
+class NotFound(Exception):
+    pass
+
+
+class InvalidMove(Exception):
+    pass
+
+
+class InternalError(Exception):
+    """
+    Stands for an unexpected error of a call, whose details are logged but not sent to the client.
+    """
+
+    def __init__(self):
+        super(InternalError, self).__init__('The call failed, see the server log.')
+
+
+APPLICATION_ERRORS = {NotFound: -32001, InvalidTagQuery: -32002, InvalidMove: -32003, InternalError: -32004}
+
+
+BOOKMARK_FIELDS = ('title', 'url', 'tags', 'position')
+FOLDER_FIELDS = ('title', 'position')
+
+
+def _get_owned(model, object_id):
+    obj = model.query.get(object_id) if object_id is not None else None
+    if obj is None or obj.user_id != g.user_id:
+        raise NotFound('{0} {1} does not exist.'.format(model.__name__, object_id))
+    return obj
+
+
+def _get_folder(folder_id):
+    return _get_owned(models.Folder, folder_id) if folder_id is not None else None
+
+
+def bookmark_add(url, title='', folder_id=None, tags='', position=0):
+    bookmark = models.Bookmark(url, title, g.user_id, _get_folder(folder_id), position, tags=tags)
+    db.session.add(bookmark)
+    db.session.flush()
+    return bookmark.id
+
+
+def bookmark_get(id):
+    return _get_owned(models.Bookmark, id).to_dict()
+
+
+def bookmark_update(id, **fields):
+    bookmark = _get_owned(models.Bookmark, id)
+    if 'folder_id' in fields:
+        bookmark.folder = _get_folder(fields.pop('folder_id'))
+    for name in BOOKMARK_FIELDS:
+        if name in fields:
+            setattr(bookmark, name, fields[name])
+    db.session.flush()
+    return bookmark.to_dict()
+
+
+def bookmark_delete(id):
+    db.session.delete(_get_owned(models.Bookmark, id))
+    db.session.flush()
+    return True
+
+
+def bookmark_find(url):
+    return [b.to_dict() for b in models.Bookmark.find_url(g.user_id, url)]
+
+
+def bookmark_search(terms, limit=None):
+    return [b.to_dict() for b in BookmarkSearch.search(g.user_id, terms, limit)]
+
+
+def bookmark_tagged(query, limit=None):
+    ids = tag_index.select(g.user_id, query)[:limit]
+    bookmarks = dict((b.id, b) for b in models.Bookmark.query.filter(models.Bookmark.id.in_(ids))) if ids else {}
+    return [bookmarks[i].to_dict() for i in ids if i in bookmarks]
+
+
+def tag_counts():
+    return tag_index.counts(g.user_id)
+
+
+def folder_add(title, parent_id=None, position=0):
+    parent = _get_folder(parent_id)
+    folder = models.Folder(title, g.user_id, parent, position)
+    db.session.add(folder)
+    db.session.flush()
+    return folder.id
+
+
+def folder_update(id, **fields):
+    folder = _get_owned(models.Folder, id)
+    if 'parent_id' in fields:
+        parent = _get_folder(fields.pop('parent_id'))
+        # checked here, the flush would fail the rest of the batch
+        if parent is not None and parent.full_path.startswith(folder.full_path):
+            raise InvalidMove('Folder {0} can\'t be moved under itself.'.format(id))
+        folder.parent = parent
+    for name in FOLDER_FIELDS:
+        if name in fields:
+            setattr(folder, name, fields[name])
+    db.session.flush()
+    return folder.to_dict()
+
+
+def _read_tree(method, folder_id):
+    try:
+        return method(tree_cache.get(g.user_id), folder_id)
+    except KeyError:
+        raise NotFound('Folder {0} does not exist.'.format(folder_id))
+
+
+def folder_children(id=None):
+    folders, bookmarks = _read_tree(TreeSnapshot.children, id)
+    return {'folders': folders, 'bookmarks': bookmarks}
+
+
+def folder_subtree(id=None):
+    folders, bookmarks = _read_tree(TreeSnapshot.subtree, id)
+    return {'folders': folders, 'bookmarks': bookmarks}
+
+
+def folder_path(id):
+    return _read_tree(TreeSnapshot.path, id)
+
+
+def folder_delete(id):
+    _get_owned(models.Folder, id).delete_subtree()
+    db.session.flush()
+    return True
+
+
+def _guarded(method):
+    """
+    Logs the unexpected errors of a method and replaces them with an InternalError, jsonrpc2 would send their text,
+    which may hold SQL statements and their parameters, to the client.
+    """
+
+    @functools.wraps(method)
+    def call(*args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        except tuple(APPLICATION_ERRORS):
+            raise
+        except Exception:
+            logger.exception('RPC method %s failed', method.__name__)
+            raise InternalError()
+    return call
+
+
+# stands in for the id of the calls while jsonrpc2 processes them, so none of them is taken for a notification
+_ANSWERED = 'answered'
+
+
+class RpcDispatcher(JsonRpc):
+    """
+    JsonRpc answering every call with an id. jsonrpc2 takes a call with an id of 0 for a notification and drops its
+    result, only the calls without an id member are notifications here.
+    """
+
+    def __init__(self, methods, application_errors):
+        super(RpcDispatcher, self).__init__(dict((name, _guarded(method)) for name, method in methods.items()),
+                                            application_errors)
+
+    def process(self, data, extra_vars):
+        rpc_id = data.get('id')
+        try:
+            response = super(RpcDispatcher, self).process(dict(data, id=_ANSWERED), extra_vars)
+        except JsonRpcException as e:
+            e.rpc_id = rpc_id
+            raise
+
+        if 'id' not in data:
+            return None
+        response['id'] = rpc_id
+        return response
+
+
+rpc = RpcDispatcher({
+    'bookmarks.add': bookmark_add,
+    'bookmarks.get': bookmark_get,
+    'bookmarks.update': bookmark_update,
+    'bookmarks.delete': bookmark_delete,
+    'bookmarks.find': bookmark_find,
+    'bookmarks.search': bookmark_search,
+    'bookmarks.tagged': bookmark_tagged,
+    'tags.counts': tag_counts,
+    'folders.add': folder_add,
+    'folders.update': folder_update,
+    'folders.delete': folder_delete,
+    'folders.children': folder_children,
+    'folders.subtree': folder_subtree,
+    'folders.path': folder_path
+}, APPLICATION_ERRORS)
+
+
+def _error(code, data=None):
+    error = {'code': code, 'message': errors[code]}
+    if data:
+        error['data'] = data
+    return {'jsonrpc': '2.0', 'id': None, 'error': error}
+
+
+class RpcView(MethodView):
+    """
+    JSON-RPC 2.0 endpoint of the browser extension, single and batch requests.
+
+    The batch is authorized once and all its calls run in one transaction, committed after the last call. There are
+    no savepoints. The methods check the owners of the objects and the moves of the folders before they change
+    anything, so a call failing with an application error leaves no changes behind and the batch goes on. A call
+    failing in the database, e.g. on a value of the wrong type, fails the calls after it; the whole batch is then
+    rolled back and a single error is returned. Unexpected errors are logged, the client only gets their code.
+    """
+
+    decorators = [Authentication.login_required]
+
+    def post(self):
+        try:
+            data = json.loads(request.get_data(as_text=True))
+        except ValueError:
+            return jsonify(_error(PARSE_ERROR))
+
+        if not isinstance(data, (dict, list)) or data == []:
+            return jsonify(_error(INVALID_REQUEST))
+
+        try:
+            result = rpc(data)
+            # a failed flush is reported by the call that caused it, the commit then fails for the whole batch
+            db.session.commit()
+        except SQLAlchemyError:
+            logger.exception('RPC batch failed')
+            db.session.rollback()
+            return jsonify(_error(INTERNAL_ERROR))
+
+        if not result:
+            # notifications only
+            return make_response('', 204)
+        if isinstance(result, list):
+            # flask's jsonify doesn't accept top level arrays
+            return make_response(json.dumps(result), 200, {'Content-Type': 'application/json'})
+        return jsonify(result)
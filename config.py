@@ -20,11 +20,127 @@ class AppConfig(object):
 
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(PathsConfig.BASE_DIR, 'data.sqlite')
 
+    # sqlite tuning: pragmas applied to every new connection (None keeps the sqlite default), the size of the write
+    # pool and of the optional read only pool used by the selects of read only views (0 disables it)
+    SQLITE_JOURNAL_MODE = 'WAL'
+    SQLITE_SYNCHRONOUS = 'NORMAL'
+    SQLITE_BUSY_TIMEOUT = 5000
+    SQLITE_CACHE_SIZE = -16000
+    SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+    SQLITE_TEMP_STORE = 'MEMORY'
+    SQLALCHEMY_POOL_SIZE = 8
+    SQLITE_READ_POOL_SIZE = 0
+
     WTF_CSRF_ENABLED = False
     SECRET_KEY = "this is a secret key"
 
     APP_NAME = 'XPy Bookmark Tools'
 
+    # verified credentials cache used by the API authentication
+    AUTH_CACHE_SIZE = 1024
+    AUTH_CACHE_TTL = 300
+
+    # password hashing worker processes, None uses one per core and 0 hashes on the request thread
+    HASHING_WORKERS = None
+    HASHING_QUEUE_SIZE = 32
+    HASHING_TIMEOUT = 10
+
+    # snapshots of the logged in users kept by the flask-login user loader
+    USER_CACHE_SIZE = 1024
+    USER_CACHE_TTL = 30
+
+    # number of bookmarks inserted per statement by the importer
+    IMPORT_BATCH_SIZE = 1000
+
+    # full text search result limits, the index is optimized after imports of at least SEARCH_OPTIMIZE_ROWS bookmarks
+    SEARCH_DEFAULT_LIMIT = 20
+    SEARCH_MAX_LIMIT = 100
+    SEARCH_OPTIMIZE_ROWS = 10000
+
+    # delta sync page sizes and the age after which delete entries are dropped from the change log
+    SYNC_PAGE_SIZE = 500
+    SYNC_MAX_PAGE_SIZE = 5000
+    SYNC_CHUNK_SIZE = 100
+    SYNC_TOMBSTONE_DAYS = 90
+
+    # export: rows fetched per cursor batch and the size of the streamed chunks
+    EXPORT_BATCH_SIZE = 1000
+    EXPORT_CHUNK_SIZE = 64 * 1024
+
+    # per request query statistics: response headers and the repeat count reported as a possible N+1 query
+    QUERY_STATS_HEADERS = True
+    QUERY_REPEAT_THRESHOLD = 5
+
+    # link checker: concurrent checks, in total and per host, seconds per link including redirects, results written
+    # per batch and idle keep-alive connections kept
+    LINKCHECK_CONCURRENCY = 64
+    LINKCHECK_PER_HOST = 4
+    LINKCHECK_TIMEOUT = 15
+    LINKCHECK_MAX_REDIRECTS = 5
+    LINKCHECK_BATCH_SIZE = 500
+    LINKCHECK_MAX_IDLE = 100
+    LINKCHECK_USER_AGENT = 'Mozilla/5.0 (compatible; XPy Bookmark Tools link checker)'
+
+    # rendered responses of the cached views, bounded by count and by the total size of the bodies
+    RESPONSE_CACHE_SIZE = 4096
+    RESPONSE_CACHE_BYTES = 32 * 1024 * 1024
+
+    # near duplicate clustering: minhash permutations, lsh bands (permutations / bands rows each), estimated jaccard
+    # similarity confirming a pair and bookmarks signed per batch
+    MINHASH_PERMUTATIONS = 96
+    MINHASH_BANDS = 32
+    MINHASH_THRESHOLD = 0.5
+    MINHASH_BATCH_SIZE = 1000
+
+    # tag index: users kept in memory, total size of their bitmaps and changed bookmarks patched in before the index
+    # of an user is built again instead
+    TAG_INDEX_USERS = 256
+    TAG_INDEX_BYTES = 64 * 1024 * 1024
+    TAG_INDEX_CATCH_UP = 1000
+
+    # tree snapshots served to full syncs: users kept in memory and total size of their trees
+    TREE_CACHE_USERS = 64
+    TREE_CACHE_BYTES = 128 * 1024 * 1024
+
+    # favicon store: pack files under the static directory, size of a pack, total size kept before the oldest packs
+    # are evicted, largest icon stored, icon locations cached and seconds browsers may keep an icon
+    FAVICON_DIR = os.path.join(PathsConfig.STATIC_DIR, 'favicons')
+    FAVICON_PACK_SIZE = 16 * 1024 * 1024
+    FAVICON_MAX_BYTES = 256 * 1024 * 1024
+    FAVICON_MAX_ICON_SIZE = 64 * 1024
+    FAVICON_CACHE_SIZE = 65536
+    FAVICON_MAX_AGE = 365 * 24 * 3600
+
+    # login throttle: failed password checks allowed in a burst and refilled per second, per username and per client
+    # address; buckets kept in memory, or shared by the workers through the database
+    LOGIN_USER_BURST = 10
+    LOGIN_USER_RATE = 10 / 60.0
+    LOGIN_CLIENT_BURST = 30
+    LOGIN_CLIENT_RATE = 30 / 60.0
+    LOGIN_THROTTLE_KEYS = 65536
+    LOGIN_THROTTLE_SHARED = False
+
+    # background jobs: worker threads per serving process (0 leaves the jobs to manage.py jobs-worker), seconds an idle
+    # worker waits before polling the queue again, attempts per job, seconds before the first retry (doubled for each
+    # next one), seconds between progress writes, days finished jobs are kept and the directory of their files
+    JOB_WORKERS = 2
+    JOB_POLL_INTERVAL = 5
+    JOB_MAX_ATTEMPTS = 3
+    JOB_RETRY_DELAY = 30
+    JOB_PROGRESS_INTERVAL = 1.0
+    JOB_KEEP_DAYS = 7
+    JOB_DIR = os.path.join(PathsConfig.BASE_DIR, 'jobs')
+
+    # runtime metrics served at /metrics in the Prometheus text format
+    METRICS_ENABLED = True
+
+    # serve.py: worker processes (None uses one per core), request threads per worker, listen backlog and the
+    # seconds the workers get to finish their requests on shutdown
+    SERVER_WORKERS = None
+    SERVER_THREADS = 8
+    SERVER_BACKLOG = 128
+    SERVER_GRACEFUL_TIMEOUT = 30
+
 
 class TestingConfig(AppConfig):
     """
@@ -33,6 +149,11 @@ class TestingConfig(AppConfig):
     SERVER_PORT = 3000
     DEBUG = True
 
+    HASHING_WORKERS = 0
+    SERVER_WORKERS = 1
+
+    JOB_RETRY_DELAY = 0
+
 
 class ProductionConfig(AppConfig):
     """
@@ -40,6 +161,12 @@ class ProductionConfig(AppConfig):
     """
     SERVER_PORT = 80
 
+    QUERY_STATS_HEADERS = False
+
+    SQLITE_READ_POOL_SIZE = 8
+
+    LOGIN_THROTTLE_SHARED = True
+
 
 # class renaming to quickly switch between configurations
 class GenericConfig(TestingConfig):
@@ -0,0 +1,347 @@
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from application import db, models
+from config import ActiveConfig
+
+
+def import_bookmarks(args):
+    """
+    Imports a Firefox places.sqlite or Chrome Bookmarks file for an user, with the favicons of the profile.
+    """
+
+    from application import importers
+    from application.importers.favicons import find_icons
+
+    user = models.User.query.filter_by(username=args.user).first()
+    if user is None:
+        sys.exit('User {0} does not exist.'.format(args.user))
+
+    icons_path = None if args.no_icons else args.icons or find_icons(args.path)
+    stats = importers.import_file(args.path, user.id, args.batch_size, icons_path=icons_path)
+    print(stats)
+
+
+def rebuild_search(args):
+    """
+    Rebuilds the full text search index from the bookmarks table.
+    """
+
+    from application.utils.search import BookmarkSearch
+
+    del args
+    BookmarkSearch.rebuild()
+    BookmarkSearch.optimize()
+
+
+def compact_sync(args):
+    """
+    Compacts the sync change log and drops delete entries older than the retention period.
+    """
+
+    before = datetime.utcnow() - timedelta(days=args.days)
+    removed = models.Change.compact()
+    for (user_id,) in db.session.query(models.User.id):
+        removed += models.Change.truncate(user_id, before)
+    db.session.commit()
+    print('Removed {0} change log entries.'.format(removed))
+
+
+def check_links(args):
+    """
+    Checks the bookmark urls for dead links and stores the results.
+    """
+
+    from application.utils.linkcheck import LinkChecker
+
+    user_id = None
+    if args.user is not None:
+        user = models.User.query.filter_by(username=args.user).first()
+        if user is None:
+            sys.exit('User {0} does not exist.'.format(args.user))
+        user_id = user.id
+
+    checked_before = datetime.utcnow() - timedelta(days=args.stale_days) if args.stale_days is not None else None
+    stats = LinkChecker(user_id, args.concurrency, args.per_host, args.timeout, checked_before=checked_before).run()
+    print(stats)
+
+
+def dedup(args):
+    """
+    Reports the bookmarks saved more than once under the same canonical url, optionally merging them.
+    """
+
+    from application.utils.dedup import Duplicates
+
+    user = models.User.query.filter_by(username=args.user).first()
+    if user is None:
+        sys.exit('User {0} does not exist.'.format(args.user))
+
+    groups = Duplicates.report(user.id)
+    for group in groups[:args.show]:
+        print('{0} x {1}'.format(group.count, models.Bookmark.query.get(group.ids[0]).url))
+    print('{0} urls saved more than once, {1} duplicate bookmarks.'.format(
+        len(groups), sum(group.count - 1 for group in groups)))
+
+    if args.merge:
+        deleted = Duplicates.merge(user.id)
+        db.session.commit()
+        print('Deleted {0} duplicate bookmarks.'.format(deleted))
+
+
+def near_dups(args):
+    """
+    Clusters the near duplicate bookmarks of an user by title and url similarity.
+    """
+
+    from application.utils.minhash import NearDuplicates
+
+    user = models.User.query.filter_by(username=args.user).first()
+    if user is None:
+        sys.exit('User {0} does not exist.'.format(args.user))
+
+    stats = NearDuplicates.rebuild(user.id) if args.rebuild else NearDuplicates.update(user.id)
+    db.session.commit()
+    print(stats)
+
+    clusters = NearDuplicates.clusters(user.id)
+    for ids in clusters[:args.show]:
+        print(', '.join(models.Bookmark.query.get(i).title or str(i) for i in ids))
+    print('{0} clusters of near duplicate bookmarks.'.format(len(clusters)))
+
+
+def tree_memory(args):
+    """
+    Compares the memory used by the tree snapshot of an user with the ORM objects of the same tree.
+    """
+
+    import tracemalloc
+    from application.utils.tree import TreeSnapshot
+
+    user = models.User.query.filter_by(username=args.user).first()
+    if user is None:
+        sys.exit('User {0} does not exist.'.format(args.user))
+
+    def measure(load):
+        db.session.expunge_all()
+        tracemalloc.start()
+        start = time.time()
+        result = load()
+        seconds = time.time() - start
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return result, size, seconds
+
+    snapshot, snapshot_size, snapshot_seconds = measure(lambda: TreeSnapshot(user.id))
+    objects, orm_size, orm_seconds = measure(
+        lambda: models.Folder.query.filter_by(user_id=user.id).all() +
+        models.Bookmark.query.filter_by(user_id=user.id).all())
+
+    print('{0} folders, {1} bookmarks'.format(snapshot.folder_count, snapshot.bookmark_count))
+    print('snapshot: {0:.1f} KB in {1:.2f}s ({2:.1f} KB reported)'.format(
+        snapshot_size / 1024.0, snapshot_seconds, snapshot.nbytes / 1024.0))
+    print('orm:      {0:.1f} KB in {1:.2f}s'.format(orm_size / 1024.0, orm_seconds))
+    del objects
+
+
+def jobs(args):
+    """
+    Lists the background jobs, or cancels, retries or purges them.
+    """
+
+    from application.utils.jobs import Jobs
+
+    if args.cancel is not None:
+        print('Cancelled.' if Jobs.cancel(args.cancel) else 'Job {0} is not queued or running.'.format(args.cancel))
+    elif args.retry is not None:
+        print('Queued.' if Jobs.retry(args.retry) else 'Job {0} has not failed.'.format(args.retry))
+    elif args.purge is not None:
+        print('Deleted {0} jobs.'.format(Jobs.purge(datetime.utcnow() - timedelta(days=args.purge))))
+    else:
+        for job in models.Job.query.order_by(models.Job.id.desc()).limit(args.show):
+            done, total, message = Jobs.progress_of(job)
+            print('{0:>6} {1:<12} {2:<10} {3}/{4} {5}{6}'.format(
+                job.id, job.kind, job.status, job.attempts, job.max_attempts,
+                '{0:.0f}% '.format(100.0 * done / total) if total else '', job.error or message or ''))
+
+
+def jobs_worker(args):
+    """
+    Runs the background jobs until interrupted, alongside or instead of the workers of the server processes.
+    """
+
+    import signal
+    from application.utils.jobs import JobRunner
+
+    runner = JobRunner(args.workers, args.poll_interval)
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+
+    runner.start()
+    print('Running jobs with {0} workers.'.format(args.workers))
+    try:
+        while not stopping.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    # the jobs being run are queued again, at their next progress report or after the timeout
+    runner.stop(args.graceful_timeout)
+
+
+def _bench_profile(path, pragmas, writers, readers, seconds):
+    """
+    Runs concurrent writer and reader threads, each with its own connection, against a fresh database.
+
+    :return: A (writes, reads, lock errors) tuple.
+    """
+
+    from application.database import apply_pragmas
+
+    setup = sqlite3.connect(path)
+    apply_pragmas(setup, pragmas)
+    setup.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, user_id INTEGER, title TEXT)')
+    setup.execute('CREATE INDEX ix_items_user ON items (user_id)')
+    setup.commit()
+    setup.close()
+
+    counts = {'writes': 0, 'reads': 0, 'locked': 0}
+    lock = threading.Lock()
+    deadline = time.time() + seconds
+
+    def run(write, n):
+        connection = sqlite3.connect(path, timeout=0.1, check_same_thread=False)
+        apply_pragmas(connection, [p for p in pragmas if p[0] != 'journal_mode'])
+        done = locked = 0
+        while time.time() < deadline:
+            try:
+                if write:
+                    connection.execute('INSERT INTO items (user_id, title) VALUES (?, ?)', (n, 'item'))
+                    connection.commit()
+                else:
+                    connection.execute('SELECT COUNT(*) FROM items WHERE user_id = ?', (n,)).fetchone()
+                done += 1
+            except sqlite3.OperationalError:
+                connection.rollback()
+                locked += 1
+        connection.close()
+        with lock:
+            counts['writes' if write else 'reads'] += done
+            counts['locked'] += locked
+
+    threads = [threading.Thread(target=run, args=(True, n)) for n in range(writers)]
+    threads += [threading.Thread(target=run, args=(False, n)) for n in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return counts['writes'], counts['reads'], counts['locked']
+
+
+def bench_sqlite(args):
+    """
+    Compares the concurrent throughput of the default sqlite settings with the configured pragmas.
+    """
+
+    from application.database import sqlite_pragmas
+
+    profiles = [('default', [('busy_timeout', ActiveConfig.SQLITE_BUSY_TIMEOUT)]), ('configured', sqlite_pragmas())]
+    for name, pragmas in profiles:
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'bench.sqlite')
+        writes, reads, locked = _bench_profile(path, pragmas, args.writers, args.readers, args.seconds)
+        print('{0:>10}: {1:8.0f} writes/s {2:8.0f} reads/s {3:6d} lock errors'.format(
+            name, writes / args.seconds, reads / args.seconds, locked))
+        for filename in os.listdir(directory):
+            os.remove(os.path.join(directory, filename))
+        os.rmdir(directory)
+
+
+def main():
+    from application.utils.initializers import init_db
+
+    parser = argparse.ArgumentParser(description='XPy Bookmark Tools management commands.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    parser_import = subparsers.add_parser('import', help=import_bookmarks.__doc__.strip())
+    parser_import.add_argument('path', help='places.sqlite or Bookmarks file')
+    parser_import.add_argument('--user', default='admin', help='owner of the imported bookmarks')
+    parser_import.add_argument('--batch-size', type=int, default=None, help='bookmarks inserted per statement')
+    parser_import.add_argument('--icons',
+                               help='favicons.sqlite or Favicons file, found next to the bookmarks if missing')
+    parser_import.add_argument('--no-icons', action='store_true', help='skip the favicons')
+    parser_import.set_defaults(func=import_bookmarks)
+
+    parser_search = subparsers.add_parser('rebuild-search', help=rebuild_search.__doc__.strip())
+    parser_search.set_defaults(func=rebuild_search)
+
+    parser_compact = subparsers.add_parser('compact-sync', help=compact_sync.__doc__.strip())
+    parser_compact.add_argument('--days', type=int, default=ActiveConfig.SYNC_TOMBSTONE_DAYS,
+                                help='age in days after which delete entries are dropped')
+    parser_compact.set_defaults(func=compact_sync)
+
+    parser_links = subparsers.add_parser('check-links', help=check_links.__doc__.strip())
+    parser_links.add_argument('--user', default=None, help='owner of the checked bookmarks, all users if missing')
+    parser_links.add_argument('--concurrency', type=int, default=None, help='concurrent checks')
+    parser_links.add_argument('--per-host', type=int, default=None, help='concurrent checks per host')
+    parser_links.add_argument('--timeout', type=float, default=None, help='seconds per link')
+    parser_links.add_argument('--stale-days', type=int, default=None,
+                              help='only check links not checked in this many days')
+    parser_links.set_defaults(func=check_links)
+
+    parser_dedup = subparsers.add_parser('dedup', help=dedup.__doc__.strip())
+    parser_dedup.add_argument('--user', default='admin', help='owner of the bookmarks')
+    parser_dedup.add_argument('--show', type=int, default=20, help='number of duplicated urls listed')
+    parser_dedup.add_argument('--merge', action='store_true', help='keep the oldest bookmark of each url only')
+    parser_dedup.set_defaults(func=dedup)
+
+    parser_near = subparsers.add_parser('near-dups', help=near_dups.__doc__.strip())
+    parser_near.add_argument('--user', default='admin', help='owner of the bookmarks')
+    parser_near.add_argument('--show', type=int, default=20, help='number of clusters listed')
+    parser_near.add_argument('--rebuild', action='store_true', help='sign all the bookmarks again')
+    parser_near.set_defaults(func=near_dups)
+
+    parser_tree = subparsers.add_parser('tree-memory', help=tree_memory.__doc__.strip())
+    parser_tree.add_argument('--user', default='admin', help='owner of the bookmarks')
+    parser_tree.set_defaults(func=tree_memory)
+
+    parser_jobs = subparsers.add_parser('jobs', help=jobs.__doc__.strip())
+    parser_jobs.add_argument('--show', type=int, default=20, help='number of jobs listed, latest first')
+    parser_jobs.add_argument('--cancel', type=int, default=None, metavar='ID', help='cancel a queued or running job')
+    parser_jobs.add_argument('--retry', type=int, default=None, metavar='ID', help='queue a failed job again')
+    parser_jobs.add_argument('--purge', type=int, default=None, metavar='DAYS',
+                             help='delete the jobs finished more than this many days ago')
+    parser_jobs.set_defaults(func=jobs)
+
+    parser_worker = subparsers.add_parser('jobs-worker', help=jobs_worker.__doc__.strip())
+    parser_worker.add_argument('--workers', type=int, default=max(ActiveConfig.JOB_WORKERS, 1),
+                               help='worker threads')
+    parser_worker.add_argument('--poll-interval', type=float, default=ActiveConfig.JOB_POLL_INTERVAL,
+                               help='seconds between the polls of an idle worker')
+    parser_worker.add_argument('--graceful-timeout', type=float, default=ActiveConfig.SERVER_GRACEFUL_TIMEOUT,
+                               help='seconds the running jobs get to stop on shutdown')
+    parser_worker.set_defaults(func=jobs_worker)
+
+    parser_bench = subparsers.add_parser('bench-sqlite', help=bench_sqlite.__doc__.strip())
+    parser_bench.add_argument('--writers', type=int, default=4, help='concurrent writer threads')
+    parser_bench.add_argument('--readers', type=int, default=8, help='concurrent reader threads')
+    parser_bench.add_argument('--seconds', type=float, default=5, help='duration of each run')
+    parser_bench.set_defaults(func=bench_sqlite)
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    init_db(db)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3 @@
+from application.server import serve
+
+serve()
@@ -19,6 +19,25 @@ if __name__ == '__main__':
         cov.start()
 
     from tests.test_db import DatabaseTests
+    from tests.test_authentication import AuthenticationTests
+    from tests.test_hashing import HashingTests
+    from tests.test_bookmarks import BookmarkTreeTests
+    from tests.test_importers import ImportTests
+    from tests.test_search import SearchTests
+    from tests.test_sync import SyncTests
+    from tests.test_rpc import RpcTests
+    from tests.test_duplicates import DuplicateTests
+    from tests.test_tags import TagTests
+    from tests.test_favicons import FaviconTests
+    from tests.test_export import ExportTests
+    from tests.test_pagination import PaginationTests
+    from tests.test_query_stats import QueryStatsTests
+    from tests.test_metrics import MetricsTests
+    from tests.test_server import ServerTests
+    from tests.test_database import DatabaseTuningTests
+    from tests.test_caching import ResponseCacheTests
+    from tests.test_linkcheck import LinkCheckTests
+    from tests.test_jobs import JobQueueTests
     try:
         import unittest
         unittest.main()
@@ -0,0 +1,41 @@
+import base64
+import os
+import unittest
+
+from application.utils.initializers import init_db, init_app, init_login, init_admin
+from config import ActiveConfig, PathsConfig
+
+
+from application import db, app, models
+
+
+class BookmarkTestCase(unittest.TestCase):
+    """
+    Base class for the bookmark feature tests, run against a new test database holding the default user.
+    """
+
+    # basic authorization of the default user
+    auth = {'Authorization': 'Basic ' + base64.b64encode(b'admin:password').decode('ascii')}
+
+    def setUp(self):
+        """
+        Set the Test Unit up
+        """
+
+        ActiveConfig.TESTING = True
+        ActiveConfig.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(PathsConfig.BASE_DIR, 'test.sqlite')
+        app.config.from_object(ActiveConfig)
+        db.session.close()
+        db.drop_all()
+        init_db(db)
+        self.user = models.User.query.first()
+
+        # routes can only be registered once, before the first request
+        if 'index' not in app.view_functions:
+            init_app(app)
+            init_login(app)
+            init_admin(app, db)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
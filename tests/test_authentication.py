@@ -0,0 +1,255 @@
+import base64
+import os
+import unittest
+
+from application.utils import Authentication, DefaultCredentials, hashing
+from application.utils.initializers import init_db, init_app, init_login, init_admin
+from application.utils.throttle import login_throttle, LoginThrottle, LoginThrottled
+from application.utils.user_cache import user_cache, UserSnapshot
+from config import ActiveConfig, PathsConfig
+
+
+from application import db, app, models
+
+
+class BusyHasher(hashing.PasswordHasher):
+    """
+    Hasher rejecting every check, like a full hashing pool.
+    """
+
+    def check(self, pwhash, password):
+        raise hashing.HashingQueueFull()
+
+
+class AuthenticationTests(unittest.TestCase):
+    """
+    Class for authentication related tests.
+    """
+
+    def setUp(self):
+        """
+        Set the Test Unit up
+        """
+
+        ActiveConfig.TESTING = True
+        ActiveConfig.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(PathsConfig.BASE_DIR, 'test.sqlite')
+        app.config.from_object(ActiveConfig)
+        db.session.close()
+        db.drop_all()
+        init_db(db)
+        Authentication.credential_cache.clear()
+        login_throttle.reset()
+
+    def test_credential_cache(self):
+        """
+        Test the verified credentials cache.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - valid credentials checked twice
+        # post:
+        #   - second check is served from the cache
+
+        cache = Authentication.credential_cache
+        hits, misses = cache.hits, cache.misses
+
+        assert Authentication.check_authorization('admin', 'password')
+        assert Authentication.check_authorization('admin', 'password')
+        assert cache.misses == misses + 1
+        assert cache.hits == hits + 1
+
+        # TEST CASE:
+        # cond:
+        #   - invalid credentials
+        # post:
+        #   - they are never cached
+
+        assert not Authentication.check_authorization('admin', 'wrong')
+        assert not Authentication.check_authorization('admin', 'wrong')
+        assert cache.stats()['size'] == 1
+
+        # TEST CASE:
+        # cond:
+        #   - the password of the user is changed
+        # post:
+        #   - the cached verification is dropped
+
+        user = models.User.query.filter_by(username='admin').first()
+        user.password = models.User('admin', 'changed').password
+        db.session.commit()
+
+        assert cache.stats()['size'] == 0
+        assert not Authentication.check_authorization('admin', 'password')
+        assert Authentication.check_authorization('admin', 'changed')
+
+    def test_default_credentials(self):
+        """
+        Test the tracking of the default login info.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - fresh database
+        # post:
+        #   - default credentials are reported as active
+
+        assert DefaultCredentials.is_active()
+
+        # TEST CASE:
+        # cond:
+        #   - password of the default user is changed, then rolled back
+        # post:
+        #   - status is unchanged
+
+        user = models.User.query.filter_by(username=DefaultCredentials.username).first()
+        user.password = models.User('admin', 'changed').password
+        db.session.flush()
+        db.session.rollback()
+        assert DefaultCredentials.is_active()
+
+        # TEST CASE:
+        # cond:
+        #   - password of the default user is changed and committed
+        # post:
+        #   - default credentials are no longer reported
+
+        user = models.User.query.filter_by(username=DefaultCredentials.username).first()
+        user.password = models.User('admin', 'changed').password
+        db.session.commit()
+        assert not DefaultCredentials.is_active()
+
+        # TEST CASE:
+        # cond:
+        #   - the default user is recreated with the default password
+        # post:
+        #   - default credentials are reported again
+
+        db.session.delete(user)
+        db.session.commit()
+        assert not DefaultCredentials.is_active()
+
+        db.session.add(models.User(DefaultCredentials.username, DefaultCredentials.password))
+        db.session.commit()
+        assert DefaultCredentials.is_active()
+
+        # TEST CASE:
+        # cond:
+        #   - password of the default user is changed while the hashing pool is busy
+        # post:
+        #   - the commit succeeds, the password is checked on the next read
+
+        user = models.User.query.filter_by(username=DefaultCredentials.username).first()
+        user.password = models.User('admin', 'changed').password
+        previous = hashing.set_hasher(BusyHasher())
+        try:
+            db.session.commit()
+        finally:
+            hashing.set_hasher(previous)
+        assert not DefaultCredentials.is_active()
+
+    def test_user_cache(self):
+        """
+        Test the user snapshots served to flask-login.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - user loaded twice
+        # post:
+        #   - the same detached snapshot is returned, with the access level title
+
+        user_cache.clear()
+        user = models.User.query.filter_by(username='admin').first()
+
+        snapshot = user_cache.get(str(user.id))
+        assert isinstance(snapshot, UserSnapshot)
+        assert user_cache.get(user.id) is snapshot
+        assert snapshot.access_level == 'Administrator'
+        assert snapshot.get_full_name == user.get_full_name
+        self.assertRaises(AttributeError, setattr, snapshot, 'username', 'other')
+
+        # TEST CASE:
+        # cond:
+        #   - the user or its access level are updated
+        # post:
+        #   - the snapshot is rebuilt
+
+        user.first_name = 'Jane'
+        db.session.commit()
+        assert user_cache.get(user.id).first_name == 'Jane'
+
+        user.access_level.title = 'Root'
+        db.session.commit()
+        assert user_cache.get(user.id).access_level == 'Root'
+
+        # TEST CASE:
+        # cond:
+        #   - missing user or invalid id
+        # post:
+        #   - nothing is returned
+
+        assert user_cache.get(user.id + 100) is None
+        assert user_cache.get('invalid') is None
+
+    def test_login_throttle(self):
+        """
+        Test the token buckets limiting the failed password checks.
+        """
+
+        pwhash = models.User('user', 'secret').password
+
+        # TEST CASE:
+        # cond:
+        #   - successful checks, then more failed checks than the username burst
+        # post:
+        #   - successful checks are not limited
+        #   - the check over the limit is refused before hashing, even with the right password
+
+        throttle = LoginThrottle(3, 0.001, 100, 0.001)
+        for _ in range(5):
+            assert throttle.check_password('user', pwhash, 'secret', client='10.0.0.1')
+        for _ in range(3):
+            assert not throttle.check_password('User', pwhash, 'wrong', client='10.0.0.1')
+
+        checks = throttle.stats()['checks']
+        self.assertRaises(LoginThrottled, throttle.check_password, 'user', pwhash, 'secret', client='10.0.0.2')
+        assert throttle.stats()['checks'] == checks
+        assert throttle.stats()['rejected'] == 1
+        assert throttle.check_password('other', pwhash, 'secret', client='10.0.0.1')
+
+        # TEST CASE:
+        # cond:
+        #   - failed checks of several usernames from one client, buckets in the database
+        # post:
+        #   - the client is limited, other clients are not
+
+        throttle = LoginThrottle(100, 0.001, 2, 0.001, shared=True)
+        assert not throttle.check_password('a', pwhash, 'wrong', client='10.0.0.1')
+        assert not throttle.check_password('b', pwhash, 'wrong', client='10.0.0.1')
+        self.assertRaises(LoginThrottled, throttle.check_password, 'c', pwhash, 'secret', client='10.0.0.1')
+        assert throttle.check_password('c', pwhash, 'secret', client='10.0.0.2')
+        assert models.LoginBucket.query.get('client:10.0.0.1').tokens < 1
+
+        # TEST CASE:
+        # cond:
+        #   - API requests with a wrong password past the limit
+        # post:
+        #   - they are answered with 429 and a retry delay
+
+        # routes can only be registered once, before the first request
+        if 'index' not in app.view_functions:
+            init_app(app)
+            init_login(app)
+            init_admin(app, db)
+
+        client = app.test_client()
+        auth = {'Authorization': 'Basic ' + base64.b64encode(b'admin:wrong').decode('ascii')}
+        statuses = [client.get('/api/search?q=a', headers=auth).status_code
+                    for _ in range(ActiveConfig.LOGIN_USER_BURST + 1)]
+        assert statuses == [403] * ActiveConfig.LOGIN_USER_BURST + [429]
+        assert int(client.get('/api/search?q=a', headers=auth).headers['Retry-After']) > 0
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,75 @@
+from tests.base import BookmarkTestCase
+
+
+from application import db, models
+
+
+class BookmarkTreeTests(BookmarkTestCase):
+    """
+    Class for bookmark and folder model tests.
+    """
+
+    def test_materialized_path(self):
+        """
+        Test the folder hierarchy stored as materialized paths.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - nested folders with bookmarks
+        # post:
+        #   - paths hold the ancestors
+        #   - subtree queries return everything under a folder and nothing else
+
+        top = models.Folder('top', self.user.id)
+        middle = models.Folder('middle', parent=top)
+        bottom = models.Folder('bottom', parent=middle)
+        other = models.Folder('other', self.user.id)
+        db.session.add_all([top, middle, bottom, other])
+        db.session.add_all([models.Bookmark('http://top', folder=top),
+                            models.Bookmark('http://bottom', folder=bottom),
+                            models.Bookmark('http://other', folder=other),
+                            models.Bookmark('http://root', user_id=self.user.id)])
+        db.session.commit()
+
+        assert top.path == '/'
+        assert bottom.path == top.full_path + models.folder.path_segment(middle.id)
+        assert set(f.title for f in top.descendants()) == {'middle', 'bottom'}
+        assert set(b.url for b in top.descendant_bookmarks()) == {'http://top', 'http://bottom'}
+        assert models.Bookmark.query.filter_by(url='http://root').first().path == '/'
+
+        # TEST CASE:
+        # cond:
+        #   - folder moved under another folder
+        # post:
+        #   - the paths of the whole subtree are rewritten
+
+        middle.parent = other
+        db.session.commit()
+        db.session.expire_all()
+
+        assert set(f.title for f in top.descendants()) == set()
+        assert set(f.title for f in other.descendants()) == {'middle', 'bottom'}
+        assert set(b.url for b in other.descendant_bookmarks()) == {'http://other', 'http://bottom'}
+
+        # TEST CASE:
+        # cond:
+        #   - folder moved under its own descendant
+        # post:
+        #   - the move is rejected
+
+        other.parent = bottom
+        self.assertRaises(ValueError, db.session.commit)
+        db.session.rollback()
+
+        # TEST CASE:
+        # cond:
+        #   - folder subtree deleted
+        # post:
+        #   - folders and bookmarks under it are removed
+
+        other.delete_subtree()
+        db.session.commit()
+
+        assert [f.title for f in models.Folder.query] == ['top']
+        assert set(b.url for b in models.Bookmark.query) == {'http://top', 'http://root'}
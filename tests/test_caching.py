@@ -0,0 +1,112 @@
+import base64
+import os
+import unittest
+
+from application.utils.initializers import init_db, init_app, init_login, init_admin
+from application.utils.lru import LRUCache
+from config import ActiveConfig, PathsConfig
+
+
+from application import db, app, models
+
+
+class ResponseCacheTests(unittest.TestCase):
+    """
+    Class for the response cache tests.
+    """
+
+    def setUp(self):
+        """
+        Set the Test Unit up
+        """
+
+        ActiveConfig.TESTING = True
+        ActiveConfig.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(PathsConfig.BASE_DIR, 'test.sqlite')
+        app.config.from_object(ActiveConfig)
+        db.session.close()
+        db.drop_all()
+        init_db(db)
+
+        # routes can only be registered once, before the first request
+        if 'index' not in app.view_functions:
+            init_app(app)
+            init_login(app)
+            init_admin(app, db)
+
+    def test_conditional_get(self):
+        """
+        Test the ETag and If-None-Match handling of the index page.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - index requested twice, then with the returned ETag
+        # post:
+        #   - the body is rendered once and the revalidation is answered with 304
+
+        client = app.test_client()
+        first = client.get('/')
+        second = client.get('/')
+        etag = first.headers['ETag']
+
+        assert first.status_code == 200
+        assert second.data == first.data
+        assert second.headers['ETag'] == etag
+
+        response = client.get('/', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == b''
+
+    def test_data_version(self):
+        """
+        Test the invalidation of the search responses.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - search repeated before and after adding a matching bookmark
+        # post:
+        #   - the cached response is used until the bookmarks change
+
+        client = app.test_client()
+        auth = {'Authorization': 'Basic ' + base64.b64encode(b'admin:password').decode('ascii')}
+        user = models.User.query.filter_by(username='admin').first()
+
+        first = client.get('/api/search?q=python', headers=auth)
+        assert client.get('/api/search?q=python', headers=auth).headers['ETag'] == first.headers['ETag']
+
+        db.session.add(models.Bookmark('https://python.org', 'Python', user.id))
+        db.session.commit()
+
+        response = client.get('/api/search?q=python', headers=auth)
+        assert response.headers['ETag'] != first.headers['ETag']
+        assert b'python.org' in response.data
+
+    def test_size_eviction(self):
+        """
+        Test evicting the bodies by their total size.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - total size of the bodies over the limit
+        # post:
+        #   - least recently used bodies are evicted, bodies over the limit are not stored
+
+        cache = LRUCache(max_weight=10, weigher=len)
+        cache.set('a', b'12345')
+        cache.set('b', b'12345')
+        cache.get('a')
+        cache.set('c', b'123')
+
+        assert cache.get('b') is None
+        assert cache.get('a') == b'12345'
+        assert cache.weight == 8
+
+        cache.set('d', b'12345678901')
+        assert cache.get('d') is None
+        assert cache.weight == 8
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,132 @@
+import os
+import unittest
+
+from application.utils.initializers import init_db
+from config import ActiveConfig, PathsConfig
+
+
+from application import db, app, models
+
+
+class DatabaseTuningTests(unittest.TestCase):
+    """
+    Class for the sqlite tuning tests.
+    """
+
+    def setUp(self):
+        """
+        Set the Test Unit up
+        """
+
+        ActiveConfig.TESTING = True
+        ActiveConfig.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(PathsConfig.BASE_DIR, 'test.sqlite')
+        app.config.from_object(ActiveConfig)
+        db.session.close()
+        db.drop_all()
+        init_db(db)
+
+    def tearDown(self):
+        ActiveConfig.SQLITE_READ_POOL_SIZE = 0
+        db.session.close()
+
+    def test_pragmas(self):
+        """
+        Test the pragmas of the pooled connections.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - connection from the write pool
+        # post:
+        #   - the configured pragmas are applied
+
+        assert db.session.execute('PRAGMA journal_mode').scalar().lower() == 'wal'
+        assert db.session.execute('PRAGMA synchronous').scalar() == 1
+        assert db.session.execute('PRAGMA busy_timeout').scalar() == ActiveConfig.SQLITE_BUSY_TIMEOUT
+
+    def test_read_pool(self):
+        """
+        Test routing the selects to the read only pool.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - read pool enabled, view not marked as read only
+        # post:
+        #   - selects use the write pool, the rows read before a write are those of the transaction
+
+        ActiveConfig.SQLITE_READ_POOL_SIZE = 2
+        query = models.User.query.filter_by(username='admin')
+        reader = db.get_read_engine(app)
+
+        assert db.session.get_bind(None, query.statement) is db.engine
+
+        # TEST CASE:
+        # cond:
+        #   - read only view, no writes in the transaction
+        # post:
+        #   - selects use the read only pool
+
+        assert db.read_only(lambda: db.session.get_bind(None, query.statement))() is reader
+        assert query.first() is not None
+
+        # TEST CASE:
+        # cond:
+        #   - the transaction wrote
+        # post:
+        #   - selects use the write pool until the transaction ends
+
+        query.first().first_name = 'Changed'
+        db.session.flush()
+
+        assert db.session.get_bind(None, query.statement) is db.engine
+        assert query.first().first_name == 'Changed'
+
+        db.session.commit()
+
+        assert db.session.get_bind(None, query.statement) is reader
+        assert query.first().first_name == 'Changed'
+
+    def test_write_flag(self):
+        """
+        Test tracking the transactions that wrote.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - read pool disabled, selects only
+        # post:
+        #   - the transaction is not marked as writing
+
+        query = models.User.query.filter_by(username='admin')
+        user = query.first()
+
+        assert not db.session.info.get('writing')
+        assert not db.session().has_writes()
+
+        # TEST CASE:
+        # cond:
+        #   - a change waiting to be flushed, then flushed, then committed
+        # post:
+        #   - the transaction has writes until it ends
+
+        user.first_name = 'Changed'
+        assert db.session().has_writes()
+        assert not db.session.info.get('writing')
+
+        db.session.flush()
+        assert db.session.info.get('writing')
+
+        # TEST CASE:
+        # cond:
+        #   - a subtransaction ends inside the writing transaction
+        # post:
+        #   - the transaction is still marked as writing
+
+        db.session.begin(subtransactions=True)
+        db.session.commit()
+        assert db.session.info.get('writing')
+
+        db.session.commit()
+        assert not db.session().has_writes()
+        assert query.first().first_name == 'Changed'
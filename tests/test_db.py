@@ -2,7 +2,8 @@ import os
 import unittest
 from werkzeug.security import check_password_hash
 
-from application.utils.initializers import init_db
+from application.utils import query_stats
+from application.utils.initializers import init_db, init_app, init_login, init_admin
 from config import ActiveConfig, PathsConfig
 
 
@@ -105,6 +106,60 @@ class DatabaseTests(unittest.TestCase):
         assert default_user.username == new_default_user.username
         assert check_password_hash(new_default_user.password, 'password')
 
+    def test_init_db_warm(self):
+        """
+        Test the init_db initializer on a stamped database.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - database initialized by a previous start
+        # post:
+        #   - the schema is not reflected and the seed data is checked with a single query
+
+        db.drop_all()
+        assert db.get_schema_version() == 0
+
+        init_db(db)
+        assert db.get_schema_version() == models.SCHEMA_VERSION
+
+        with query_stats.collect() as stats:
+            init_db(db)
+
+        assert stats.count == 2
+        assert models.User.query.count() == 1
+
+    def test_admin_views(self):
+        """
+        Test the admin views with their deferred scaffolding.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - application initialized like on startup, an admin logged in
+        # post:
+        #   - the model list views are built on their first request and render the rows
+
+        init_db(db)
+
+        # routes can only be registered once, before the first request
+        if 'index' not in app.view_functions:
+            init_app(app)
+            init_login(app)
+            init_admin(app, db)
+
+        client = app.test_client()
+        response = client.post('/admin/login', data={'username': 'admin', 'password': 'password'})
+        assert response.status_code == 302
+
+        response = client.get('/admin/user/')
+        assert response.status_code == 200
+        assert b'admin' in response.data
+
+        response = client.get('/admin/accesslevel/')
+        assert response.status_code == 200
+        assert b'Administrator' in response.data
+
     def tearDown(self):
         db.session.remove()
         db.drop_all()
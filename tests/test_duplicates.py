@@ -0,0 +1,167 @@
+from application.utils.dedup import Duplicates
+from application.utils.minhash import MinHasher, NearDuplicates, shingles
+from application.utils.tags import tag_index
+from application.utils.urls import normalize_url
+from config import ActiveConfig
+from tests.base import BookmarkTestCase
+
+
+from application import db, models
+
+
+class DuplicateTests(BookmarkTestCase):
+    """
+    Class for the duplicate and near duplicate bookmark tests.
+    """
+
+    def test_duplicates(self):
+        """
+        Test the canonical urls and the duplicate detection.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - urls differing by case, www, default port, trailing slash, fragment, tracking and parameter order
+        # post:
+        #   - they have the same canonical url, other urls don't
+
+        variants = ['HTTP://WWW.Example.com:80/a/b/?utm_source=mail&y=2&x=1#top', 'http://example.com/a/b?x=1&y=2',
+                    'http://example.com/a/b/?y=2&x=1&fbclid=abc']
+        assert len(set(normalize_url(url) for url in variants)) == 1
+        assert normalize_url('http://example.com/a/b?x=2&y=2') != normalize_url(variants[1])
+        assert normalize_url('https://example.com/a/b?x=1&y=2') != normalize_url(variants[1])
+
+        # TEST CASE:
+        # cond:
+        #   - duplicates saved, one of them changed to another url
+        # post:
+        #   - lookups by url use the hash index, kept up to date
+        #   - the report groups the duplicates and the merge keeps the oldest, with the tags and title of the copies
+
+        bookmarks = [models.Bookmark(url, user_id=self.user.id) for url in variants + ['http://other.com']]
+        bookmarks[1].title, bookmarks[1].tags = 'Copy', 'Python, web'
+        bookmarks[0].tags = 'python'
+        db.session.add_all(bookmarks)
+        db.session.commit()
+
+        assert self.user.bookmarks.filter(models.Bookmark.url_hash == None).count() == 0  # noqa: E711
+        assert models.Bookmark.find_url(self.user.id, 'https://www.other.com').count() == 0
+        assert models.Bookmark.find_url(self.user.id, 'http://www.other.com/').count() == 1
+        assert models.Bookmark.find_url(self.user.id, 'http://example.com/a/b?y=2&x=1').count() == 3
+
+        bookmarks[2].url = 'http://other.com/#about'
+        db.session.commit()
+
+        groups = sorted(Duplicates.report(self.user.id), key=lambda group: group.ids)
+        assert [group.ids for group in groups] == [[bookmarks[0].id, bookmarks[1].id],
+                                                   [bookmarks[2].id, bookmarks[3].id]]
+
+        assert Duplicates.merge(self.user.id) == 2
+        db.session.commit()
+        assert sorted(b.id for b in self.user.bookmarks) == [bookmarks[0].id, bookmarks[2].id]
+        assert (bookmarks[0].title, bookmarks[0].tags) == ('Copy', 'python, web')
+        assert tag_index.select(self.user.id, 'web') == [bookmarks[0].id]
+
+        # TEST CASE:
+        # cond:
+        #   - a bookmark of another url with the same url hash
+        # post:
+        #   - it is reported with the bookmark, but the merge keeps both
+
+        colliding = models.Bookmark('http://colliding.com', user_id=self.user.id)
+        db.session.add(colliding)
+        db.session.commit()
+        table = models.Bookmark.__table__
+        db.session.execute(table.update().where(table.c.id == colliding.id).values(url_hash=bookmarks[0].url_hash))
+        db.session.commit()
+
+        assert [group.ids for group in Duplicates.report(self.user.id)] == [[bookmarks[0].id, colliding.id]]
+        assert Duplicates.merge(self.user.id) == 0
+        db.session.commit()
+        assert sorted(b.id for b in self.user.bookmarks) == [bookmarks[0].id, bookmarks[2].id, colliding.id]
+
+    def test_near_duplicates(self):
+        """
+        Test the near duplicate clustering.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - signatures computed with and without numpy
+        # post:
+        #   - they are the same
+
+        features = shingles('Python tutorial for beginners', 'http://example.com/tutorial?id=1')
+        signature = MinHasher(vectorized=False).signature(features)
+        assert len(signature) == ActiveConfig.MINHASH_PERMUTATIONS
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            pass
+        else:
+            assert MinHasher(vectorized=True).signature(features) == signature
+
+        # TEST CASE:
+        # cond:
+        #   - variants of a page with another query or on a mirror, a related page and an unrelated one
+        # post:
+        #   - the variants are clustered, the other pages are not
+
+        title = 'Python tutorial for beginners'
+        bookmarks = [models.Bookmark('http://example.com/tutorial?id=1', title, self.user.id),
+                     models.Bookmark('http://example.com/tutorial?id=2', title, self.user.id),
+                     models.Bookmark('https://mirror.org/tutorial', title, self.user.id),
+                     models.Bookmark('http://example.com/rust', 'Rust tutorial for beginners', self.user.id),
+                     models.Bookmark('http://food.com/recipes', 'Cooking recipes', self.user.id)]
+        db.session.add_all(bookmarks)
+        db.session.commit()
+
+        stats = NearDuplicates.update(self.user.id)
+        db.session.commit()
+        assert (stats.signed, stats.clustered) == (5, 3)
+        assert NearDuplicates.clusters(self.user.id) == [[b.id for b in bookmarks[:3]]]
+
+        # TEST CASE:
+        # cond:
+        #   - another variant added, a clustered bookmark changed
+        # post:
+        #   - only the new bookmark and the cluster of the changed one are signed, the variant joins the cluster
+
+        added = models.Bookmark('http://example.com/tutorial/', title + ' - Example', self.user.id)
+        db.session.add(added)
+        bookmarks[2].title = 'Cooking recipes'
+        bookmarks[2].url = 'http://www.food.com/recipes/'
+        db.session.commit()
+
+        stats = NearDuplicates.update(self.user.id)
+        db.session.commit()
+        assert (stats.signed, stats.clustered) == (4, 4)
+        assert sorted(NearDuplicates.clusters(self.user.id)) == [[bookmarks[0].id, bookmarks[1].id, added.id],
+                                                                 [bookmarks[2].id, bookmarks[4].id]]
+
+        # TEST CASE:
+        # cond:
+        #   - a clustered bookmark deleted
+        # post:
+        #   - its signature and buckets are dropped
+
+        db.session.delete(bookmarks[4])
+        db.session.commit()
+        assert models.BookmarkSignature.query.get(bookmarks[4].id) is None
+        assert models.LshBucket.query.filter_by(bookmark_id=bookmarks[4].id).count() == 0
+        assert NearDuplicates.clusters(self.user.id) == [[bookmarks[0].id, bookmarks[1].id, added.id]]
+
+        # TEST CASE:
+        # cond:
+        #   - the bookmark labelling a cluster changed to an unrelated page
+        # post:
+        #   - it leaves the cluster, the others stay together under a new label
+
+        bookmarks[0].title = 'Gardening'
+        bookmarks[0].url = 'http://garden.net/'
+        db.session.commit()
+        assert NearDuplicates.clusters(self.user.id) == []
+
+        NearDuplicates.update(self.user.id)
+        db.session.commit()
+        assert NearDuplicates.clusters(self.user.id) == [[bookmarks[1].id, added.id]]
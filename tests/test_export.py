@@ -0,0 +1,74 @@
+import json
+import zlib
+
+from tests.base import BookmarkTestCase
+
+
+from application import db, app, models
+
+
+class ExportTests(BookmarkTestCase):
+    """
+    Class for the streamed export tests.
+    """
+
+    def test_export(self):
+        """
+        Test the streamed exports.
+        """
+
+        client = app.test_client()
+
+        top = models.Folder('top', self.user.id)
+        second = models.Folder('second', self.user.id)
+        inner = models.Folder('inner', parent=top)
+        db.session.add_all([top, second, inner])
+        db.session.add_all([models.Bookmark('http://inner', 'Inner', folder=inner),
+                            models.Bookmark('http://top/2', 'Top <2>', folder=top, position=2),
+                            models.Bookmark('http://top/1', 'Top 1', folder=top, position=1),
+                            models.Bookmark('http://root', 'Root', user_id=self.user.id)])
+        db.session.commit()
+        # the requests end the session, which detaches the objects
+        top_id = top.id
+
+        # TEST CASE:
+        # cond:
+        #   - json export of a nested tree
+        # post:
+        #   - folders are nested depth first, bookmarks by position
+
+        response = client.get('/api/export/json', headers=self.auth)
+        tree = json.loads(response.data.decode('utf-8'))
+
+        assert response.status_code == 200
+        assert [c.get('url') or c['title'] for c in tree['children']] == ['http://root', 'top', 'second']
+        assert [c.get('url') or c['title'] for c in tree['children'][1]['children']] == \
+            ['http://top/1', 'http://top/2', 'inner']
+        assert tree['children'][1]['children'][2]['children'][0]['url'] == 'http://inner'
+        assert tree['children'][2]['children'] == []
+
+        # TEST CASE:
+        # cond:
+        #   - gzipped html export of a folder
+        # post:
+        #   - the document is decompressed and escaped, only the folder is exported
+
+        response = client.get('/api/export/html?folder={0}'.format(top_id),
+                              headers=dict(self.auth, **{'Accept-Encoding': 'gzip'}))
+        html = zlib.decompress(response.data, 31).decode('utf-8')
+
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert html.startswith('<!DOCTYPE NETSCAPE-Bookmark-file-1>')
+        assert 'Top &lt;2&gt;' in html
+        assert html.index('http://top/1') < html.index('http://top/2') < html.index('inner')
+        assert 'http://root' not in html
+        assert html.count('<DL><p>') == html.count('</DL><p>') == 2
+
+        # TEST CASE:
+        # cond:
+        #   - unknown format, no authorization
+        # post:
+        #   - request is rejected
+
+        assert client.get('/api/export/xml', headers=self.auth).status_code == 404
+        assert client.get('/api/export/json').status_code == 403
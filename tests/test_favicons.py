@@ -0,0 +1,104 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from application import importers
+from application.utils.favicons import favicon_store
+from tests.base import BookmarkTestCase
+
+
+from application import db, app, models
+
+
+class FaviconTests(BookmarkTestCase):
+    """
+    Class for the favicon store and icon import tests.
+    """
+
+    def test_favicons(self):
+        """
+        Test the favicon store, the icon import and the icon responses.
+        """
+
+        png = b'\x89PNG\r\n\x1a\n'
+        directory = tempfile.mkdtemp()
+        defaults = favicon_store.directory, favicon_store.pack_size, favicon_store.max_bytes
+        favicon_store.directory, favicon_store.pack_size, favicon_store.max_bytes = directory, 100, 250
+        store = favicon_store
+        try:
+            # TEST CASE:
+            # cond:
+            #   - icons stored in small packs, some identical, some not images
+            # post:
+            #   - identical icons are stored once, the others are skipped
+            #   - the oldest packs are evicted past the size limit
+
+            digests = store.add_many([png + b'a' * 40, png + b'b' * 40, png + b'a' * 40, b'not an image'])
+            assert digests[0] == digests[2] and digests[1] != digests[0] and digests[3] is None
+            assert store.get(digests[1]) == (png + b'b' * 40, 'image/png')
+
+            for i in range(10):
+                store.add(png + bytes([i]) * 40)
+            db.session.commit()
+            assert store.stats()['bytes'] <= 250
+            assert store.get(digests[0]) is None
+
+            # TEST CASE:
+            # cond:
+            #   - Firefox favicon database with icons of a bookmarked and a visited page
+            # post:
+            #   - the bookmark gets its icon, logged as an update; the visited page icon is not stored
+            #   - the icon is served with immutable cache headers
+
+            bookmark = models.Bookmark('http://example.com/', 'Example', self.user.id)
+            db.session.add(bookmark)
+            db.session.commit()
+            seq = models.Change.latest_seq(self.user.id)
+
+            path = os.path.join(directory, 'favicons.sqlite')
+            connection = sqlite3.connect(path)
+            connection.executescript('''
+                CREATE TABLE moz_icons (id INTEGER PRIMARY KEY, width INTEGER, data BLOB);
+                CREATE TABLE moz_pages_w_icons (id INTEGER PRIMARY KEY, page_url TEXT);
+                CREATE TABLE moz_icons_to_pages (page_id INTEGER, icon_id INTEGER);
+                INSERT INTO moz_pages_w_icons VALUES (1, 'http://www.example.com'), (2, 'http://visited.com/');
+                INSERT INTO moz_icons_to_pages VALUES (1, 1), (1, 2), (2, 3);
+            ''')
+            connection.executemany('INSERT INTO moz_icons VALUES (?, ?, ?)', [
+                (1, 16, png + b'small'), (2, 32, png + b'large'), (3, 32, png + b'visited')])
+            connection.commit()
+            connection.close()
+
+            assert importers.import_icons(path, self.user.id) == 1
+            assert bookmark.icon == favicon_store.add(png + b'large')
+            assert [c.op for c in models.Change.since(self.user.id, seq)] == ['update']
+            assert models.Favicon.query.get(hashlib.sha1(png + b'visited').hexdigest()) is None
+
+            client = app.test_client()
+            response = client.get('/favicons/' + bookmark.icon)
+            assert response.status_code == 200 and response.data == png + b'large'
+            assert response.mimetype == 'image/png'
+            assert 'immutable' in response.headers['Cache-Control']
+            assert client.get('/favicons/' + bookmark.icon,
+                              headers={'If-None-Match': '"{0}"'.format(bookmark.icon)}).status_code == 304
+            assert client.get('/favicons/' + 'f' * 40).status_code == 404
+
+            # TEST CASE:
+            # cond:
+            #   - svg icon with a script
+            # post:
+            #   - it is served sandboxed, its type is not sniffed again
+
+            svg = favicon_store.add(b'<svg xmlns="http://www.w3.org/2000/svg"><script>alert(1)</script></svg>')
+            db.session.commit()
+            response = client.get('/favicons/' + svg)
+            assert response.mimetype == 'image/svg+xml'
+            assert 'sandbox' in response.headers['Content-Security-Policy']
+            assert "default-src 'none'" in response.headers['Content-Security-Policy']
+            assert response.headers['X-Content-Type-Options'] == 'nosniff'
+        finally:
+            favicon_store.directory, favicon_store.pack_size, favicon_store.max_bytes = defaults
+            favicon_store.clear()
+            shutil.rmtree(directory)
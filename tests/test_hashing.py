@@ -0,0 +1,63 @@
+import time
+import unittest
+
+from application.utils import hashing
+
+
+class HashingTests(unittest.TestCase):
+    """
+    Class for password hashing service tests.
+    """
+
+    def test_pool_hasher(self):
+        """
+        Test the process pool backed hasher.
+        """
+
+        hasher = hashing.PoolPasswordHasher(workers=1, max_queue=1, timeout=30)
+        try:
+            # TEST CASE:
+            # cond:
+            #   - free worker
+            # post:
+            #   - hashes are computed in the pool and are compatible with the synchronous hasher
+
+            pwhash = hasher.hash('secret')
+            assert hasher.check(pwhash, 'secret')
+            assert not hasher.check(pwhash, 'other')
+            assert hashing.PasswordHasher().check(pwhash, 'secret')
+
+            # TEST CASE:
+            # cond:
+            #   - queue is full
+            # post:
+            #   - operation is rejected before any hashing is done
+
+            hasher._slots.acquire()
+            self.assertRaises(hashing.HashingQueueFull, hasher.hash, 'secret')
+            hasher._slots.release()
+            assert hasher.check(pwhash, 'secret')
+
+            # TEST CASE:
+            # cond:
+            #   - the worker is busy for longer than the timeout
+            # post:
+            #   - operation is rejected the same way
+
+            busy = hasher._get_executor().submit(time.sleep, 1)
+            hasher.timeout = 0.1
+            self.assertRaises(hashing.HashingQueueFull, hasher.check, pwhash, 'secret')
+            busy.result()
+        finally:
+            hasher.shutdown()
+
+    def test_set_hasher(self):
+        """
+        Test replacing the active hasher.
+        """
+
+        previous = hashing.set_hasher(hashing.PasswordHasher())
+        try:
+            assert hashing.check_password(hashing.hash_password('secret'), 'secret')
+        finally:
+            hashing.set_hasher(previous)
@@ -0,0 +1,51 @@
+import json
+import os
+import tempfile
+
+from application import importers
+from tests.base import BookmarkTestCase
+
+
+from application import models
+
+
+class ImportTests(BookmarkTestCase):
+    """
+    Class for the browser bookmark import tests.
+    """
+
+    def test_import_chrome(self):
+        """
+        Test importing a Chrome Bookmarks file.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - nested Chrome bookmarks, more bookmarks than the batch size
+        # post:
+        #   - folders and bookmarks are inserted with their paths
+
+        data = {'roots': {
+            'bookmark_bar': {'type': 'folder', 'id': '1', 'name': 'Bar', 'children': [
+                {'type': 'url', 'name': 'a', 'url': 'http://a', 'date_added': '13100000000000000'},
+                {'type': 'folder', 'id': '3', 'name': 'Nested', 'children': [
+                    {'type': 'url', 'name': 'b', 'url': 'http://b'},
+                    {'type': 'url', 'name': 'c', 'url': 'http://c'}]}]},
+            'other': {'type': 'folder', 'id': '2', 'name': 'Other', 'children': []},
+            'sync_transaction_version': '1'}}
+
+        handle, path = tempfile.mkstemp()
+        with os.fdopen(handle, 'w') as f:
+            json.dump(data, f)
+
+        try:
+            stats = importers.import_file(path, self.user.id, batch_size=2)
+        finally:
+            os.remove(path)
+
+        assert (stats.folders, stats.bookmarks) == (3, 3)
+
+        bar = models.Folder.query.filter_by(title='Bar').first()
+        assert set(f.title for f in bar.descendants()) == {'Nested'}
+        assert set(b.url for b in bar.descendant_bookmarks()) == {'http://a', 'http://b', 'http://c'}
+        assert models.Bookmark.query.filter_by(url='http://a').first().date_added.year == 2016
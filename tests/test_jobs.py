@@ -0,0 +1,328 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from application.utils.initializers import init_db
+from application.utils.jobs import Jobs, JobRunner
+from config import ActiveConfig, PathsConfig
+
+
+from application import db, app, models
+
+
+class JobQueueTests(unittest.TestCase):
+    """
+    Class for the background job queue tests.
+    """
+
+    def setUp(self):
+        """
+        Set the Test Unit up
+        """
+
+        ActiveConfig.TESTING = True
+        ActiveConfig.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(PathsConfig.BASE_DIR, 'test.sqlite')
+        app.config.from_object(ActiveConfig)
+        db.session.close()
+        db.drop_all()
+        init_db(db)
+        self.user = models.User.query.first()
+
+    def get_job(self, job_id):
+        db.session.expire_all()
+        return models.Job.query.get(job_id)
+
+    def test_run_jobs(self):
+        """
+        Test running queued jobs.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - a merge of duplicates and an export are queued
+        # post:
+        #   - they run in order and store their results
+        #   - the export is written to a file, removed with the expired job
+
+        urls = ['http://example.com/', 'http://www.example.com', 'http://example.org/']
+        db.session.add_all([models.Bookmark(url, 'Example', user_id=self.user.id) for url in urls])
+        db.session.commit()
+
+        dedup = Jobs.enqueue(self.user.id, 'dedup')
+        export = Jobs.enqueue(self.user.id, 'export', {'fmt': 'html'})
+        assert dedup.status == models.Job.QUEUED
+
+        assert Jobs.run_next().id == dedup.id
+        assert Jobs.run_next().id == export.id
+        assert Jobs.run_next() is None
+
+        dedup, export = self.get_job(dedup.id), self.get_job(export.id)
+        assert dedup.status == models.Job.DONE
+        assert dedup.attempts == 1
+        assert dedup.get_result() == {'deleted': 1}
+        assert models.Bookmark.query.count() == 2
+
+        path = export.get_result()['file']
+        with open(path, 'rb') as f:
+            assert f.read().startswith(b'<!DOCTYPE NETSCAPE-Bookmark-file-1>')
+
+        assert Jobs.purge(datetime.utcnow() + timedelta(seconds=1)) == 2
+        assert not os.path.exists(path)
+        assert models.Job.query.count() == 0
+
+    def test_retry(self):
+        """
+        Test retrying failed jobs.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - a job failing every attempt
+        # post:
+        #   - it is queued again until it has no attempts left, then failed with the error
+        #   - a failed job can be queued again
+
+        @Jobs.handler('test-fail')
+        def fail(context):
+            raise ValueError('broken')
+
+        try:
+            job_id = Jobs.enqueue(self.user.id, 'test-fail', max_attempts=2).id
+
+            Jobs.run_next()
+            job = self.get_job(job_id)
+            assert job.status == models.Job.QUEUED
+            assert job.attempts == 1
+            assert job.error == 'ValueError: broken'
+
+            Jobs.run_next()
+            job = self.get_job(job_id)
+            assert job.status == models.Job.FAILED
+            assert job.attempts == 2
+            assert Jobs.run_next() is None
+
+            assert Jobs.retry(job_id)
+            assert not Jobs.retry(job_id)
+            job = self.get_job(job_id)
+            assert job.status == models.Job.QUEUED
+            assert job.attempts == 0
+        finally:
+            del Jobs.handlers['test-fail']
+
+    def test_cancel(self):
+        """
+        Test cancelling queued and running jobs.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - a queued job with an uploaded file
+        # post:
+        #   - it is cancelled right away and its file is removed
+
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        job_id = Jobs.enqueue(self.user.id, 'import', {'path': path}, files=[path]).id
+
+        assert Jobs.cancel(job_id)
+        assert self.get_job(job_id).status == models.Job.CANCELLED
+        assert not os.path.exists(path)
+        assert not Jobs.cancel(job_id)
+        assert Jobs.run_next() is None
+
+        # TEST CASE:
+        # cond:
+        #   - a running job is cancelled
+        # post:
+        #   - it stops at its next progress report and its writes are rolled back
+
+        def cancel_from_request(job_id):
+            with app.app_context():
+                Jobs.cancel(job_id)
+                db.session.remove()
+
+        @Jobs.handler('test-cancel')
+        def cancel(context):
+            thread = threading.Thread(target=cancel_from_request, args=(context.job_id,))
+            thread.start()
+            thread.join()
+            db.session.add(models.Bookmark('http://example.com/', user_id=context.user_id))
+            db.session.flush()
+            context.progress(1, 2)
+
+        try:
+            job_id = Jobs.enqueue(self.user.id, 'test-cancel').id
+            Jobs.run_next()
+            job = self.get_job(job_id)
+            assert job.status == models.Job.CANCELLED
+            assert job.attempts == 1
+            assert models.Bookmark.query.count() == 0
+        finally:
+            del Jobs.handlers['test-cancel']
+
+    def test_progress(self):
+        """
+        Test reporting the progress of a running job.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - a handler reads, reports its progress, then writes and reports it again
+        # post:
+        #   - the first report is written to the jobs table right away, the second one waits for the commit
+
+        def stored_progress(job_id):
+            connection = db.engine.connect()
+            try:
+                table = models.Job.__table__
+                return tuple(connection.execute(select([table.c.progress, table.c.total, table.c.message])
+                                                .where(table.c.id == job_id)).first())
+            finally:
+                connection.close()
+
+        reported = []
+
+        @Jobs.handler('test-progress')
+        def progress(context):
+            models.Bookmark.query.count()
+            context.progress(1, 2, 'reading')
+            reported.append(stored_progress(context.job_id))
+            db.session.add(models.Bookmark('http://example.com/', user_id=context.user_id))
+            db.session.flush()
+            context.progress(2, 2, 'writing')
+            reported.append(stored_progress(context.job_id))
+
+        interval = ActiveConfig.JOB_PROGRESS_INTERVAL
+        ActiveConfig.JOB_PROGRESS_INTERVAL = 0
+        try:
+            job_id = Jobs.enqueue(self.user.id, 'test-progress').id
+            Jobs.run_next()
+        finally:
+            ActiveConfig.JOB_PROGRESS_INTERVAL = interval
+            del Jobs.handlers['test-progress']
+
+        assert reported == [(1, 2, 'reading'), (1, 2, 'reading')]
+        assert self.get_job(job_id).status == models.Job.DONE
+
+    def test_recover(self):
+        """
+        Test recovering the jobs of exited workers.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - jobs left running by a process that does not exist anymore
+        # post:
+        #   - the one with attempts left is queued again, the other one fails
+
+        first = Jobs.enqueue(self.user.id, 'dedup', max_attempts=2).id
+        second = Jobs.enqueue(self.user.id, 'dedup', max_attempts=1).id
+        models.Job.query.update({'status': models.Job.RUNNING, 'attempts': 1, 'worker': 2 ** 31 - 1})
+        db.session.commit()
+
+        assert Jobs.recover() == 2
+        assert self.get_job(first).status == models.Job.QUEUED
+        assert self.get_job(second).status == models.Job.FAILED
+
+        # TEST CASE:
+        # cond:
+        #   - a job running in this process
+        # post:
+        #   - it is left alone
+
+        models.Job.query.update({'status': models.Job.RUNNING, 'worker': os.getpid()})
+        db.session.commit()
+        assert Jobs.recover() == 0
+
+    def test_runner(self):
+        """
+        Test running jobs on worker threads.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - jobs queued while the workers are waiting
+        # post:
+        #   - the workers run all of them
+
+        runner = JobRunner(2, 0.05)
+        runner.start()
+        try:
+            ids = [Jobs.enqueue(self.user.id, 'dedup').id for _ in range(4)]
+            deadline = time.time() + 10
+            while time.time() < deadline:
+                db.session.expire_all()
+                if models.Job.query.filter(models.Job.status == models.Job.DONE).count() == len(ids):
+                    break
+                time.sleep(0.05)
+        finally:
+            runner.stop(10)
+
+        assert [self.get_job(i).status for i in ids] == [models.Job.DONE] * len(ids)
+
+    def test_interrupt(self):
+        """
+        Test stopping the workers while jobs run.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - the workers are stopped while a job reports its progress
+        # post:
+        #   - the job stops, its writes are rolled back and it is queued again without counting the attempt
+
+        started = threading.Event()
+
+        @Jobs.handler('test-report')
+        def report(context):
+            db.session.add(models.Bookmark('http://example.com/', user_id=context.user_id))
+            db.session.flush()
+            started.set()
+            for i in range(200):
+                context.progress(i, 200)
+                time.sleep(0.05)
+
+        # TEST CASE:
+        # cond:
+        #   - the workers are stopped while a job never reports its progress
+        # post:
+        #   - it is queued again after the timeout, its late outcome is ignored
+
+        release = threading.Event()
+
+        @Jobs.handler('test-silent')
+        def silent(context):
+            started.set()
+            release.wait(10)
+
+        try:
+            for kind, timeout in (('test-report', 10), ('test-silent', 0.2)):
+                started.clear()
+                runner = JobRunner(1, 0.05)
+                job_id = Jobs.enqueue(self.user.id, kind).id
+                runner.start()
+                assert started.wait(10)
+                runner.stop(timeout)
+
+                job = self.get_job(job_id)
+                assert (job.status, job.attempts, job.claim) == (models.Job.QUEUED, 0, None)
+                assert models.Bookmark.query.count() == 0
+                if kind == 'test-report':
+                    Jobs.cancel(job_id)
+
+            release.set()
+            runner._threads[0].join(10)
+            assert self.get_job(job_id).status == models.Job.QUEUED
+        finally:
+            release.set()
+            del Jobs.handlers['test-report']
+            del Jobs.handlers['test-silent']
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
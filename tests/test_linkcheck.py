@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+import unittest
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+from application.utils.initializers import init_db
+from application.utils.linkcheck import LinkChecker, NETWORK_ERROR
+from config import ActiveConfig, PathsConfig
+
+
+from application import db, app, models
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in web site: '/ok' exists, '/dead' is missing, '/moved' redirects to '/ok', '/no-head' refuses HEAD and
+    '/slow' answers after the checker timeout.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    connections = 0
+
+    def setup(self):
+        StandInHandler.connections += 1
+        BaseHTTPRequestHandler.setup(self)
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, body):
+        status, headers = {
+            '/ok': (200, {}),
+            '/dead': (404, {}),
+            '/moved': (301, {'Location': '/ok'}),
+            '/no-head': (200 if body else 405, {}),
+        }.get(self.path, (200, {}))
+        if self.path == '/slow':
+            time.sleep(1)
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        if body:
+            self.wfile.write(b'ok')
+
+    def do_HEAD(self):
+        self.reply(False)
+
+    def do_GET(self):
+        self.reply(True)
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class LinkCheckTests(unittest.TestCase):
+    """
+    Class for the link checker tests.
+    """
+
+    def setUp(self):
+        """
+        Set the Test Unit up
+        """
+
+        ActiveConfig.TESTING = True
+        ActiveConfig.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(PathsConfig.BASE_DIR, 'test.sqlite')
+        app.config.from_object(ActiveConfig)
+        db.session.close()
+        db.drop_all()
+        init_db(db)
+        self.user = models.User.query.first()
+
+        self.server = StandInServer(('127.0.0.1', 0), StandInHandler)
+        threading.Thread(target=self.server.serve_forever).start()
+        self.base = 'http://127.0.0.1:{0}'.format(self.server.server_address[1])
+
+    def test_check_links(self):
+        """
+        Test checking the links against a local server.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - live, dead, redirected, HEAD refusing, slow and unsupported links
+        # post:
+        #   - statuses and final urls are stored
+        #   - connections to the same host are reused
+
+        paths = ['/ok', '/dead', '/moved', '/no-head', '/slow'] + ['/ok'] * 10
+        db.session.add_all([models.Bookmark(self.base + path, user_id=self.user.id) for path in paths])
+        db.session.add(models.Bookmark('ftp://example.com/file', user_id=self.user.id))
+        db.session.commit()
+
+        StandInHandler.connections = 0
+        version = models.Change.data_version(self.user.id)
+        stats = LinkChecker(self.user.id, concurrency=4, per_host=2, timeout=0.5, batch_size=4).run()
+        db.session.expire_all()
+
+        def status(path):
+            return models.Bookmark.query.filter_by(url=self.base + path).first()
+
+        assert stats.checked == 16
+        assert stats.dead == 3
+        assert stats.redirected == 1
+        assert stats.checks_per_second > 0
+        assert status('/ok').link_status == 200
+        assert status('/dead').link_status == 404
+        assert status('/moved').link_status == 200
+        assert status('/moved').link_url == self.base + '/ok'
+        assert status('/no-head').link_status == 200
+        assert status('/slow').link_status == NETWORK_ERROR
+        assert models.Bookmark.query.filter(models.Bookmark.link_checked == None).count() == 0  # noqa: E711
+        assert StandInHandler.connections < len(paths)
+
+        # TEST CASE:
+        # cond:
+        #   - links checked again, without any status change
+        # post:
+        #   - the data version changed with the first statuses only, cached responses are built again once
+
+        checked_version = models.Change.data_version(self.user.id)
+        assert checked_version > version
+
+        LinkChecker(self.user.id, concurrency=4, per_host=2, timeout=0.5, batch_size=4).run()
+        assert models.Change.data_version(self.user.id) == checked_version
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,106 @@
+import base64
+import gc
+import os
+import threading
+import unittest
+
+from application.utils.metrics import Metrics, metrics
+from application.utils.initializers import init_db, init_app, init_login, init_admin
+from config import ActiveConfig, PathsConfig
+
+
+from application import db, app
+
+
+class MetricsTests(unittest.TestCase):
+    """
+    Class for the runtime metrics tests.
+    """
+
+    def setUp(self):
+        """
+        Set the Test Unit up
+        """
+
+        ActiveConfig.TESTING = True
+        ActiveConfig.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(PathsConfig.BASE_DIR, 'test.sqlite')
+        app.config.from_object(ActiveConfig)
+        db.session.close()
+        db.drop_all()
+        init_db(db)
+
+        # routes can only be registered once, before the first request
+        if 'index' not in app.view_functions:
+            init_app(app)
+            init_login(app)
+            init_admin(app, db)
+
+    def test_histogram(self):
+        """
+        Test merging the histograms recorded by several threads.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - values observed from the main thread and a worker thread
+        # post:
+        #   - buckets are merged and rendered cumulatively
+
+        registry = Metrics(buckets=(0.1, 1.0))
+        registry.observe('latency', (('endpoint', 'a'),), 0.05)
+        worker = threading.Thread(target=registry.observe, args=('latency', (('endpoint', 'a'),), 5.0))
+        worker.start()
+        worker.join()
+
+        text = registry.render()
+        assert 'latency_bucket{endpoint="a",le="0.1"} 1' in text
+        assert 'latency_bucket{endpoint="a",le="1.0"} 1' in text
+        assert 'latency_bucket{endpoint="a",le="+Inf"} 2' in text
+        assert 'latency_count{endpoint="a"} 2' in text
+
+    def test_exited_threads(self):
+        """
+        Test keeping the values of the threads that exited.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - counters increased by many short lived threads
+        # post:
+        #   - their shards are folded into one, the values are kept
+
+        registry = Metrics()
+        for _ in range(20):
+            worker = threading.Thread(target=registry.inc, args=('jobs', (), 2))
+            worker.start()
+            worker.join()
+        gc.collect()
+
+        assert registry.collect()[0][('jobs', ())] == 40
+        assert len(registry._shards) == 1
+
+    def test_endpoint(self):
+        """
+        Test the metrics endpoint.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - authorized search request
+        # post:
+        #   - latency, status, database time and hash timings are exported
+
+        client = app.test_client()
+        auth = {'Authorization': 'Basic ' + base64.b64encode(b'admin:password').decode('ascii')}
+        client.get('/api/search?q=python', headers=auth)
+
+        response = client.get('/metrics')
+        text = response.data.decode('utf-8')
+
+        assert response.status_code == 200
+        assert 'http_request_duration_seconds_count{endpoint="api_search"}' in text
+        assert 'http_requests_total{endpoint="api_search",method="GET",status="200"}' in text
+        assert 'db_queries_total{endpoint="api_search"}' in text
+        assert 'password_hash_duration_seconds_count{op="check"}' in text
+        assert 'http_requests_in_flight 1' in text
+        assert metrics.collect()[0][('http_requests_in_flight', ())] == 0
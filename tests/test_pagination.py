@@ -0,0 +1,123 @@
+import os
+import re
+import unittest
+
+from application.utils.initializers import init_db, init_app, init_login, init_admin
+from application.views import pagination
+from config import ActiveConfig, PathsConfig
+
+
+from application import db, app, models
+
+
+class PaginationTests(unittest.TestCase):
+    """
+    Class for keyset pagination tests.
+    """
+
+    def setUp(self):
+        """
+        Set the Test Unit up
+        """
+
+        ActiveConfig.TESTING = True
+        ActiveConfig.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(PathsConfig.BASE_DIR, 'test.sqlite')
+        app.config.from_object(ActiveConfig)
+        db.session.close()
+        db.drop_all()
+        init_db(db)
+
+        # routes can only be registered once, before the first request
+        if 'index' not in app.view_functions:
+            init_app(app)
+            init_login(app)
+            init_admin(app, db)
+
+    def test_seek(self):
+        """
+        Test paging through the users with a keyset.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - users paged by (username, id), both directions
+        # post:
+        #   - every user is listed once, in order
+
+        db.session.add_all([models.User('user{0:02d}'.format(i)) for i in range(25)])
+        db.session.commit()
+
+        columns = [models.User.username, models.User.id]
+        for descending in (False, True):
+            expected = [u.id for u in models.User.query.order_by(*[c.desc() if descending else c for c in columns])]
+
+            listed = []
+            cursor = None
+            while True:
+                query = models.User.query
+                if cursor is not None:
+                    values = pagination.decode_cursor(cursor, len(columns))
+                    query = query.filter(pagination.seek_criterion(columns, values, descending))
+
+                page = query.order_by(*[c.desc() if descending else c for c in columns]).limit(7).all()
+                if not page:
+                    break
+
+                listed.extend(u.id for u in page)
+                cursor = pagination.encode_cursor([page[-1].username, page[-1].id])
+
+            assert listed == expected
+
+        # TEST CASE:
+        # cond:
+        #   - invalid cursors
+        # post:
+        #   - they are ignored
+
+        assert pagination.decode_cursor('invalid', 2) is None
+        assert pagination.decode_cursor(pagination.encode_cursor([1]), 2) is None
+
+    def test_list_view(self):
+        """
+        Test paging through the admin list of the users.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - more users than a page, listed by the admin
+        # post:
+        #   - the pages follow each other by their cursors, every user is listed once
+        #   - the count is estimated
+
+        db.session.add_all([models.User('user{0:02d}'.format(i)) for i in range(25)])
+        db.session.commit()
+
+        client = app.test_client()
+        assert client.post('/admin/login', data={'username': 'admin', 'password': 'password'}).status_code == 302
+
+        listed = []
+        url = '/admin/user/'
+        while url:
+            response = client.get(url)
+            assert response.status_code == 200
+            html = response.data.decode('utf-8')
+            assert '(~26)' in html
+            listed.extend(re.findall(r'<td>\s*(user\d\d|admin)\s*</td>', html))
+            links = re.findall(r'<a href="([^"]+)">Next', html)
+            url = links[0].replace('&amp;', '&') if links else None
+
+        assert listed == sorted(u.username for u in models.User.query)
+
+        # TEST CASE:
+        # cond:
+        #   - the list is searched
+        # post:
+        #   - the count is exact
+
+        html = client.get('/admin/user/?search=user1').data.decode('utf-8')
+        assert '(10)' in html
+        assert re.findall(r'<td>\s*(user\d\d)\s*</td>', html) == ['user{0}'.format(i) for i in range(10, 20)]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,91 @@
+import base64
+import os
+import unittest
+
+from application.utils import query_stats
+from application.utils.initializers import init_db, init_app, init_login, init_admin
+from config import ActiveConfig, PathsConfig
+
+
+from application import db, app, models
+
+
+class QueryStatsTests(unittest.TestCase):
+    """
+    Class for the query instrumentation tests.
+    """
+
+    def setUp(self):
+        """
+        Set the Test Unit up
+        """
+
+        ActiveConfig.TESTING = True
+        ActiveConfig.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(PathsConfig.BASE_DIR, 'test.sqlite')
+        app.config.from_object(ActiveConfig)
+        db.session.close()
+        db.drop_all()
+        init_db(db)
+
+        # routes can only be registered once, before the first request
+        if 'index' not in app.view_functions:
+            init_app(app)
+            init_login(app)
+            init_admin(app, db)
+
+    def test_collect(self):
+        """
+        Test collecting the queries of a block.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - same query run with different parameters and IN lists
+        # post:
+        #   - queries are counted under one fingerprint and reported as repeated
+
+        with query_stats.collect() as stats:
+            for i in range(5):
+                models.User.query.filter(models.User.id.in_(range(i + 2))).all()
+
+        assert stats.count == 5
+        assert len(stats.statements) == 1
+        assert stats.repeated(5)[0][1] == 5
+
+        # TEST CASE:
+        # cond:
+        #   - query budget exceeded
+        # post:
+        #   - assertion error is raised
+
+        def over_budget():
+            with query_stats.query_budget(1):
+                models.User.query.all()
+                models.AccessLevel.query.all()
+
+        self.assertRaises(AssertionError, over_budget)
+
+    def test_view_budget(self):
+        """
+        Test the query budget of an API view.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - authorized search request, credentials already verified
+        # post:
+        #   - the view stays within its budget and reports its queries in the headers
+
+        client = app.test_client()
+        auth = {'Authorization': 'Basic ' + base64.b64encode(b'admin:password').decode('ascii')}
+        client.get('/api/search?q=python', headers=auth)
+
+        with query_stats.query_budget(1):
+            response = client.get('/api/search?q=python', headers=auth)
+
+        assert response.status_code == 200
+        assert response.headers['X-Query-Count'] == '1'
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,107 @@
+import json
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from tests.base import BookmarkTestCase
+
+
+from application import app, models
+
+
+class RpcTests(BookmarkTestCase):
+    """
+    Class for the JSON-RPC endpoint tests.
+    """
+
+    def test_rpc_batch(self):
+        """
+        Test the batched JSON-RPC endpoint.
+        """
+
+        client = app.test_client()
+
+        def call(data):
+            response = client.post('/api/rpc', data=json.dumps(data), headers=self.auth,
+                                   content_type='application/json')
+            return json.loads(response.data.decode('utf-8'))
+
+        commits = []
+
+        def count_commit(session):
+            commits.append(session)
+
+        event.listen(Session, 'after_commit', count_commit)
+        self.addCleanup(event.remove, Session, 'after_commit', count_commit)
+
+        # TEST CASE:
+        # cond:
+        #   - batch of many calls, one of them invalid
+        # post:
+        #   - one commit for the whole batch
+        #   - per call results, the invalid call reports an error
+
+        folder_id = call({'jsonrpc': '2.0', 'id': 0, 'method': 'folders.add', 'params': ['folder']})['result']
+        del commits[:]
+
+        batch = [{'jsonrpc': '2.0', 'id': i, 'method': 'bookmarks.add',
+                  'params': {'url': 'http://{0}'.format(i), 'folder_id': folder_id}} for i in range(1, 101)]
+        batch.append({'jsonrpc': '2.0', 'id': 101, 'method': 'bookmarks.get', 'params': [12345]})
+        results = call(batch)
+
+        assert len(commits) == 1
+        assert len(results) == 101
+        assert all('result' in r for r in results[:100])
+        assert results[100]['error']['code'] == -32001
+        assert models.Folder.query.get(folder_id).descendant_bookmarks().count() == 100
+
+        # TEST CASE:
+        # cond:
+        #   - call with an id of 0, notification without an id
+        # post:
+        #   - the call is answered with its id, the notification is not
+
+        result = call({'jsonrpc': '2.0', 'id': 0, 'method': 'folders.path', 'params': [folder_id]})
+        assert (result['id'], result['result']) == (0, ['folder'])
+        response = client.post('/api/rpc', data=json.dumps({'jsonrpc': '2.0', 'method': 'folders.add',
+                                                            'params': ['notified']}),
+                               headers=self.auth, content_type='application/json')
+        assert response.status_code == 204
+        assert models.Folder.query.filter_by(title='notified').count() == 1
+
+        # TEST CASE:
+        # cond:
+        #   - folder moved under its own child, then a bookmark added in the same batch
+        # post:
+        #   - the move is rejected before any change, the batch goes on and commits
+
+        child_id = call({'jsonrpc': '2.0', 'id': 1, 'method': 'folders.add', 'params': ['child', folder_id]})['result']
+        results = call([{'jsonrpc': '2.0', 'id': 1, 'method': 'folders.update',
+                         'params': {'id': folder_id, 'parent_id': child_id}},
+                        {'jsonrpc': '2.0', 'id': 2, 'method': 'bookmarks.add', 'params': ['http://after']}])
+        assert results[0]['error']['code'] == -32003
+        assert 'result' in results[1]
+        assert models.Bookmark.query.filter_by(url='http://after').count() == 1
+
+        # TEST CASE:
+        # cond:
+        #   - a value the database rejects
+        # post:
+        #   - the client gets fixed messages, not the statement
+        #   - the batch is rolled back
+
+        results = call([{'jsonrpc': '2.0', 'id': 1, 'method': 'bookmarks.add', 'params': ['http://rolled.back']},
+                        {'jsonrpc': '2.0', 'id': 2, 'method': 'folders.update',
+                         'params': {'id': folder_id, 'title': {'not': 'text'}}}])
+        assert results['error']['code'] == -32603
+        assert 'data' not in results['error']
+        assert models.Bookmark.query.filter_by(url='http://rolled.back').count() == 0
+
+        # TEST CASE:
+        # cond:
+        #   - no authorization
+        # post:
+        #   - request is rejected
+
+        response = client.post('/api/rpc', data=json.dumps(batch[0]), content_type='application/json')
+        assert response.status_code == 403
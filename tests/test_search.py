@@ -0,0 +1,52 @@
+from application.utils.search import BookmarkSearch
+from tests.base import BookmarkTestCase
+
+
+from application import db, models
+
+
+class SearchTests(BookmarkTestCase):
+    """
+    Class for the full text search tests.
+    """
+
+    def test_search(self):
+        """
+        Test the full text search index.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - bookmarks inserted, updated and deleted
+        # post:
+        #   - the index follows the table, prefixes match and the title ranks first
+
+        other_user = models.User('other', 'other')
+        db.session.add(other_user)
+        db.session.flush()
+
+        in_title = models.Bookmark('http://a.org', 'Python performance', self.user.id)
+        in_tags = models.Bookmark('http://b.org', 'Profiling', self.user.id, tags='python')
+        renamed = models.Bookmark('http://c.org', 'Python', self.user.id)
+        deleted = models.Bookmark('http://python.org', 'Python', self.user.id)
+        foreign = models.Bookmark('http://d.org', 'Python', other_user.id)
+        db.session.add_all([in_title, in_tags, renamed, deleted, foreign])
+        db.session.commit()
+
+        renamed.title = 'Cooking'
+        db.session.delete(deleted)
+        db.session.commit()
+
+        assert [b.id for b in BookmarkSearch.search(self.user.id, 'pyth')] == [in_title.id, in_tags.id]
+        assert [b.id for b in BookmarkSearch.search(self.user.id, 'python perf')] == [in_title.id]
+        assert [b.id for b in BookmarkSearch.search(self.user.id, 'cook', limit=1)] == [renamed.id]
+        assert BookmarkSearch.search(self.user.id, '" * (') == []
+
+        # TEST CASE:
+        # cond:
+        #   - index rebuilt
+        # post:
+        #   - same results
+
+        BookmarkSearch.rebuild()
+        assert [b.id for b in BookmarkSearch.search(self.user.id, 'pyth')] == [in_title.id, in_tags.id]
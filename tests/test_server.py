@@ -0,0 +1,120 @@
+import os
+import signal
+import socket
+import threading
+import time
+import unittest
+from urllib.request import urlopen, Request
+
+from application.server import PooledWSGIServer, PreforkServer
+from application.utils.initializers import init_db, init_app, init_login, init_admin
+from config import ActiveConfig, PathsConfig
+
+
+from application import db, app
+
+
+class ServerTests(unittest.TestCase):
+    """
+    Class for the production server tests.
+    """
+
+    def setUp(self):
+        """
+        Set the Test Unit up
+        """
+
+        ActiveConfig.TESTING = True
+        ActiveConfig.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(PathsConfig.BASE_DIR, 'test.sqlite')
+        app.config.from_object(ActiveConfig)
+        db.session.close()
+        db.drop_all()
+        init_db(db)
+
+        # routes can only be registered once, before the first request
+        if 'index' not in app.view_functions:
+            init_app(app)
+            init_login(app)
+            init_admin(app, db)
+
+    def test_pooled_server(self):
+        """
+        Test serving concurrent requests from the thread pool.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - server with two threads, several concurrent requests
+        # post:
+        #   - all requests are answered and the server stops gracefully
+
+        server = PooledWSGIServer('127.0.0.1', 0, app, 2)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+
+        # the routes match the configured SERVER_NAME
+        request = Request('http://127.0.0.1:{0}/metrics'.format(server.server_address[1]),
+                          headers={'Host': app.config['SERVER_NAME']})
+        statuses = []
+        clients = [threading.Thread(target=lambda: statuses.append(urlopen(request).getcode())) for _ in range(6)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+
+        server.stop()
+        thread.join(5)
+
+        assert statuses == [200] * 6
+        assert not thread.is_alive()
+
+        # TEST CASE:
+        # cond:
+        #   - server adopting a listening socket, as the prefork workers do
+        # post:
+        #   - requests to the socket are answered
+
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(8)
+
+        server = PooledWSGIServer('127.0.0.1', listener.getsockname()[1], app, 2, fd=listener.fileno())
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+
+        request = Request('http://127.0.0.1:{0}/metrics'.format(listener.getsockname()[1]),
+                          headers={'Host': app.config['SERVER_NAME']})
+        assert urlopen(request).getcode() == 200
+
+        server.stop()
+        thread.join(5)
+        listener.close()
+        assert not thread.is_alive()
+
+    def test_prefork_shutdown(self):
+        """
+        Test stopping the prefork server while workers of a restart are retiring.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - a worker replaced by a restart is still finishing its requests when the server stops
+        # post:
+        #   - it is signalled and reaped with the other workers
+
+        pid = os.fork()
+        if not pid:
+            signal.signal(signal.SIGTERM, lambda *args: os._exit(0))
+            time.sleep(30)
+            os._exit(1)
+
+        server = PreforkServer(app, '127.0.0.1', 0, 1, 1, graceful_timeout=5)
+        server.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.retiring[pid] = time.time() + 5
+        server._stopping = True
+        start = time.time()
+        server._shutdown()
+
+        assert time.time() - start < 5
+        assert server.retiring == {}
+        self.assertRaises(ProcessLookupError, os.kill, pid, 0)
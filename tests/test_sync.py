@@ -0,0 +1,178 @@
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from application.utils.sync import ChangeFeed, ExpiredSyncToken, InvalidSyncToken
+from application.utils.tree import tree_cache
+from tests.base import BookmarkTestCase
+
+
+from application import db, models
+
+
+class SyncTests(BookmarkTestCase):
+    """
+    Class for the change log, delta sync and tree snapshot tests.
+    """
+
+    def sync(self, token=None, limit=None):
+        seq = ChangeFeed.read_token(self.user.id, token)
+        return json.loads(''.join(ChangeFeed.stream(self.user.id, seq, limit)))
+
+    def test_sync(self):
+        """
+        Test the change log and the delta sync feed.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - folder and bookmarks written, no token
+        # post:
+        #   - every write is logged and returned in pages
+
+        folder = models.Folder('folder', self.user.id)
+        first = models.Bookmark('http://a', 'a', folder=folder)
+        second = models.Bookmark('http://b', 'b', folder=folder)
+        db.session.add_all([folder, first, second])
+        db.session.commit()
+
+        page = self.sync(limit=2)
+        assert page['more']
+        assert [(c['entity'], c['op']) for c in page['changes']] == [('folder', 'insert'), ('bookmark', 'insert')]
+        assert page['changes'][1]['data']['url'] == 'http://a'
+
+        page = self.sync(page['token'])
+        assert not page['more']
+        assert [c['id'] for c in page['changes']] == [second.id]
+
+        # TEST CASE:
+        # cond:
+        #   - update and delete after the last token
+        # post:
+        #   - only the new changes are returned, deleted entities have no data
+
+        token = page['token']
+        first.title = 'renamed'
+        db.session.delete(second)
+        db.session.commit()
+
+        page = self.sync(token)
+        assert [(c['id'], c['op'], c['data'] and c['data']['title']) for c in page['changes']] == [
+            (first.id, 'update', 'renamed'), (second.id, 'delete', None)]
+        assert self.sync(page['token'])['changes'] == []
+
+        # TEST CASE:
+        # cond:
+        #   - log compacted
+        # post:
+        #   - one entry per entity is left and the old token is still valid
+
+        assert models.Change.compact(self.user.id) == 2
+        db.session.commit()
+        assert len(self.sync()['changes']) == 3
+        assert [c['id'] for c in self.sync(token)['changes']] == [first.id, second.id]
+
+        # TEST CASE:
+        # cond:
+        #   - delete entries truncated
+        # post:
+        #   - tokens older than the truncated entries expire, invalid tokens are rejected
+
+        assert models.Change.truncate(self.user.id, datetime.utcnow() + timedelta(days=1)) == 1
+        db.session.commit()
+        self.assertRaises(ExpiredSyncToken, self.sync, token)
+        self.assertRaises(InvalidSyncToken, self.sync, 'invalid')
+        assert len(self.sync()['changes']) == 2
+
+    def test_tree_snapshot(self):
+        """
+        Test the tree snapshots and the full sync served from them.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - nested folders and bookmarks
+        # post:
+        #   - children, subtrees and paths are read from the snapshot
+        #   - the snapshot is shared until the next write
+
+        top = models.Folder('top', self.user.id, position=1)
+        second = models.Folder('second', self.user.id, position=0)
+        inner = models.Folder('inner', parent=top)
+        outside = models.Bookmark('http://outside', 'Outside', self.user.id)
+        in_top = models.Bookmark('http://top', 'Top', folder=top)
+        in_inner = models.Bookmark('http://inner', 'Inner', folder=inner, tags='x')
+        db.session.add_all([top, second, inner, outside, in_top, in_inner])
+        db.session.commit()
+
+        snapshot = tree_cache.get(self.user.id)
+        assert (snapshot.folder_count, snapshot.bookmark_count) == (3, 3)
+        assert snapshot.nbytes > 0
+
+        folders, bookmarks = snapshot.children()
+        assert [f['id'] for f in folders] == [second.id, top.id]
+        assert bookmarks == [outside.to_dict()]
+
+        folders, bookmarks = snapshot.subtree(top.id)
+        assert folders == [inner.to_dict()]
+        assert [b['id'] for b in bookmarks] == [in_top.id, in_inner.id]
+        assert bookmarks[1] == in_inner.to_dict()
+        assert snapshot.path(inner.id) == ['top', 'inner']
+        self.assertRaises(KeyError, snapshot.path, inner.id + 100)
+
+        assert tree_cache.get(self.user.id) is snapshot
+        second.title = 'renamed'
+        db.session.commit()
+        assert tree_cache.get(self.user.id) is not snapshot
+        assert tree_cache.get(self.user.id).path(second.id) == ['renamed']
+
+        # TEST CASE:
+        # cond:
+        #   - full sync from the snapshot, then a write
+        # post:
+        #   - every node is sent once, parents first
+        #   - the delta sync continues from its token
+
+        page = json.loads(''.join(ChangeFeed.stream_snapshot(self.user.id)))
+        assert not page['more']
+        sent = set()
+        for change in page['changes']:
+            parent_id = change['data']['parent_id' if change['entity'] == 'folder' else 'folder_id']
+            assert parent_id is None or parent_id in sent
+            sent.add(change['id'] if change['entity'] == 'folder' else None)
+        assert len(page['changes']) == 6
+        assert sorted(c['id'] for c in page['changes'] if c['entity'] == 'bookmark') == sorted(
+            [outside.id, in_top.id, in_inner.id])
+        assert self.sync(page['token'])['changes'] == []
+
+        in_top.title = 'changed'
+        db.session.commit()
+        assert [c['id'] for c in self.sync(page['token'])['changes']] == [in_top.id]
+
+        # TEST CASE:
+        # cond:
+        #   - a folder and its bookmark are committed between the reads of the folders and of the bookmarks
+        # post:
+        #   - the snapshot is read again and holds both
+
+        def write_between(conn, cursor, statement, parameters, context, executemany):
+            if 'FROM bookmarks' in statement and 'bookmarks.icon' in statement and not written:
+                written.append(True)
+                other = Session(bind=db.engine)
+                late = models.Folder('late', self.user.id)
+                other.add_all([late, models.Bookmark('http://late', 'Late', folder=late)])
+                other.commit()
+                other.close()
+
+        written = []
+        tree_cache.clear()
+        event.listen(db.engine, 'before_cursor_execute', write_between)
+        try:
+            snapshot = tree_cache.get(self.user.id)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', write_between)
+        assert written
+        assert (snapshot.folder_count, snapshot.bookmark_count) == (4, 4)
+        assert snapshot.version == models.Change.data_version(self.user.id)
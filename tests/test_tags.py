@@ -0,0 +1,56 @@
+from application.utils.tags import tag_index, InvalidTagQuery
+from tests.base import BookmarkTestCase
+
+
+from application import db, models
+
+
+class TagTests(BookmarkTestCase):
+    """
+    Class for the tag and tag index tests.
+    """
+
+    def test_tags(self):
+        """
+        Test the tags and the tag index.
+        """
+
+        # TEST CASE:
+        # cond:
+        #   - bookmarks saved with comma separated tags
+        # post:
+        #   - tags are created once per user, lower cased
+        #   - tag queries combine them with AND, OR and NOT
+
+        bookmarks = [models.Bookmark('http://a', 'A', self.user.id, tags='Python, perf'),
+                     models.Bookmark('http://b', 'B', self.user.id, tags='python,perf,archived'),
+                     models.Bookmark('http://c', 'C', self.user.id, tags='python'),
+                     models.Bookmark('http://d', 'D', self.user.id)]
+        db.session.add_all(bookmarks)
+        db.session.commit()
+        a, b, c, d = [bookmark.id for bookmark in bookmarks]
+
+        assert sorted(tag.name for tag in models.Tag.query) == ['archived', 'perf', 'python']
+        assert tag_index.select(self.user.id, 'python AND perf AND NOT archived') == [a]
+        assert tag_index.select(self.user.id, 'archived OR NOT python') == [b, d]
+        assert tag_index.select(self.user.id, 'python -') == []
+        assert tag_index.counts(self.user.id) == {'python': 3, 'perf': 2, 'archived': 1}
+        self.assertRaises(InvalidTagQuery, tag_index.select, self.user.id, 'python AND (perf')
+
+        # TEST CASE:
+        # cond:
+        #   - tags changed, a bookmark deleted
+        # post:
+        #   - the index is patched from the change log and reports its size
+
+        bookmarks[0].tags = 'archived'
+        bookmarks[3].tags = 'Perf'
+        db.session.delete(bookmarks[1])
+        db.session.commit()
+
+        assert tag_index.select(self.user.id, 'perf OR archived') == [a, d]
+        assert tag_index.select(self.user.id, 'NOT archived') == [c, d]
+        assert db.session.query(models.bookmark_tags).count() == 3
+
+        stats = dict((user_id, (tags, nbytes)) for user_id, tags, nbytes in tag_index.stats())
+        assert stats[self.user.id][0] == 3 and stats[self.user.id][1] > 0